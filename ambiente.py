@@ -0,0 +1,293 @@
+"""Il solitario come ambiente per allenare giocatori automatici, nello stile di Gym.
+
+Ambiente gioca una partita alla volta: reset(seed) la comincia, step(azione) esegue una delle
+NUM_AZIONI azioni di solitario.AZIONI e restituisce (osservazione, premio, terminata, troncata,
+info). Ogni osservazione è un vettore di DIM_OSSERVAZIONE interi: le colonne (le carte coperte
+valgono COPERTA, le caselle libere VUOTA), le pile finali, la cima degli scarti, quante carte ci
+sono negli scarti e nella riserva e quante volte è stato rigirato il mazzo. info["maschera"]
+indica le azioni legali.
+
+AmbientiParalleli gioca molte partite insieme in processi separati, ognuno con un motore a lotti
+(vettoriale.py): osservazioni, maschere, premi e azioni stanno in memoria condivisa e a ogni passo
+i processi ricevono e mandano un solo byte, senza serializzare nulla.
+
+Esempio:
+    python ambiente.py --ambienti 4096 --processi 4 --passi 500    # passi al secondo con azioni a caso
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from solitario import (Motore, AZIONI, NUM_AZIONI, INDICE_AZIONE, RICICLO_MESCOLATO, SEME_MAX, ERR_MOSSA,
+                       riuscita)
+from vettoriale import MotoreVettoriale, VUOTA, ALTEZZA_MAX, azioni_casuali
+
+COPERTA = VUOTA + 1         # carta coperta nelle colonne dell'osservazione
+
+# Posizioni nel vettore dell'osservazione
+OSS_COLONNE = 0             # 7 * ALTEZZA_MAX carte, colonna per colonna
+OSS_FONDAZIONI = 7 * ALTEZZA_MAX
+OSS_SCARTO = OSS_FONDAZIONI + 4
+OSS_N_SCARTI = OSS_SCARTO + 1
+OSS_N_RISERVA = OSS_SCARTO + 2
+OSS_RICICLI = OSS_SCARTO + 3
+DIM_OSSERVAZIONE = OSS_RICICLI + 1
+
+PASSI_MAX = 1000            # oltre, la partita viene troncata (rigirando il mazzo non finirebbe mai)
+PREMIO_VITTORIA = 100.0
+PREMIO_ILLEGALE = -1.0
+
+
+def osservazione(motore, uscita=None):
+    """Vettore dell'osservazione di una partita (Motore)"""
+    if uscita is None:
+        uscita = np.empty(DIM_OSSERVAZIONE, dtype=np.uint8)
+    colonne = uscita[OSS_COLONNE:OSS_FONDAZIONI].reshape(7, ALTEZZA_MAX)
+    colonne[:] = VUOTA
+    for i, col in enumerate(motore.colonne):
+        colonne[i, :len(col)] = col
+        colonne[i, :motore.coperte[i]] = COPERTA
+    uscita[OSS_FONDAZIONI:OSS_SCARTO] = motore.fondazioni
+    uscita[OSS_SCARTO] = motore.scarti[-1] if motore.scarti else VUOTA
+    uscita[OSS_N_SCARTI] = len(motore.scarti)
+    uscita[OSS_N_RISERVA] = len(motore.riserva)
+    uscita[OSS_RICICLI] = min(motore.ricicli, 255)
+    return uscita
+
+
+def osservazioni(vettoriale, uscita=None):
+    """Matrice (N, DIM_OSSERVAZIONE) delle osservazioni di tutte le partite di un MotoreVettoriale"""
+    if uscita is None:
+        uscita = np.empty((vettoriale.n, DIM_OSSERVAZIONE), dtype=np.uint8)
+    coperte = np.arange(ALTEZZA_MAX) < vettoriale.coperte[:, :, None]
+    uscita[:, OSS_COLONNE:OSS_FONDAZIONI] = np.where(coperte, COPERTA, vettoriale.colonne).reshape(vettoriale.n, -1)
+    uscita[:, OSS_FONDAZIONI:OSS_SCARTO] = vettoriale.fondazioni
+    cima = vettoriale.scarti[vettoriale._partite, np.maximum(vettoriale.n_scarti - 1, 0)]
+    uscita[:, OSS_SCARTO] = np.where(vettoriale.n_scarti > 0, cima, VUOTA)
+    uscita[:, OSS_N_SCARTI] = vettoriale.n_scarti
+    uscita[:, OSS_N_RISERVA] = vettoriale.n_riserva
+    uscita[:, OSS_RICICLI] = np.minimum(vettoriale.ricicli, 255)
+    return uscita
+
+
+def maschera_azioni(motore):
+    """Vettore di bool: le azioni legali di una partita (Motore)"""
+    maschera = np.zeros(NUM_AZIONI, dtype=bool)
+    maschera[[INDICE_AZIONE[m] for m in motore.mosse_legali()]] = True
+    return maschera
+
+
+class Ambiente:
+    """Una partita alla volta, con l'interfaccia reset/step di Gym.
+
+    Il premio è la variazione del punteggio, più premio_vittoria quando la partita è vinta;
+    un'azione illegale vale premio_illegale e non cambia la posizione. La partita termina
+    quando è vinta o non ci sono più mosse legali, e viene troncata dopo passi_max azioni.
+    """
+    num_azioni = NUM_AZIONI
+    forma_osservazione = (DIM_OSSERVAZIONE,)
+
+    def __init__(self, passi_max=PASSI_MAX, riciclo=RICICLO_MESCOLATO,
+                 premio_vittoria=PREMIO_VITTORIA, premio_illegale=PREMIO_ILLEGALE):
+        self.passi_max = passi_max
+        self.riciclo = riciclo
+        self.premio_vittoria = premio_vittoria
+        self.premio_illegale = premio_illegale
+        self.motore = None
+        self.passi = 0
+        self._rng = np.random.default_rng()
+
+    def _info(self):
+        return {"maschera": maschera_azioni(self.motore), "seme": self.motore.seme}
+
+    def reset(self, seed=None):
+        """Comincia una nuova partita; con seed è la partita con quel numero"""
+        if seed is None:
+            seed = int(self._rng.integers(SEME_MAX))
+        self.motore = Motore(seme=seed, riciclo=self.riciclo)
+        self.passi = 0
+        return osservazione(self.motore), self._info()
+
+    def step(self, azione):
+        motore = self.motore
+        punteggio = motore.punteggio
+        if 0 <= azione < NUM_AZIONI:
+            esito = motore.applica(AZIONI[azione])
+        else:
+            esito = None
+        self.passi += 1
+        info = self._info()
+        info["esito"] = esito
+        vinta = motore.controlla_vittoria()
+        if esito is None or not riuscita(esito):
+            premio = self.premio_illegale
+        else:
+            premio = motore.punteggio - punteggio + (self.premio_vittoria if vinta else 0.0)
+        terminata = vinta or not info["maschera"].any()
+        troncata = not terminata and self.passi >= self.passi_max
+        return osservazione(motore), premio, terminata, troncata, info
+
+
+def _viste(buffer, n):
+    """Le matrici condivise di AmbientiParalleli, disposte una dopo l'altra nel buffer"""
+    forme = [("osservazioni", (n, DIM_OSSERVAZIONE), np.uint8), ("maschere", (n, NUM_AZIONI), np.bool_),
+             ("premi", (n,), np.float32), ("terminate", (n,), np.bool_), ("troncate", (n,), np.bool_),
+             ("semi", (n,), np.int64), ("azioni", (n,), np.int16)]
+    viste = {}
+    posto = 0
+    for nome, forma, tipo in forme:
+        posto = -(-posto // 8) * 8      # ogni matrice allineata a 8 byte
+        vista = np.ndarray(forma, dtype=tipo, buffer=buffer, offset=posto) if buffer is not None else None
+        viste[nome] = vista
+        posto += int(np.prod(forma)) * np.dtype(tipo).itemsize
+    return viste, posto
+
+
+def _lavoratore(canale, nome, n, inizio, fine, passi_max, riciclo, premio_vittoria, premio_illegale):
+    """Processo che gioca le partite inizio..fine-1 sulle matrici condivise"""
+    memoria = shared_memory.SharedMemory(name=nome)
+    viste, _ = _viste(memoria.buf, n)
+    oss, maschere, premi, terminate, troncate, semi, azioni = (
+        viste[k][inizio:fine] for k in ("osservazioni", "maschere", "premi", "terminate", "troncate", "semi", "azioni"))
+    motore = None
+    rng = None
+    passi = np.zeros(fine - inizio, dtype=np.int32)
+    try:
+        while True:
+            comando = canale.recv_bytes()
+            if comando[:1] == b"r":
+                rng = np.random.default_rng([int.from_bytes(comando[1:], "little"), inizio])
+                semi[:] = rng.integers(0, SEME_MAX, fine - inizio)
+                motore = MotoreVettoriale(semi, riciclo=riciclo)
+                passi[:] = 0
+                terminate[:] = False
+                troncate[:] = False
+                premi[:] = 0
+                maschere[:] = motore.maschera_legali()
+            elif comando == b"s":
+                punteggio = motore.punteggio.copy()
+                esiti = motore.applica(azioni, maschere)
+                vinte = motore.vittorie()
+                premi[:] = motore.punteggio - punteggio + premio_vittoria * vinte
+                premi[esiti == ERR_MOSSA] = premio_illegale
+                passi += 1
+                maschere[:] = motore.maschera_legali()
+                terminate[:] = vinte | ~maschere.any(axis=1)
+                troncate[:] = ~terminate & (passi >= passi_max)
+                # Le partite finite ricominciano subito con un nuovo numero
+                finite = np.flatnonzero(terminate | troncate)
+                if len(finite):
+                    semi[finite] = rng.integers(0, SEME_MAX, len(finite))
+                    motore.distribuisci(finite, semi[finite])
+                    passi[finite] = 0
+                    maschere[:] = motore.maschera_legali()
+            else:
+                break
+            osservazioni(motore, oss)
+            canale.send_bytes(b"k")
+    finally:
+        del oss, maschere, premi, terminate, troncate, semi, azioni, viste
+        memoria.close()
+
+
+class AmbientiParalleli:
+    """n partite giocate insieme da `processi` processi, con osservazioni in memoria condivisa.
+
+    step(azioni) restituisce (osservazioni, premi, terminate, troncate, info) come matrici con una
+    riga per partita; una partita terminata o troncata ricomincia subito con un nuovo numero, e la
+    sua riga contiene già la prima osservazione della partita nuova. Le matrici restituite sono viste
+    sulla memoria condivisa e vengono sovrascritte al passo successivo: copiarle se servono dopo.
+    """
+
+    def __init__(self, n, processi=None, passi_max=PASSI_MAX, riciclo=RICICLO_MESCOLATO,
+                 premio_vittoria=PREMIO_VITTORIA, premio_illegale=PREMIO_ILLEGALE):
+        self.n = n
+        processi = max(1, min(n, processi or os.cpu_count() or 1))
+        _, dimensione = _viste(None, n)
+        self._memoria = shared_memory.SharedMemory(create=True, size=dimensione)
+        self._viste, _ = _viste(self._memoria.buf, n)
+        contesto = multiprocessing.get_context()
+        self._canali = []
+        self._processi = []
+        confini = np.linspace(0, n, processi + 1).astype(int)
+        for inizio, fine in zip(confini[:-1], confini[1:]):
+            nostro, loro = contesto.Pipe()
+            processo = contesto.Process(target=_lavoratore, daemon=True, args=(
+                loro, self._memoria.name, n, int(inizio), int(fine), passi_max, riciclo,
+                premio_vittoria, premio_illegale))
+            processo.start()
+            loro.close()
+            self._canali.append(nostro)
+            self._processi.append(processo)
+
+    def _comanda(self, comando):
+        for canale in self._canali:
+            canale.send_bytes(comando)
+        for canale in self._canali:
+            canale.recv_bytes()
+
+    def _info(self):
+        return {"maschere": self._viste["maschere"], "semi": self._viste["semi"]}
+
+    def reset(self, seed=None):
+        """Ricomincia tutte le partite; con seed i numeri delle partite sono sempre gli stessi"""
+        if seed is None:
+            seed = int.from_bytes(os.urandom(4), "little")
+        self._comanda(b"r" + int(seed).to_bytes(8, "little"))
+        return self._viste["osservazioni"], self._info()
+
+    def step(self, azioni):
+        self._viste["azioni"][:] = azioni
+        self._comanda(b"s")
+        v = self._viste
+        return v["osservazioni"], v["premi"], v["terminate"], v["troncate"], self._info()
+
+    def chiudi(self):
+        if self._memoria is None:
+            return
+        for canale in self._canali:
+            try:
+                canale.send_bytes(b"q")
+            except (BrokenPipeError, OSError):
+                pass
+        for processo in self._processi:
+            processo.join(timeout=5)
+        self._viste = None
+        self._memoria.close()
+        self._memoria.unlink()
+        self._memoria = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *eccezione):
+        self.chiudi()
+
+
+def main(argomenti=None):
+    parser = argparse.ArgumentParser(description="Velocità degli ambienti paralleli con azioni a caso")
+    parser.add_argument("--ambienti", type=int, default=4096)
+    parser.add_argument("--processi", type=int, default=None)
+    parser.add_argument("--passi", type=int, default=300)
+    parser.add_argument("--seme", type=int, default=0)
+    args = parser.parse_args(argomenti)
+
+    rng = np.random.default_rng(args.seme)
+    with AmbientiParalleli(args.ambienti, args.processi) as ambienti:
+        _, info = ambienti.reset(args.seme)
+        finite = 0
+        inizio = time.perf_counter()
+        for _ in range(args.passi):
+            _, _, terminate, troncate, info = ambienti.step(azioni_casuali(info["maschere"], rng))
+            finite += int(np.count_nonzero(terminate | troncate))
+        durata = time.perf_counter() - inizio
+    print(f"{args.ambienti * args.passi / durata:,.0f} passi/s, {finite} partite finite")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
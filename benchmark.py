@@ -0,0 +1,402 @@
+"""Benchmark dei percorsi critici del solitario: motore, consigli, disegno e salvataggi.
+
+Gira senza terminale su partite numerate (quindi sempre uguali) e scrive i risultati
+in JSON. Con --confronta legge un file di risultati precedente e segnala le metriche
+peggiorate oltre la soglia; in quel caso esce con codice 1.
+
+Esempi:
+    python benchmark.py                          # tutte le misure, risultati in benchmark.json
+    python benchmark.py --rapido --uscita nuovo.json --confronta benchmark.json
+    python benchmark.py --soak 500                # prova di durata del menu principale
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import solitario
+from solitario import Motore, Solitario, Schermo, RIGHE_COMANDI, riuscita
+
+# Fasi della partita in cui misurare i consigli: mosse giocate prima della misura
+FASI = {"inizio": 0, "meta": 40, "fine": 100}
+
+
+class UscitaNulla:
+    """Terminale finto che scarta tutto quello che riceve (conta solo i byte)"""
+
+    def __init__(self):
+        self.byte = 0
+
+    def write(self, testo):
+        self.byte += len(testo)
+
+    def flush(self):
+        pass
+
+
+def metrica(valore, unita, meglio):
+    """meglio: 'alto' per le velocità, 'basso' per i tempi e le dimensioni"""
+    return {"valore": round(valore, 6), "unita": unita, "meglio": meglio}
+
+
+def percentile(valori, p):
+    valori = sorted(valori)
+    return valori[min(len(valori) - 1, int(p * len(valori)))]
+
+
+def gioca_avido(motore, mosse):
+    """Avanza la partita di al massimo `mosse` mosse seguendo il consigliatore avido"""
+    for _ in range(mosse):
+        mossa = motore.mossa_consigliata()
+        if mossa is None or motore.controlla_vittoria():
+            break
+        motore.applica(mossa)
+
+
+def misura_mosse(semi, mosse_per_partita):
+    """Mosse casuali applicate al secondo, e coppie annulla/ripeti al secondo"""
+    rng = random.Random(0)
+    applicate = 0
+    tempo_mosse = 0.0
+    annullate = 0
+    tempo_annulla = 0.0
+    for seme in semi:
+        motore = Motore(seme=seme)
+        inizio = time.perf_counter()
+        for _ in range(mosse_per_partita):
+            mosse = sorted(motore.mosse_legali())
+            if not mosse:
+                break
+            if riuscita(motore.applica(rng.choice(mosse))):
+                applicate += 1
+        tempo_mosse += time.perf_counter() - inizio
+
+        inizio = time.perf_counter()
+        while motore.annulla() == solitario.OK:
+            annullate += 1
+        while motore.ripeti() == solitario.OK:
+            pass
+        tempo_annulla += time.perf_counter() - inizio
+    return {
+        "mosse_al_secondo": metrica(applicate / tempo_mosse, "mosse/s", "alto"),
+        "annulla_ripeti_al_secondo": metrica(annullate / tempo_annulla, "coppie/s", "alto"),
+    }
+
+
+def misura_istantanee(semi, mosse_per_partita):
+    """Tempo per fare un'istantanea della partita e per ricavarne un motore giocabile"""
+    rng = random.Random(0)
+    istantanee = []
+    tempo_istantanee = 0.0
+    for seme in semi:
+        motore = Motore(seme=seme)
+        for _ in range(mosse_per_partita):
+            mosse = sorted(motore.mosse_legali())
+            if not mosse:
+                break
+            motore.applica(rng.choice(mosse))
+            inizio = time.perf_counter()
+            istantanee.append(motore.istantanea())
+            tempo_istantanee += time.perf_counter() - inizio
+    inizio = time.perf_counter()
+    for istantanea in istantanee:
+        Motore.da_istantanea(istantanea)
+    tempo_ripristino = time.perf_counter() - inizio
+    return {
+        "istantanea": metrica(tempo_istantanee / len(istantanee) * 1e6, "us", "basso"),
+        "da_istantanea": metrica(tempo_ripristino / len(istantanee) * 1e6, "us", "basso"),
+    }
+
+
+def misura_consigli(semi):
+    """Latenza di consiglia_mossa() all'inizio, a metà e verso la fine della partita,
+    e di un consiglio ripetuto sulla stessa posizione"""
+    risultati = {}
+    ripetuti = []
+    for fase, mosse in FASI.items():
+        tempi = []
+        for seme in semi:
+            gioco = Solitario(seme=seme)
+            gioca_avido(gioco, mosse)
+            # Ogni misura parte con tabella e cache vuote, come al primo consiglio
+            solitario.RISOLUTORE_CONSIGLI.tabella.clear()
+            solitario.CACHE_CONSIGLI.svuota()
+            inizio = time.perf_counter()
+            gioco.consiglia_mossa()
+            tempi.append(time.perf_counter() - inizio)
+            # Lo stesso consiglio chiesto di nuovo arriva dalla cache
+            inizio = time.perf_counter()
+            gioco.consiglia_mossa()
+            ripetuti.append(time.perf_counter() - inizio)
+        risultati[f"consiglio_{fase}_mediana"] = metrica(statistics.median(tempi) * 1000, "ms", "basso")
+        risultati[f"consiglio_{fase}_p95"] = metrica(percentile(tempi, 0.95) * 1000, "ms", "basso")
+    risultati["consiglio_ripetuto_mediana"] = metrica(statistics.median(ripetuti) * 1000, "ms", "basso")
+    return risultati
+
+
+def misura_stallo(semi, mosse_per_partita):
+    """Latenza del rilevatore di stallo dopo ogni mossa di una partita giocata a caso"""
+    rng = random.Random(0)
+    tempi = []
+    for seme in semi:
+        rilevatore = solitario.RilevatoreStallo()
+        motore = Motore(seme=seme)
+        for _ in range(mosse_per_partita):
+            inizio = time.perf_counter()
+            rilevatore.valuta(motore)
+            tempi.append(time.perf_counter() - inizio)
+            mosse = sorted(motore.mosse_legali())
+            if not mosse:
+                break
+            motore.applica(rng.choice(mosse))
+    return {
+        "stallo_mediana": metrica(statistics.median(tempi) * 1000, "ms", "basso"),
+        "stallo_p95": metrica(percentile(tempi, 0.95) * 1000, "ms", "basso"),
+    }
+
+
+def misura_vettoriale(partite, passi):
+    """Passi al secondo del motore a lotti (somma su tutte le partite); vuoto senza NumPy"""
+    try:
+        import vettoriale
+    except ImportError:
+        return {}
+    return {"passi_vettoriali_al_secondo": metrica(vettoriale.velocita(partite, passi), "passi/s", "alto")}
+
+
+def misura_disegno(semi, fotogrammi):
+    """Tempo per comporre e disegnare un fotogramma, completo e solo con le differenze"""
+    uscita = UscitaNulla()
+    schermo = Schermo(uscita, altezza=60)    # senza terminale il ridisegno sarebbe sempre completo
+    tempo_completo = 0.0
+    tempo_differenze = 0.0
+    byte_completo = 0
+    byte_differenze = 0
+    n = 0
+    for seme in semi:
+        gioco = Solitario(seme=seme)
+        for _ in range(fotogrammi):
+            schermo.invalida()
+            prima = uscita.byte
+            inizio = time.perf_counter()
+            schermo.disegna(gioco.righe_schermo() + RIGHE_COMANDI)
+            tempo_completo += time.perf_counter() - inizio
+            byte_completo += uscita.byte - prima
+
+            mossa = gioco.mossa_consigliata()
+            if mossa is None:
+                break
+            gioco.applica(mossa)
+            prima = uscita.byte
+            inizio = time.perf_counter()
+            schermo.disegna(gioco.righe_schermo() + RIGHE_COMANDI)
+            tempo_differenze += time.perf_counter() - inizio
+            byte_differenze += uscita.byte - prima
+            n += 1
+    return {
+        "fotogramma_completo": metrica(tempo_completo / n * 1e6, "us", "basso"),
+        "fotogramma_differenze": metrica(tempo_differenze / n * 1e6, "us", "basso"),
+        "byte_fotogramma_completo": metrica(byte_completo / n, "byte", "basso"),
+        "byte_fotogramma_differenze": metrica(byte_differenze / n, "byte", "basso"),
+    }
+
+
+def verifica_diario_dopo_crash(gioco, nome):
+    """Simula un crash tra la scrittura del .sol e l'azzeramento del suo diario: le mosse
+    giocate dopo il caricamento devono finire in un diario valido e non andare perse"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        gioco = Solitario.carica_partita(nome)
+        gioca_avido(gioco, 2)
+        gioco.chiudi_diario()
+        # Nuova istantanea scritta, diario vecchio rimasto (non corrisponde più)
+        solitario.scrivi_atomico(nome, gioco.in_bytes())
+        gioco = Solitario.carica_partita(nome)
+        gioca_avido(gioco, 5)
+        gioco.chiudi_diario()
+        ricaricato = Solitario.carica_partita(nome)
+    ricaricato.chiudi_diario()
+    assert (ricaricato.mosse, ricaricato.colonne) == (gioco.mosse, gioco.colonne), \
+        f"mosse perse dal diario di {nome} dopo un crash durante il salvataggio"
+
+
+def misura_salvataggi(semi):
+    """Tempo di salvataggio + caricamento e dimensione dei file, per ogni formato"""
+    risultati = {}
+    with tempfile.TemporaryDirectory() as cartella:
+        for estensione in (".sol", ".json"):
+            tempi = []
+            dimensioni = []
+            for seme in semi:
+                gioco = Solitario(seme=seme)
+                gioca_avido(gioco, FASI["meta"])
+                nome = os.path.join(cartella, f"partita_{seme}{estensione}")
+                with contextlib.redirect_stdout(io.StringIO()):
+                    inizio = time.perf_counter()
+                    gioco.salva_partita(nome)
+                    caricato = Solitario.carica_partita(nome)
+                    tempi.append(time.perf_counter() - inizio)
+                gioco.chiudi_diario()
+                caricato.chiudi_diario()
+                assert caricato.colonne == gioco.colonne, f"salvataggio {nome} non fedele"
+                if estensione == ".sol":
+                    verifica_diario_dopo_crash(gioco, nome)
+                dimensioni.append(os.path.getsize(nome))
+            formato = estensione[1:]
+            risultati[f"salva_carica_{formato}"] = metrica(statistics.median(tempi) * 1000, "ms", "basso")
+            risultati[f"byte_{formato}"] = metrica(statistics.mean(dimensioni), "byte", "basso")
+    return risultati
+
+
+# Un giro della prova di durata: partita da numero, qualche comando, ritorno al menu
+GIRO_SOAK = ["7", "#123", "", "1", "1", "2 1 5", "0", "a", "r", "9", ""]
+
+
+def soak(giri, tolleranza_kb=256):
+    """Prova di durata del programma interattivo: ripete `giri` volte menu -> partita ->
+    menu con un input finto e controlla che memoria, profondità dello stack e thread
+    restino stabili. Restituisce le misure e l'elenco dei problemi trovati."""
+    import builtins
+    import gc
+    import threading
+    import tracemalloc
+    import traceback
+
+    campioni = []       # (giro, memoria in KB, profondità dello stack, thread attivi)
+    controlli = max(1, giri // 10)
+
+    def comandi():
+        for giro in range(giri):
+            for comando in GIRO_SOAK:
+                if comando == "7" and giro % controlli == 0:
+                    gc.collect()
+                    memoria = tracemalloc.get_traced_memory()[0] / 1024
+                    campioni.append((giro, memoria, len(traceback.extract_stack()),
+                                     threading.active_count()))
+                yield comando
+        yield "9"
+
+    sorgente = comandi()
+    input_originale = builtins.input
+    system_originale = os.system
+    tutorial_originale = solitario.tutorial_gia_visto
+    builtins.input = lambda messaggio="": next(sorgente)
+    stdin_originale = sys.stdin
+    sys.stdin = io.StringIO()      # non un terminale: i comandi passano da input()
+    os.system = lambda comando: 0
+    solitario.tutorial_gia_visto = lambda: True
+    tracemalloc.start()
+    inizio = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(UscitaNulla()):
+            solitario.main()
+    finally:
+        durata = time.perf_counter() - inizio
+        tracemalloc.stop()
+        builtins.input = input_originale
+        sys.stdin = stdin_originale
+        os.system = system_originale
+        solitario.tutorial_gia_visto = tutorial_originale
+
+    problemi = []
+    # Il primo giro riempie cache e tabelle: il confronto parte dal secondo campione
+    base = campioni[1] if len(campioni) > 1 else campioni[0]
+    fine = campioni[-1]
+    if fine[1] - base[1] > tolleranza_kb:
+        problemi.append(f"memoria cresciuta di {fine[1] - base[1]:.0f} KB tra il giro {base[0]} e il giro {fine[0]}")
+    if len({c[2] for c in campioni}) > 1:
+        problemi.append("la profondità dello stack cambia tra un giro e l'altro")
+    if fine[3] > base[3]:
+        problemi.append(f"thread attivi passati da {base[3]} a {fine[3]}")
+    return {"giri": giri, "durata_s": round(durata, 2), "campioni": campioni}, problemi
+
+
+def esegui(rapido=False, seme=1):
+    partite = 5 if rapido else 30
+    semi = list(range(seme, seme + partite))
+    risultati = {}
+    risultati.update(misura_mosse(semi, 200 if rapido else 1000))
+    risultati.update(misura_istantanee(semi, 200 if rapido else 1000))
+    risultati.update(misura_consigli(semi))
+    risultati.update(misura_stallo(semi, 50 if rapido else 200))
+    risultati.update(misura_vettoriale(256 if rapido else 4096, 100 if rapido else 300))
+    risultati.update(misura_disegno(semi, 20 if rapido else 60))
+    risultati.update(misura_salvataggi(semi))
+    return {
+        "data": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "macchina": platform.machine(),
+        "partite": partite,
+        "metriche": risultati,
+    }
+
+
+def confronta(risultati, base, soglia):
+    """Metriche peggiorate più della soglia (frazione) rispetto ai risultati di base"""
+    peggiorate = []
+    for nome, attuale in risultati["metriche"].items():
+        prima = base["metriche"].get(nome)
+        if not prima or not prima["valore"]:
+            continue
+        rapporto = attuale["valore"] / prima["valore"]
+        if attuale["meglio"] == "alto":
+            variazione = 1 - rapporto
+        else:
+            variazione = rapporto - 1
+        if variazione > soglia:
+            peggiorate.append((nome, prima["valore"], attuale["valore"], attuale["unita"], variazione))
+    return peggiorate
+
+
+def main(argomenti=None):
+    parser = argparse.ArgumentParser(description="Benchmark del solitario")
+    parser.add_argument("--rapido", action="store_true", help="meno partite e meno ripetizioni")
+    parser.add_argument("--seme", type=int, default=1, help="numero della prima partita")
+    parser.add_argument("--uscita", default="benchmark.json", help="file JSON dei risultati")
+    parser.add_argument("--confronta", metavar="FILE", help="risultati di base con cui confrontarsi")
+    parser.add_argument("--soglia", type=float, default=0.10,
+                        help="peggioramento massimo tollerato (0.10 = 10%%)")
+    parser.add_argument("--soak", type=int, metavar="GIRI",
+                        help="invece dei benchmark, prova di durata del menu con GIRI partite")
+    args = parser.parse_args(argomenti)
+
+    if args.soak:
+        misure, problemi = soak(args.soak)
+        for giro, memoria, stack, thread in misure["campioni"]:
+            print(f"giro {giro:>6}: memoria {memoria:10.1f} KB  stack {stack:3}  thread {thread}")
+        print(f"\n{misure['giri']} giri in {misure['durata_s']} s")
+        for problema in problemi:
+            print(f"⚠️  {problema}")
+        if not problemi:
+            print("Memoria, stack e thread stabili.")
+        return 1 if problemi else 0
+
+    risultati = esegui(args.rapido, args.seme)
+    with open(args.uscita, "w", encoding="utf-8") as f:
+        json.dump(risultati, f, indent=2)
+
+    for nome, m in risultati["metriche"].items():
+        print(f"{nome:<30} {m['valore']:>14.3f} {m['unita']}")
+    print(f"\nRisultati salvati in: {args.uscita}")
+
+    if args.confronta:
+        with open(args.confronta, encoding="utf-8") as f:
+            base = json.load(f)
+        peggiorate = confronta(risultati, base, args.soglia)
+        if peggiorate:
+            print(f"\n⚠️  Metriche peggiorate oltre il {args.soglia:.0%}:")
+            for nome, prima, dopo, unita, variazione in peggiorate:
+                print(f"  {nome:<30} {prima:.3f} -> {dopo:.3f} {unita} (+{variazione:.0%})")
+            return 1
+        print(f"\nNessuna metrica peggiorata oltre il {args.soglia:.0%} rispetto a {args.confronta}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""Costruisce l'elenco delle partite risolvibili usato dalla "partita risolvibile" del menu.
+
+Le partite di un intervallo di numeri vengono analizzate dal risolutore in più processi, a
+blocchi; quelle risolte (e verificate rigiocando la soluzione sul motore) finiscono nel file
+con la lunghezza della soluzione e i nodi esplorati. Le partite vengono ordinate per nodi e
+divise in tre fasce di difficoltà della stessa grandezza; il gioco mappa il file in memoria e
+sceglie una partita di una fascia con un solo accesso.
+
+Esempi:
+    python costruisci_risolvibili.py --semi 0:20000
+    python costruisci_risolvibili.py --semi 0:200000 --nodi 200000 --uscita grandi.dat
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from solitario import (Motore, Risolutore, RISOLTA, PESCA, DIFFICOLTA, MAGIC_RISOLVIBILI, VERSIONE_RISOLVIBILI,
+                       _INTESTAZIONE_RISOLVIBILI, _VOCE_RISOLVIBILE, file_risolvibili, riuscita, scrivi_atomico)
+from torneo import intervallo_semi
+
+NODI_MAX = 100000
+BLOCCO = 32
+
+
+def rigioca_soluzione(motore, linea):
+    """Gioca sul motore la soluzione del risolutore, pescando dove serve; True se la partita è vinta"""
+    for mossa in linea:
+        while True:
+            reale = Risolutore._mossa_reale(motore, mossa)
+            if not riuscita(motore.applica(reale)):
+                return False
+            if reale[0] != PESCA or mossa[0] == PESCA:
+                break
+    return motore.controlla_vittoria()
+
+
+def classifica(seme, risolutore):
+    """Voce dell'elenco per la partita (seme, mosse, mosse con le pescate, nodi), o None se non è risolta"""
+    analisi = risolutore.risolvi(Motore(seme=seme))
+    if analisi.verdetto != RISOLTA:
+        return None
+    motore = Motore(seme=seme)
+    if not rigioca_soluzione(motore, analisi.linea):
+        return None
+    return seme, len(analisi.linea), motore.mosse, analisi.nodi
+
+
+def _classifica_blocco(semi, nodi_max):
+    risolutore = Risolutore(nodi_max=nodi_max, tempo_max=0)
+    return len(semi), [voce for voce in (classifica(seme, risolutore) for seme in semi) if voce]
+
+
+def dividi_in_fasce(voci):
+    """Voci ordinate dalla più facile e divise in len(DIFFICOLTA) fasce della stessa grandezza"""
+    voci = sorted(voci, key=lambda v: (v[3], v[1], v[0]))
+    confini = [len(voci) * k // len(DIFFICOLTA) for k in range(len(DIFFICOLTA) + 1)]
+    return [voci[confini[k]:confini[k + 1]] for k in range(len(DIFFICOLTA))]
+
+
+def scrivi_elenco(nome_file, fasce):
+    dati = bytearray(_INTESTAZIONE_RISOLVIBILI.pack(MAGIC_RISOLVIBILI, VERSIONE_RISOLVIBILI, *map(len, fasce)))
+    for fascia in fasce:
+        for voce in fascia:
+            dati += _VOCE_RISOLVIBILE.pack(*voce)
+    scrivi_atomico(nome_file, bytes(dati))
+
+
+def main(argomenti=None):
+    parser = argparse.ArgumentParser(description="Costruisce l'elenco delle partite risolvibili")
+    parser.add_argument("--semi", type=intervallo_semi, default=range(20000),
+                        help="numeri delle partite da analizzare, come inizio:fine (fine esclusa)")
+    parser.add_argument("--nodi", type=int, default=NODI_MAX, help="nodi del risolutore per partita")
+    parser.add_argument("--processi", type=int, default=None)
+    parser.add_argument("--blocco", type=int, default=BLOCCO, help="partite per ogni lavoro dei processi")
+    parser.add_argument("--uscita", default=None, help="file dell'elenco (default: quello letto dal gioco)")
+    args = parser.parse_args(argomenti)
+
+    uscita = args.uscita or file_risolvibili()
+    semi = list(args.semi)
+    voci = []
+    analizzate = 0
+    inizio = time.perf_counter()
+    with ProcessPoolExecutor(args.processi) as esecutore:
+        futuri = [esecutore.submit(_classifica_blocco, semi[i:i + args.blocco], args.nodi)
+                  for i in range(0, len(semi), args.blocco)]
+        for futuro in as_completed(futuri):
+            n, risolte = futuro.result()
+            analizzate += n
+            voci += risolte
+            print(f"\r{analizzate}/{len(semi)} partite analizzate, {len(voci)} risolvibili",
+                  end="", file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+
+    fasce = dividi_in_fasce(voci)
+    scrivi_elenco(uscita, fasce)
+    durata = time.perf_counter() - inizio
+    print(f"{len(voci)} partite risolvibili su {len(semi)} in {durata:.1f} s, scritte in {uscita}")
+    for difficolta, fascia in zip(DIFFICOLTA, fasce):
+        if fascia:
+            mosse = sum(v[2] for v in fascia) / len(fascia)
+            print(f"  {difficolta:<10} {len(fascia):>7} partite  nodi {fascia[0][3]}-{fascia[-1][3]}  "
+                  f"mosse medie {mosse:.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
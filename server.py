@@ -0,0 +1,321 @@
+"""Server di gioco: molte partite di solitario in un solo processo.
+
+Ogni connessione (TCP o socket locale) ha la sua partita e la guida con gli stessi comandi
+del gioco da terminale, una riga per comando. Ogni risposta è un blocco di righe chiuso da
+una riga con un solo punto ("."), così un client sa quando smettere di leggere.
+
+Le partite inattive vengono scaricate su disco nel formato binario dei salvataggi (.sol):
+quando in memoria ce ne sono più di --max-partite si scarica quella usata meno di recente,
+e ogni partita ferma da più di --inattivita secondi viene comunque scaricata. Al comando
+successivo la partita viene ricaricata senza che il giocatore se ne accorga (si perde solo
+la cronologia per annullare). Chi si disconnette può riprendere con "riprendi <codice>"
+entro --conserva secondi; dopo il file viene cancellato. I file scaricati sono solo una
+copia ricaricabile, quindi vengono scritti senza fsync per non fermare le altre sessioni.
+
+Un client lento non fa crescere la memoria del server: se le risposte non ancora consegnate
+superano --limite-scrittura byte il comando successivo viene letto solo quando il client
+le ha lette, e se non lo fa entro --attesa-scrittura secondi la connessione viene chiusa.
+
+Esempi:
+    python server.py --porta 7777
+    python server.py --unix /tmp/solitario.sock
+"""
+import argparse
+import asyncio
+import collections
+import os
+import re
+import secrets
+import time
+
+from solitario import (Solitario, Risolutore, CacheConsigli, MESSAGGI_VERDETTO, MODALITA, interpreta_comando,
+                       interpreta_id_partita, scrivi_atomico, riuscita, OK, COLORI_ANSI)
+
+FINE_RISPOSTA = "."
+LUNGHEZZA_MAX_RIGA = 1024
+CODA_CONNESSIONI = 4096     # connessioni in attesa di accept: molte arrivano insieme
+
+AIUTO = [
+    "Comandi:",
+    "  0                      consiglio",
+    "  1                      pesca una carta",
+    "  2 da a                 sposta da colonna a colonna (es: 2 1 5)",
+    "  3 scarti | 3 colonna n sposta una carta nella pila finale",
+    "  4 n                    sposta dagli scarti alla colonna n",
+    "  a / r                  annulla / ripeti",
+    "  m                      mostra il tavolo",
+    "  nuova [modalita] [#numero]   nuova partita (normale, tempo, difficile)",
+    "  riprendi <codice>      riprende una partita lasciata in sospeso",
+    "  colori si|no           colori ANSI nelle risposte",
+    "  8                      termina la partita e chiude la connessione",
+]
+
+
+class Sessione:
+    """Una partita del server: in memoria (gioco) oppure scaricata su disco"""
+    __slots__ = ("codice", "gioco", "ultimo_uso", "colori")
+
+    def __init__(self, codice, gioco):
+        self.codice = codice
+        self.gioco = gioco
+        self.ultimo_uso = time.monotonic()
+        self.colori = False
+
+
+class ServerSolitario:
+    def __init__(self, cartella, max_partite=1000, inattivita=300.0,
+                 limite_scrittura=64 * 1024, attesa_scrittura=10.0, risolutore=None, conserva=86400.0):
+        self.cartella = cartella
+        os.makedirs(cartella, exist_ok=True)
+        self.max_partite = max(1, max_partite)
+        self.inattivita = inattivita
+        self.conserva = conserva
+        self.limite_scrittura = limite_scrittura
+        self.attesa_scrittura = attesa_scrittura
+        # Consigli più brevi che nel gioco da terminale: la ricerca blocca tutte le sessioni
+        self.risolutore = risolutore or Risolutore(nodi_max=5000, tempo_max=0.01)
+        self.consigli = CacheConsigli(capacita=16384)
+        self.sessioni = {}                              # codice: Sessione connessa
+        self.in_memoria = collections.OrderedDict()     # codice: Sessione, dalla meno recente
+        self.scaricate = 0
+        self.ricaricate = 0
+        self.cancellate = 0
+        self.elimina_abbandonate(temporanei=True)
+
+    # --- partite in memoria e su disco ---
+
+    def _file(self, codice):
+        return os.path.join(self.cartella, codice + ".sol")
+
+    def _nuova_sessione(self, gioco):
+        sessione = Sessione(secrets.token_hex(6), gioco)
+        self.sessioni[sessione.codice] = sessione
+        self._usa(sessione)
+        return sessione
+
+    def _usa(self, sessione):
+        """Partita della sessione, ricaricata dal disco se era stata scaricata"""
+        sessione.ultimo_uso = time.monotonic()
+        if sessione.gioco is None:
+            with open(self._file(sessione.codice), 'rb') as f:
+                sessione.gioco = Solitario.da_bytes(f.read())
+            self.ricaricate += 1
+        self.in_memoria[sessione.codice] = sessione
+        self.in_memoria.move_to_end(sessione.codice)
+        while len(self.in_memoria) > self.max_partite:
+            _, meno_recente = self.in_memoria.popitem(last=False)
+            self._scarica(meno_recente)
+        return sessione.gioco
+
+    def _scarica(self, sessione):
+        if sessione.gioco is None:
+            return
+        scrivi_atomico(self._file(sessione.codice), sessione.gioco.in_bytes(), durevole=False)
+        sessione.gioco = None
+        self.in_memoria.pop(sessione.codice, None)
+        self.scaricate += 1
+
+    def _elimina(self, sessione):
+        self.in_memoria.pop(sessione.codice, None)
+        sessione.gioco = None
+        try:
+            os.remove(self._file(sessione.codice))
+        except FileNotFoundError:
+            pass
+
+    def scarica_inattive(self):
+        limite = time.monotonic() - self.inattivita
+        for sessione in [s for s in self.in_memoria.values() if s.ultimo_uso < limite]:
+            self._scarica(sessione)
+
+    def elimina_abbandonate(self, aperte=(), temporanei=False):
+        """Cancella i file delle partite non riprese entro `conserva` secondi (tranne quelle
+        con i codici in `aperte`) e, con temporanei=True, i file temporanei lasciati da
+        scritture interrotte: va fatto solo quando nessuna scrittura è in corso."""
+        limite = time.time() - self.conserva
+        with os.scandir(self.cartella) as voci:
+            for voce in voci:
+                if voce.name.endswith(".tmp"):
+                    scaduto = temporanei
+                elif voce.name.endswith(".sol"):
+                    scaduto = voce.name[:-4] not in aperte and voce.stat().st_mtime < limite
+                else:
+                    continue
+                if scaduto:
+                    try:
+                        os.remove(voce.path)
+                        self.cancellate += 1
+                    except FileNotFoundError:
+                        pass
+
+    async def _pulizia(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(min(30.0, self.inattivita))
+            self.scarica_inattive()
+            # Scorrere la cartella può richiedere tempo: lo si fa fuori dal ciclo degli eventi
+            await loop.run_in_executor(None, self.elimina_abbandonate, frozenset(self.sessioni))
+
+    # --- comandi ---
+
+    def _tavolo(self, sessione):
+        return sessione.gioco.righe_schermo()
+
+    def esegui(self, sessione, riga):
+        """Esegue un comando; restituisce le righe della risposta e se chiudere la connessione"""
+        parole = riga.split()
+        comando = parole[0].lower() if parole else ""
+        if comando in ("aiuto", "7", "?"):
+            return AIUTO, False
+        if comando == "colori":
+            sessione.colori = parole[1:2] == ["si"]
+            return [f"Colori {'attivi' if sessione.colori else 'disattivati'}."], False
+        if comando == "nuova":
+            return self._comando_nuova(sessione, parole[1:]), False
+        if comando == "riprendi":
+            return self._comando_riprendi(sessione, parole[1:]), False
+        if comando in ("8", "esci"):
+            self._elimina(sessione)
+            return ["Partita terminata. Arrivederci."], True
+
+        gioco = self._usa(sessione)
+        if gioco.tempo_scaduto():
+            # Come nel gioco da terminale la partita a tempo finisce: nessun comando viene eseguito
+            return self._tavolo(sessione) + ["⏰ TEMPO SCADUTO! Hai perso la partita.",
+                                             "Scrivi 'nuova' per cominciare un'altra partita."], False
+        if comando in ("m", "mostra", ""):
+            return self._tavolo(sessione), False
+        if comando == "0":
+            analisi = self.consigli.analizza(gioco, self.risolutore)
+            return ["Consiglio: " + gioco.descrivi_mossa(analisi.mossa),
+                    MESSAGGI_VERDETTO[analisi.verdetto]], False
+        if comando in ("a", "r"):
+            esito = gioco.annulla() if comando == "a" else gioco.ripeti()
+            righe = [gioco.messaggio_esito(esito)] if esito != OK else []
+            return righe + self._tavolo(sessione), False
+        try:
+            mossa = interpreta_comando(riga)
+        except ValueError as e:
+            return [str(e), "Scrivi 'aiuto' per l'elenco dei comandi."], False
+        esito = gioco.applica(mossa)
+        messaggio = gioco.messaggio_esito(esito, mossa)
+        righe = ([messaggio] if messaggio else []) + self._tavolo(sessione)
+        if riuscita(esito) and gioco.controlla_vittoria():
+            righe.append(f"HAI VINTO! Punteggio finale: {gioco.punteggio}, mosse: {gioco.mosse}.")
+        return righe, False
+
+    def _comando_nuova(self, sessione, argomenti):
+        modalita = "normale"
+        seme = None
+        for argomento in argomenti:
+            if argomento in MODALITA:
+                modalita = argomento
+            else:
+                try:
+                    seme = interpreta_id_partita(argomento)
+                except ValueError as e:
+                    return [str(e)]
+        self._elimina(sessione)
+        sessione.gioco = Solitario(modalita=modalita, seme=seme)
+        self._usa(sessione)
+        return [f"Nuova partita {sessione.gioco.id_partita}."] + self._tavolo(sessione)
+
+    def _comando_riprendi(self, sessione, argomenti):
+        codice = argomenti[0] if argomenti else ""
+        if not re.fullmatch(r"[0-9a-f]{12}", codice) or not os.path.exists(self._file(codice)):
+            return ["Nessuna partita in sospeso con questo codice."]
+        if codice in self.sessioni:
+            return ["Questa partita è già aperta in un'altra connessione."]
+        self._elimina(sessione)
+        del self.sessioni[sessione.codice]
+        sessione.codice = codice
+        sessione.gioco = None
+        self.sessioni[codice] = sessione
+        self._usa(sessione)
+        return [f"Partita ripresa (codice {codice})."] + self._tavolo(sessione)
+
+    # --- connessioni ---
+
+    async def _invia(self, writer, sessione, righe):
+        testo = "\n".join(righe) + f"\n{FINE_RISPOSTA}\n"
+        if not sessione.colori:
+            testo = COLORI_ANSI.sub("", testo)
+        writer.write(testo.encode("utf-8"))
+        # drain() aspetta solo se l'uscita in attesa supera limite_scrittura: un client che
+        # non legge blocca la propria sessione prima di far crescere il buffer
+        await asyncio.wait_for(writer.drain(), self.attesa_scrittura)
+
+    async def gestisci(self, reader, writer):
+        writer.transport.set_write_buffer_limits(high=self.limite_scrittura)
+        sessione = self._nuova_sessione(Solitario())
+        try:
+            await self._invia(writer, sessione, [
+                f"Benvenuto nel Solitario! Codice della sessione: {sessione.codice}",
+                "Scrivi 'aiuto' per l'elenco dei comandi."] + self._tavolo(sessione))
+            while True:
+                try:
+                    riga = await reader.readline()
+                except ValueError:      # riga troppo lunga
+                    await self._invia(writer, sessione, ["Comando troppo lungo."])
+                    break
+                if not riga:
+                    break
+                risposta, chiudi = self.esegui(sessione, riga.decode("utf-8", "replace").strip())
+                await self._invia(writer, sessione, risposta)
+                if chiudi:
+                    break
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            # La partita resta su disco, per poterla riprendere con il suo codice
+            self.sessioni.pop(sessione.codice, None)
+            if sessione.gioco is not None:
+                self._scarica(sessione)
+            writer.close()
+
+    async def avvia(self, host="127.0.0.1", porta=7777, unix=None):
+        if unix:
+            server = await asyncio.start_unix_server(self.gestisci, unix, limit=LUNGHEZZA_MAX_RIGA,
+                                                     backlog=CODA_CONNESSIONI)
+        else:
+            server = await asyncio.start_server(self.gestisci, host, porta, limit=LUNGHEZZA_MAX_RIGA,
+                                                backlog=CODA_CONNESSIONI)
+        pulizia = asyncio.ensure_future(self._pulizia())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            pulizia.cancel()
+
+
+def main(argomenti=None):
+    parser = argparse.ArgumentParser(description="Server del solitario")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=7777)
+    parser.add_argument("--unix", metavar="PERCORSO", help="ascolta su un socket locale invece che in TCP")
+    parser.add_argument("--cartella", default=os.path.join(os.path.expanduser("~"), ".solitario", "server"),
+                        help="dove scaricare le partite inattive")
+    parser.add_argument("--max-partite", type=int, default=1000, help="partite tenute in memoria")
+    parser.add_argument("--inattivita", type=float, default=300.0,
+                        help="secondi dopo i quali una partita ferma viene scaricata su disco")
+    parser.add_argument("--limite-scrittura", type=int, default=64 * 1024,
+                        help="byte di risposte non consegnate oltre i quali si smette di leggere comandi")
+    parser.add_argument("--attesa-scrittura", type=float, default=10.0,
+                        help="secondi concessi a un client per leggere una risposta")
+    parser.add_argument("--conserva", type=float, default=86400.0,
+                        help="secondi per cui si può riprendere una partita lasciata in sospeso")
+    args = parser.parse_args(argomenti)
+
+    server = ServerSolitario(args.cartella, args.max_partite, args.inattivita,
+                             limite_scrittura=args.limite_scrittura,
+                             attesa_scrittura=args.attesa_scrittura, conserva=args.conserva)
+    dove = args.unix or f"{args.host}:{args.porta}"
+    print(f"Server del solitario in ascolto su {dove}")
+    try:
+        asyncio.run(server.avvia(args.host, args.porta, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,28 @@
+import argparse
+import atexit
+import codecs
+import hashlib
 import random
 import os
+import re
+import selectors
 import sys
+import threading
 import json
+import mmap
 import time
+import shutil
+import sqlite3
+import struct
+import zlib
+from collections import OrderedDict
 from datetime import datetime
 from colorama import init, Fore, Style
+try:
+    import termios
+    import tty
+except ImportError:     # Windows: i comandi si leggono con input()
+    termios = tty = None
 
 init(autoreset=True)
 
@@ -12,42 +30,89 @@ SEMI = ['♠', '♥', '♦', '♣']
 VALORI = ['A'] + [str(n) for n in range(2, 11)] + ['J', 'Q', 'K']
 COLORI = {'♠': 'N', '♣': 'N', '♥': 'R', '♦': 'R'}
 
+# Codifica compatta delle carte: un intero da 0 a 51 (seme * 13 + rango - 1).
+# Il motore delle regole lavora solo su questi codici e sulle tabelle qui sotto,
+# calcolate una volta sola all'avvio.
+NUM_CARTE = 52
+RANGO = [c % 13 + 1 for c in range(NUM_CARTE)]              # 1 (A) .. 13 (K)
+SEME = [c // 13 for c in range(NUM_CARTE)]                   # indice in SEMI
+COLORE = [0 if COLORI[SEMI[SEME[c]]] == 'N' else 1 for c in range(NUM_CARTE)]  # 0 nero, 1 rosso
+# PUO_IMPILARE[c] ha il bit d acceso se la carta c può essere messa sopra la carta d
+PUO_IMPILARE = [
+    sum(1 << d for d in range(NUM_CARTE)
+        if COLORE[d] != COLORE[c] and RANGO[d] == RANGO[c] + 1)
+    for c in range(NUM_CARTE)
+]
+
+
+def codice_carta(seme, valore):
+    """Restituisce il codice intero (0-51) di una carta"""
+    return SEMI.index(seme) * 13 + VALORI.index(valore)
+
+
+CARTA_COPERTA = "##"
+
+
+def _glifo(codice, tema):
+    simbolo = f"{VALORI[RANGO[codice] - 1]}{SEMI[SEME[codice]]}"
+    rossa = COLORE[codice]
+    # Personalizzazione colori
+    if tema == "blu_verde":
+        if rossa:
+            return Fore.BLUE + simbolo + Style.RESET_ALL
+        else:
+            return Fore.GREEN + simbolo + Style.RESET_ALL
+    elif tema == "chiaro":
+        return Fore.BLACK + simbolo + Style.RESET_ALL
+    else:  # classico
+        if rossa:
+            return Fore.RED + simbolo + Style.RESET_ALL
+        return simbolo
+
+
+# Stringhe già colorate di tutte le carte, per ogni tema
+GLIFI = {tema: [_glifo(c, tema) for c in range(NUM_CARTE)] for tema in ("classico", "blu_verde", "chiaro")}
+
+
+def glifi_tema(tema):
+    """Glifi delle carte per il tema (il classico se il tema non esiste)"""
+    return GLIFI.get(tema) or GLIFI["classico"]
+
+
 class Carta:
+    """Vista di una carta per la grafica e per il formato di salvataggio"""
+    __slots__ = ('codice', 'scoperta', 'tema')
+
     def __init__(self, seme, valore):
-        self.seme = seme
-        self.valore = valore
+        self.codice = codice_carta(seme, valore)
         self.scoperta = False
+        self.tema = 'classico'
+
+    @classmethod
+    def da_codice(cls, codice, scoperta=True, tema='classico'):
+        """Crea la vista di una carta a partire dal suo codice"""
+        carta = cls.__new__(cls)
+        carta.codice = codice
+        carta.scoperta = scoperta
+        carta.tema = tema
+        return carta
+
+    @property
+    def seme(self):
+        return SEMI[SEME[self.codice]]
+
+    @property
+    def valore(self):
+        return VALORI[RANGO[self.codice] - 1]
 
     def __repr__(self):
         if not self.scoperta:
-            return "##"
-        simbolo = f"{self.valore}{self.seme}"
-        # Personalizzazione colori
-        tema = getattr(self, 'tema', 'classico')
-        if hasattr(self, 'tema') and self.tema == "blu_verde":
-            if self.seme in ['♥', '♦']:
-                return Fore.BLUE + simbolo + Style.RESET_ALL
-            else:
-                return Fore.GREEN + simbolo + Style.RESET_ALL
-        elif hasattr(self, 'tema') and self.tema == "chiaro":
-            return Fore.BLACK + simbolo + Style.RESET_ALL
-        else:  # classico
-            if self.seme in ['♥', '♦']:
-                return Fore.RED + simbolo + Style.RESET_ALL
-            return simbolo
+            return CARTA_COPERTA
+        return glifi_tema(self.tema)[self.codice]
 
     def valore_numerico(self):
         """Restituisce il valore numerico della carta per i confronti"""
-        if self.valore == 'A':
-            return 1
-        elif self.valore == 'J':
-            return 11
-        elif self.valore == 'Q':
-            return 12
-        elif self.valore == 'K':
-            return 13
-        else:
-            return int(self.valore)
+        return RANGO[self.codice]
         
     def to_dict(self):
         """Converte la carta in un dizionario per il salvataggio"""
@@ -64,297 +129,1775 @@ class Carta:
         carta.scoperta = data['scoperta']
         return carta
 
-class Solitario:
-    def __init__(self, modalita="normale", tema="classico", tempo_limite=None):
-        self.mazzo = [Carta(seme, valore) for seme in SEMI for valore in VALORI]
-        random.shuffle(self.mazzo)
+# Tipi di mossa (coincidono con i tasti dei comandi di gioco)
+PESCA = 1
+COLONNA = 2     # (COLONNA, da, a): da colonna (o dagli scarti) a colonna
+FINALE = 3      # (FINALE, da, 0): da colonna (o dagli scarti) alla pila finale
+SCARTI = -1     # indice di origine che indica la cima degli scarti
+
+# Esiti restituiti dal motore delle regole
+OK = 0
+MAZZO_RIGIRATO = 1
+ERR_NIENTE_DA_PESCARE = 10
+ERR_DESTINAZIONE = 11
+ERR_SCARTI_VUOTI = 12
+ERR_SOLO_RE = 13
+ERR_ORDINE = 14
+ERR_ORIGINE = 15
+ERR_ORIGINE_VUOTA = 16
+ERR_NESSUNA_SCOPERTA = 17
+ERR_COLONNA_FINALE = 18
+ERR_CARTA_COPERTA = 19
+ERR_NON_IN_FINALE = 20
+ERR_MOSSA = 21
+ERR_NIENTE_DA_ANNULLARE = 22
+ERR_NIENTE_DA_RIPETERE = 23
+
+MESSAGGI_ESITO = {
+    MAZZO_RIGIRATO: "Mazzo rigirato e mescolato.",
+    ERR_NIENTE_DA_PESCARE: "Nessuna carta da pescare o rigirare.",
+    ERR_DESTINAZIONE: "Indice colonna di destinazione non valido.",
+    ERR_SCARTI_VUOTI: "Nessuna carta negli scarti.",
+    ERR_SOLO_RE: "Solo un Re può essere spostato in una colonna vuota.",
+    ERR_ORDINE: "Ordine o colore non valido per lo spostamento.",
+    ERR_ORIGINE: "Indice colonna di origine non valido.",
+    ERR_ORIGINE_VUOTA: "Colonna di origine vuota.",
+    ERR_NESSUNA_SCOPERTA: "Nessuna carta scoperta da spostare.",
+    ERR_COLONNA_FINALE: "Colonna vuota o indice non valido.",
+    ERR_CARTA_COPERTA: "La carta non è scoperta.",
+    ERR_NON_IN_FINALE: "Carta non posizionabile nella pila finale.",
+    ERR_MOSSA: "Origine non valida.",
+    ERR_NIENTE_DA_ANNULLARE: "Nessuna mossa da annullare.",
+    ERR_NIENTE_DA_RIPETERE: "Nessuna mossa da ripetere.",
+}
+
+
+def riuscita(esito):
+    """True se l'esito corrisponde a una mossa eseguita"""
+    return esito < ERR_NIENTE_DA_PESCARE
+
+
+def interpreta_comando(testo):
+    """Traduce un comando di gioco (1-4) in una mossa; solleva ValueError se non è valido"""
+    parti = testo.strip().lower().split()
+    if not parti:
+        raise ValueError("Comando vuoto.")
+    tasto = parti[0]
+    if tasto == "1" and len(parti) == 1:
+        return (PESCA, 0, 0)
+    if tasto == "2":
+        if len(parti) != 3:
+            raise ValueError("Formato non valido. Usa: 2 [da] [a]")
+        try:
+            return (COLONNA, int(parti[1]) - 1, int(parti[2]) - 1)
+        except ValueError:
+            raise ValueError("Parametri non validi. Usa numeri per le colonne.")
+    if tasto == "3":
+        if len(parti) == 2 and parti[1] == "scarti":
+            return (FINALE, SCARTI, 0)
+        if len(parti) == 3 and parti[1] == "colonna":
+            try:
+                return (FINALE, int(parti[2]) - 1, 0)
+            except ValueError:
+                raise ValueError("Comando non valido.")
+        raise ValueError("Formato non valido. Esempio: 3 scarti o 3 colonna 4")
+    if tasto == "4":
+        if len(parti) != 2:
+            raise ValueError("Formato non valido. Usa: 4 [colonna]")
+        try:
+            return (COLONNA, SCARTI, int(parti[1]) - 1)
+        except ValueError:
+            raise ValueError("Formato non valido. Usa: 4 [colonna]")
+    raise ValueError("Comando sconosciuto. Premi 7 per visualizzare l'aiuto.")
+
+
+# Tutte le mosse possibili, create una volta sola e riusate dal generatore di mosse
+MOSSA_PESCA = (PESCA, 0, 0)
+MOSSE_COLONNA = [[(COLONNA, i, j) for j in range(7)] for i in range(7)]
+MOSSE_DAGLI_SCARTI = [(COLONNA, SCARTI, j) for j in range(7)]
+MOSSE_FINALE = [(FINALE, i, 0) for i in range(7)]
+MOSSA_SCARTI_FINALE = (FINALE, SCARTI, 0)
+
+# Le stesse mosse numerate da 0 a NUM_AZIONI - 1, per i motori a lotti e i giocatori automatici:
+# 0 pesca, 1 + 7*i + j da colonna i a colonna j, 50 + i da colonna i alla pila finale,
+# 57 dagli scarti alla pila finale, 58 + j dagli scarti alla colonna j
+AZIONI = ([MOSSA_PESCA] + [m for riga in MOSSE_COLONNA for m in riga] + MOSSE_FINALE
+          + [MOSSA_SCARTI_FINALE] + MOSSE_DAGLI_SCARTI)
+NUM_AZIONI = len(AZIONI)
+INDICE_AZIONE = {mossa: i for i, mossa in enumerate(AZIONI)}
+AZIONE_PESCA = 0
+AZIONE_COLONNA = 1
+AZIONE_FINALE = 50
+AZIONE_SCARTI_FINALE = 57
+AZIONE_DAGLI_SCARTI = 58
+
+# Parti dello stato da cui dipendono le mosse legali (bit 0-6: le colonne)
+_SPORCHI_SCARTI = 1 << 7
+_SPORCHE_FINALI = 1 << 8
+_TUTTO_SPORCO = (1 << 9) - 1
+
+
+def comando_mossa(mossa):
+    """Restituisce il comando di gioco corrispondente a una mossa"""
+    tipo, da, a = mossa
+    if tipo == PESCA:
+        return "1"
+    if tipo == COLONNA:
+        return f"4 {a+1}" if da == SCARTI else f"2 {da+1} {a+1}"
+    return "3 scarti" if da == SCARTI else f"3 colonna {da+1}"
+
+
+# Modi di rigirare il mazzo quando la riserva è finita
+RICICLO_MESCOLATO = "mescolato"     # gli scarti vengono mescolati (versione facilitata)
+RICICLO_STANDARD = "standard"       # gli scarti tornano nella riserva nello stesso ordine
+
+SEME_MAX = 2 ** 32     # i numeri di partita vanno da 0 a SEME_MAX - 1
+
+
+def nuovo_seme():
+    """Estrae un numero di partita a caso dall'entropia del sistema"""
+    return int.from_bytes(os.urandom(4), "big")
+
+
+def interpreta_id_partita(testo):
+    """Legge un numero di partita ("123" o "#123"); solleva ValueError se non è valido"""
+    try:
+        seme = int(testo.strip().lstrip("#"))
+    except ValueError:
+        raise ValueError(f"Numero di partita non valido: {testo.strip()!r} (si scrive #<numero>, "
+                         f"per esempio #123).") from None
+    if not 0 <= seme < SEME_MAX:
+        raise ValueError("Numero di partita fuori intervallo.")
+    return seme
+
+
+# Istantanea dello stato di un motore: seme, punteggio, mosse, ricicli, modalità, riciclo,
+# pile finali, lunghezze e carte coperte delle colonne, carte nella riserva e negli scarti;
+# seguono le carte (un byte ciascuna) delle colonne, della riserva e degli scarti
+_ISTANTANEA = struct.Struct("<IiIIBB4B7B7BBB")
+
+
+class Motore:
+    """Motore delle regole del Klondike, senza input/output.
+
+    Ogni mossa restituisce un esito (OK o un codice ERR_*) invece di stampare.
+    Ogni partita ha il suo numero (seme): la distribuzione e ogni rimescolamento
+    degli scarti dipendono solo da quello, quindi una partita si può sempre rigiocare.
+    """
+
+    def __init__(self, modalita="normale", seme=None, rng=None, riciclo=RICICLO_MESCOLATO):
+        if seme is None:
+            seme = rng.randrange(SEME_MAX) if rng is not None else nuovo_seme()
+        self.modalita = modalita
+        self.seme = seme
+        self.riciclo = riciclo
+        self._stato_vuoto()
+        mazzo = list(range(NUM_CARTE))
+        random.Random(seme).shuffle(mazzo)
+        self._prepara_gioco(mazzo)
+
+    def copia(self):
+        """Motore indipendente con la stessa posizione (senza la cronologia per annullare)"""
+        altro = Motore.__new__(Motore)
+        altro.modalita = self.modalita
+        altro.seme = self.seme
+        altro.riciclo = self.riciclo
+        altro._stato_vuoto()
+        altro.colonne = [list(col) for col in self.colonne]
+        altro.coperte = list(self.coperte)
+        altro.fondazioni = list(self.fondazioni)
+        altro.riserva = list(self.riserva)
+        altro.scarti = list(self.scarti)
+        altro.punteggio = self.punteggio
+        altro.mosse = self.mosse
+        altro.ricicli = self.ricicli
+        return altro
+
+    def istantanea(self):
+        """Stato della partita impacchettato in bytes (senza la cronologia per annullare).
+
+        Si ottiene in pochi microsecondi, non cambia più, si può confrontare e usare come chiave
+        di un dizionario; da_istantanea() ne ricava un motore giocabile. Due istantanee sono
+        uguali se lo sono posizione, punteggio e numero di mosse.
+        """
+        colonne = self.colonne
+        return _ISTANTANEA.pack(
+            self.seme, self.punteggio, self.mosse, self.ricicli,
+            _codice_opzione(MODALITA, self.modalita), _codice_opzione(RICICLI, self.riciclo),
+            *self.fondazioni, *map(len, colonne), *self.coperte, len(self.riserva), len(self.scarti)
+        ) + bytes(colonne[0] + colonne[1] + colonne[2] + colonne[3] + colonne[4] + colonne[5] + colonne[6]
+                  + self.riserva + self.scarti)
+
+    @classmethod
+    def da_istantanea(cls, dati):
+        """Motore (o partita) con lo stato di un'istantanea"""
+        (seme, punteggio, mosse, ricicli, modalita, riciclo, *resto) = _ISTANTANEA.unpack_from(dati)
+        motore = cls.__new__(cls)
+        motore._stato_vuoto()
+        motore.seme = seme
+        motore.punteggio = punteggio
+        motore.mosse = mosse
+        motore.ricicli = ricicli
+        motore.modalita = MODALITA[modalita]
+        motore.riciclo = RICICLI[riciclo]
+        motore.fondazioni = resto[:4]
+        motore.coperte = resto[11:18]
+        pos = _ISTANTANEA.size
+        for i, n in enumerate(resto[4:11]):
+            motore.colonne[i] = list(dati[pos:pos + n])
+            pos += n
+        n_riserva = resto[18]
+        motore.riserva = list(dati[pos:pos + n_riserva])
+        motore.scarti = list(dati[pos + n_riserva:])
+        return motore
+
+    @property
+    def id_partita(self):
+        """Numero della partita da mostrare e da usare per rigiocarla"""
+        return f"#{self.seme}"
+
+    def _stato_vuoto(self):
+        # Colonne, riserva e scarti contengono codici di carta (0-51).
+        # In ogni colonna le carte coperte sono sempre le prime coperte[i].
         self.colonne = [[] for _ in range(7)]
-        self.pile_finali = {seme: [] for seme in SEMI}
+        self.coperte = [0] * 7
+        self.fondazioni = [0] * 4   # numero di carte in ogni pila finale, per seme
         self.riserva = []
         self.scarti = []
         self.punteggio = 0
-        self.tempo_inizio = time.time()
         self.mosse = 0
-        self.modalita = modalita
-        self.tema = tema
-        if modalita == "tempo":
-            self.tempo_limite = tempo_limite if tempo_limite is not None else 600
-        else:
-            self.tempo_limite = None
-        self._prepara_gioco()
+        self.ricicli = 0    # quante volte è stato rigirato il mazzo
+        self._legali = set()
+        self._sporche = _TUTTO_SPORCO
+        self._diario = []           # mosse eseguite, per annullare
+        self._da_ripetere = []      # mosse annullate, per ripetere
 
-    def _prepara_gioco(self):
+    def _prepara_gioco(self, mazzo):
         for i in range(7):
             for j in range(i + 1):
-                carta = self.mazzo.pop()
-                if j == i:
-                    carta.scoperta = True
-                elif self.modalita == "difficile":
-                    carta.scoperta = False  # Meno carte scoperte in modalità difficile
-                self.colonne[i].append(carta)
-        self.riserva = self.mazzo[:]
-        self.mazzo = []
-
-    def mostra(self):
-        os.system("cls" if os.name == "nt" else "clear")
-        tempo_trascorso = int(time.time() - self.tempo_inizio)
-        if self.modalita == "tempo":
-            tempo_rimanente = max(0, self.tempo_limite - tempo_trascorso)
-            minuti = tempo_rimanente // 60
-            secondi = tempo_rimanente % 60
-            tempo_str = f"Tempo: {minuti:02d}:{secondi:02d}"
-        else:
-            minuti = tempo_trascorso // 60
-            secondi = tempo_trascorso % 60
-            tempo_str = f"Tempo: {minuti:02d}:{secondi:02d}"
-
-        print(f"╔═══════════════════════════════════════════════════════════════╗")
-        print(f"║ SOLITARIO ({self.modalita.upper()})    Punteggio: {self.punteggio:<5} "
-              f"{tempo_str} Mosse: {self.mosse:<3} ║")
-        print(f"╚═══════════════════════════════════════════════════════════════╝")
-        
-        if self.modalita == "tempo" and tempo_rimanente == 0:
-            print("\n⏰ TEMPO SCADUTO! Hai perso la partita.")
-            input("\nPremi INVIO per terminare...")
-            exit()
-
-        print("\n📌 PILE FINALI:")
-        for seme in SEMI:
-            pila = self.pile_finali[seme]
-            cima = pila[-1] if pila else '__'
-            if isinstance(cima, Carta) and cima.seme in ['♥', '♦']:
-                cima = Fore.RED + str(cima) + Style.RESET_ALL
-            print(f"{seme}: {cima}", end='   ')
-        
-        print("\n\n📌 RISERVA:")
-        scarto = self.scarti[-1] if self.scarti else '__'
-        print(f"Scarti: {scarto}")
-        print(f"Carte nel mazzo: {len(self.riserva)}")
-        
-        self.mostra_colonne()
-
-    def mostra_colonne(self):
-        print("\n📌 COLONNE:")
-        for i, col in enumerate(self.colonne):
-            print(f"{Fore.YELLOW}Colonna {i+1}:{Style.RESET_ALL}", end=' ')
-            for carta in col:
-                carta.tema = self.tema  # <--- AGGIUNTA QUI
-                print(f"{carta} ", end='')
-            print()
+                self.colonne[i].append(mazzo.pop())
+            # Solo l'ultima carta di ogni colonna è scoperta
+            self.coperte[i] = i
+        self.riserva = mazzo
 
     def pesca(self):
-        """Pesca una carta dal mazzo"""
+        """Pesca una carta dal mazzo, o rigira gli scarti se il mazzo è finito"""
         if not self.riserva:
             if not self.scarti:
-                print("Nessuna carta da pescare o rigirare.")
-                return False
-            # Mescola gli scarti prima di rigirarli (versione facilitata)
-            random.shuffle(self.scarti)
-            self.riserva = self.scarti[::-1]
-            for c in self.riserva:
-                c.scoperta = False
-            self.scarti.clear()
-            print("Mazzo rigirato e mescolato.")
-            self.mosse += 1
-            return True
-        if self.riserva:
-            carta = self.riserva.pop()
-            carta.scoperta = True
-            self.scarti.append(carta)
-            self.mosse += 1
-            return True
-        return False
+                return ERR_NIENTE_DA_PESCARE
+            # Mescola gli scarti prima di rigirarli (versione facilitata); la
+            # permutazione resta nel diario per poter annullare e ripetere
+            ordine = list(range(len(self.scarti)))
+            if self.riciclo == RICICLO_MESCOLATO:
+                # Dipende solo dal numero di partita e da quante volte si è già rigirato
+                random.Random(self.seme * 1000 + self.ricicli).shuffle(ordine)
+            ordine.reverse()
+            self._esegui((PESCA, 0, 0, len(ordine), False, 0, bytes(ordine)))
+            return MAZZO_RIGIRATO
+        self._esegui((PESCA, 0, 0, 1, False, 0, None))
+        return OK
 
     def sposta_colonna(self, da_idx, a_idx, da_scarti=False):
         """Sposta carte tra colonne o dagli scarti a una colonna"""
         # Validazione indici
         if not (0 <= a_idx < 7):
-            print("Indice colonna di destinazione non valido.")
-            return False
-            
+            return ERR_DESTINAZIONE
         a = self.colonne[a_idx]
-        
+
         # Caso speciale: spostamento dagli scarti
         if da_scarti:
             if not self.scarti:
-                print("Nessuna carta da spostare negli scarti.")
-                return False
-                
+                return ERR_SCARTI_VUOTI
             carta = self.scarti[-1]
-            
             # Verifica condizioni di spostamento
             if not a:  # Colonna vuota
-                if carta.valore == 'K':
-                    self.colonne[a_idx].append(carta)
-                    self.scarti.pop()
-                    self.mosse += 1
-                    self.punteggio += 5
-                    return True
-                else:
-                    print("Solo un Re può essere spostato in una colonna vuota.")
-                    return False
-            else:  # Colonna con carte
-                cima = a[-1]
-                if COLORI[cima.seme] != COLORI[carta.seme] and carta.valore_numerico() == cima.valore_numerico() - 1:
-                    self.colonne[a_idx].append(carta)
-                    self.scarti.pop()
-                    self.mosse += 1
-                    self.punteggio += 5
-                    return True
-                else:
-                    print("Ordine o colore non valido per lo spostamento.")
-                    return False
-        
+                if RANGO[carta] != 13:
+                    return ERR_SOLO_RE
+            elif not PUO_IMPILARE[carta] >> a[-1] & 1:
+                return ERR_ORDINE
+            self._esegui((COLONNA, SCARTI, a_idx, 1, False, 5, None))
+            return OK
+
         # Spostamento tra colonne
         if not (0 <= da_idx < 7):
-            print("Indice colonna di origine non valido.")
-            return False
-            
+            return ERR_ORIGINE
         da = self.colonne[da_idx]
-        
         if not da:
-            print("Colonna di origine vuota.")
-            return False
-            
-        # Trova il primo indice di carta scoperta
-        for i in range(len(da)):
-            if da[i].scoperta:
-                gruppo = da[i:]
-                
-                # Verifica se si può spostare nella colonna di destinazione
-                if not a:  # Colonna vuota
-                    if gruppo[0].valore == 'K':
-                        self.colonne[a_idx] += gruppo
-                        self.colonne[da_idx] = da[:i]
-                        self._scopri_ultima(da_idx)
-                        self.mosse += 1
-                        self.punteggio += 3
-                        return True
-                    else:
-                        print("Solo un Re può essere spostato in una colonna vuota.")
-                        return False
-                else:  # Colonna con carte
-                    cima = a[-1]
-                    if COLORI[cima.seme] != COLORI[gruppo[0].seme] and gruppo[0].valore_numerico() == cima.valore_numerico() - 1:
-                        self.colonne[a_idx] += gruppo
-                        self.colonne[da_idx] = da[:i]
-                        self._scopri_ultima(da_idx)
-                        self.mosse += 1
-                        self.punteggio += 3
-                        return True
-                    else:
-                        print("Ordine o colore non valido per lo spostamento.")
-                        return False
-                        
-        print("Nessuna carta scoperta da spostare.")
-        return False
+            return ERR_ORIGINE_VUOTA
+
+        # Il gruppo da spostare parte dalla prima carta scoperta
+        base = self.base_gruppo(da_idx)
+        if base < 0:
+            return ERR_NESSUNA_SCOPERTA
 
-    def _scopri_ultima(self, idx):
-        """Scopre l'ultima carta di una colonna"""
-        if self.colonne[idx]:
-            self.colonne[idx][-1].scoperta = True
+        # Verifica se si può spostare nella colonna di destinazione
+        if not a:  # Colonna vuota
+            if RANGO[base] != 13:
+                return ERR_SOLO_RE
+        elif not PUO_IMPILARE[base] >> a[-1] & 1:
+            return ERR_ORDINE
+        # Se sotto al gruppo resta una carta coperta, viene scoperta
+        self._esegui((COLONNA, da_idx, a_idx, self.lunghezza_gruppo(da_idx), self.coperte[da_idx] > 0, 3, None))
+        return OK
+
+    def _va_in_finale(self, carta):
+        """True se la carta può essere messa sulla sua pila finale"""
+        return RANGO[carta] == self.fondazioni[SEME[carta]] + 1
 
     def sposta_a_finale(self, origine, idx=None):
         """Sposta una carta nella pila finale"""
         if origine == "scarti":
             if not self.scarti:
-                print("Nessuna carta negli scarti.")
-                return False
+                return ERR_SCARTI_VUOTI
             carta = self.scarti[-1]
+            da = SCARTI
+            girata = False
         elif origine == "colonna":
-            if not (0 <= idx < 7) or not self.colonne[idx]:
-                print("Colonna vuota o indice non valido.")
-                return False
-            carta = self.colonne[idx][-1]
-            if not carta.scoperta:
-                print("La carta non è scoperta.")
-                return False
+            if idx is None or not (0 <= idx < 7) or not self.colonne[idx]:
+                return ERR_COLONNA_FINALE
+            if self.lunghezza_gruppo(idx) == 0:
+                return ERR_CARTA_COPERTA
+            carta = self.cima(idx)
+            da = idx
+            girata = self.lunghezza_gruppo(idx) == 1 and self.coperte[idx] > 0
         else:
-            print("Origine non valida.")
-            return False
+            return ERR_MOSSA
+
+        if not self._va_in_finale(carta):
+            return ERR_NON_IN_FINALE
+        self._esegui((FINALE, da, 0, 1, girata, 10, carta))
+        return OK
 
-        pila = self.pile_finali[carta.seme]
-        if (not pila and carta.valore == 'A') or (pila and carta.valore_numerico() == pila[-1].valore_numerico() + 1):
-            pila.append(carta)
-            if origine == "scarti":
+    # Il diario delle mosse: ogni mossa eseguita è una voce
+    # (tipo, da, a, carte spostate, carta girata?, punti, extra), dove extra è la carta
+    # finita in pila finale oppure la permutazione (bytes) usata per rigirare il mazzo.
+
+    def _esegui(self, voce):
+        """Applica una voce del diario e la registra (cancella le mosse da ripetere)"""
+        self._rifai(voce)
+        self._diario.append(voce)
+        if self._da_ripetere:
+            self._da_ripetere.clear()
+
+    def _rifai(self, voce):
+        tipo, da, a, n, girata, punti, extra = voce
+        if tipo == PESCA:
+            if extra is None:
+                self.scarti.append(self.riserva.pop())
+            else:
+                scarti = self.scarti
+                self.riserva = [scarti[p] for p in extra]
+                self.scarti = []
+                self.ricicli += 1
+            self._sporche |= _SPORCHI_SCARTI
+        elif tipo == COLONNA:
+            dest = self.colonne[a]
+            if da == SCARTI:
+                dest.append(self.scarti.pop())
+                self._sporche |= _SPORCHI_SCARTI | 1 << a
+            else:
+                # Si copiano solo le n carte del gruppo: il resto della colonna resta dov'è
+                src = self.colonne[da]
+                dest += src[-n:]
+                del src[-n:]
+                if girata:
+                    self.coperte[da] -= 1
+                self._sporche |= 1 << da | 1 << a
+        else:
+            self.fondazioni[SEME[extra]] += 1
+            if da == SCARTI:
                 self.scarti.pop()
+                self._sporche |= _SPORCHE_FINALI | _SPORCHI_SCARTI
+            else:
+                self.colonne[da].pop()
+                if girata:
+                    self.coperte[da] -= 1
+                self._sporche |= _SPORCHE_FINALI | 1 << da
+        self.mosse += 1
+        self.punteggio += punti
+
+    def _disfa(self, voce):
+        tipo, da, a, n, girata, punti, extra = voce
+        if tipo == PESCA:
+            if extra is None:
+                self.riserva.append(self.scarti.pop())
+            else:
+                riserva = self.riserva
+                scarti = [0] * len(riserva)
+                for j, p in enumerate(extra):
+                    scarti[p] = riserva[j]
+                self.scarti = scarti
+                self.riserva = []
+                self.ricicli -= 1
+            self._sporche |= _SPORCHI_SCARTI
+        elif tipo == COLONNA:
+            dest = self.colonne[a]
+            if da == SCARTI:
+                self.scarti.append(dest.pop())
+                self._sporche |= _SPORCHI_SCARTI | 1 << a
+            else:
+                if girata:
+                    self.coperte[da] += 1
+                self.colonne[da] += dest[-n:]
+                del dest[-n:]
+                self._sporche |= 1 << da | 1 << a
+        else:
+            self.fondazioni[SEME[extra]] -= 1
+            if da == SCARTI:
+                self.scarti.append(extra)
+                self._sporche |= _SPORCHE_FINALI | _SPORCHI_SCARTI
+            else:
+                if girata:
+                    self.coperte[da] += 1
+                self.colonne[da].append(extra)
+                self._sporche |= _SPORCHE_FINALI | 1 << da
+        self.mosse -= 1
+        self.punteggio -= punti
+
+    def annulla(self):
+        """Annulla l'ultima mossa, riportando lo stato esattamente a prima"""
+        if not self._diario:
+            return ERR_NIENTE_DA_ANNULLARE
+        voce = self._diario.pop()
+        self._disfa(voce)
+        self._da_ripetere.append(voce)
+        return OK
+
+    def ripeti(self):
+        """Ripete l'ultima mossa annullata"""
+        if not self._da_ripetere:
+            return ERR_NIENTE_DA_RIPETERE
+        voce = self._da_ripetere.pop()
+        self._rifai(voce)
+        self._diario.append(voce)
+        return OK
+
+    def applica(self, mossa):
+        """Esegue una mossa (tipo, da, a) e ne restituisce l'esito"""
+        tipo, da, a = mossa
+        if tipo == PESCA:
+            return self.pesca()
+        if tipo == COLONNA:
+            return self.sposta_colonna(da, a, da_scarti=(da == SCARTI))
+        if tipo == FINALE:
+            if da == SCARTI:
+                return self.sposta_a_finale("scarti")
+            return self.sposta_a_finale("colonna", da)
+        return ERR_MOSSA
+
+    def controlla_vittoria(self):
+        """Verifica se il gioco è stato vinto"""
+        return all(altezza == 13 for altezza in self.fondazioni)
+
+    def invalida_mosse(self):
+        """Da chiamare dopo aver modificato lo stato senza passare dalle mosse"""
+        self._sporche = _TUTTO_SPORCO
+
+    def mosse_legali(self):
+        """Insieme delle mosse legali (da non modificare).
+
+        L'insieme viene mantenuto tra una mossa e l'altra: si ricalcolano solo le voci
+        che dipendono dalle colonne, dagli scarti o dalle pile finali cambiate.
+        """
+        if self._sporche:
+            self._aggiorna_mosse()
+        return self._legali
+
+    def _accetta(self, idx, carta):
+        """True se la carta può essere appoggiata in cima alla colonna idx"""
+        dest = self.colonne[idx]
+        if dest:
+            return PUO_IMPILARE[carta] >> dest[-1] & 1
+        return RANGO[carta] == 13
+
+    # Accesso in O(1) alle parti di una colonna: le carte coperte sono le prime coperte[idx],
+    # tutte le altre formano il gruppo scoperto (sempre una scala valida), che si sposta intero
+
+    def cima(self, idx):
+        """Carta in cima alla colonna idx, o -1 se la colonna è vuota"""
+        col = self.colonne[idx]
+        return col[-1] if col else -1
+
+    def base_gruppo(self, idx):
+        """Prima carta scoperta della colonna idx, o -1 se non ce ne sono"""
+        i = self.coperte[idx]
+        col = self.colonne[idx]
+        return col[i] if i < len(col) else -1
+
+    def lunghezza_gruppo(self, idx):
+        """Numero di carte scoperte della colonna idx, cioè quante se ne spostano insieme"""
+        return len(self.colonne[idx]) - self.coperte[idx]
+
+    def _aggiorna_mosse(self):
+        legali = self._legali
+        sporche = self._sporche
+        self._sporche = 0
+        colonne = self.colonne
+        coperte = self.coperte
+        scarto = self.scarti[-1] if self.scarti else -1
+        for i in range(7):
+            if not sporche >> i & 1:
+                continue
+            base = self.base_gruppo(i)
+            for j in range(7):
+                if j == i:
+                    continue
+                # i come origine...
+                if base >= 0 and self._accetta(j, base):
+                    legali.add(MOSSE_COLONNA[i][j])
+                else:
+                    legali.discard(MOSSE_COLONNA[i][j])
+                # ...e come destinazione
+                base_j = self.base_gruppo(j)
+                if base_j >= 0 and self._accetta(i, base_j):
+                    legali.add(MOSSE_COLONNA[j][i])
+                else:
+                    legali.discard(MOSSE_COLONNA[j][i])
+            if scarto >= 0 and self._accetta(i, scarto):
+                legali.add(MOSSE_DAGLI_SCARTI[i])
             else:
-                self.colonne[idx].pop()
-                self._scopri_ultima(idx)
-            self.mosse += 1
-            self.punteggio += 10
+                legali.discard(MOSSE_DAGLI_SCARTI[i])
+        if sporche & (_SPORCHE_FINALI | 127):
+            for i in range(7):
+                if sporche & _SPORCHE_FINALI or sporche >> i & 1:
+                    col = colonne[i]
+                    if len(col) > coperte[i] and self._va_in_finale(col[-1]):
+                        legali.add(MOSSE_FINALE[i])
+                    else:
+                        legali.discard(MOSSE_FINALE[i])
+        if sporche & _SPORCHI_SCARTI:
+            for j in range(7):
+                if scarto >= 0 and self._accetta(j, scarto):
+                    legali.add(MOSSE_DAGLI_SCARTI[j])
+                else:
+                    legali.discard(MOSSE_DAGLI_SCARTI[j])
+            if self.riserva or self.scarti:
+                legali.add(MOSSA_PESCA)
+            else:
+                legali.discard(MOSSA_PESCA)
+        if sporche & (_SPORCHI_SCARTI | _SPORCHE_FINALI):
+            if scarto >= 0 and self._va_in_finale(scarto):
+                legali.add(MOSSA_SCARTI_FINALE)
+            else:
+                legali.discard(MOSSA_SCARTI_FINALE)
+
+    def mossa_consigliata(self):
+        """Restituisce la prima mossa utile secondo una priorità fissa, o None"""
+        legali = self.mosse_legali()
+        # 1. Prova a spostare una carta scoperta nelle pile finali
+        for mossa in MOSSE_FINALE:
+            if mossa in legali:
+                return mossa
+        # 2. Prova a spostare dagli scarti alla pila finale
+        if MOSSA_SCARTI_FINALE in legali:
+            return MOSSA_SCARTI_FINALE
+        # 3. Prova a spostare dagli scarti a una colonna
+        for mossa in MOSSE_DAGLI_SCARTI:
+            if mossa in legali:
+                return mossa
+        # 4. Prova a spostare tra colonne
+        for da_idx in range(7):
+            for mossa in MOSSE_COLONNA[da_idx]:
+                # EVITA di suggerire lo spostamento su una colonna vuota se il gruppo è l'intera colonna
+                if mossa in legali and (self.colonne[mossa[2]] or self.coperte[da_idx] > 0):
+                    return mossa
+        # 5. Se nessuna mossa, consiglia di pescare
+        if self.riserva:
+            return MOSSA_PESCA
+        return None
+
+    def analizza(self, risolutore=None):
+        """Cerca la mossa migliore con il risolutore e dice se la partita è ancora vincibile.
+        Senza un risolutore usa quello dei consigli, passando dalla cache delle posizioni."""
+        if risolutore is None:
+            return CACHE_CONSIGLI.analizza(self, RISOLUTORE_CONSIGLI)
+        return risolutore.risolvi(self)
+
+
+# Verdetti del risolutore
+RISOLTA = "risolta"        # trovata una sequenza di mosse che vince
+PERSA = "persa"            # ricerca esaurita: nessuna sequenza porta alla vittoria
+INCERTA = "incerta"        # budget esaurito prima di poter decidere
+
+_BASE = NUM_CARTE   # carta fittizia su cui poggia la prima carta di ogni colonna
+# SU[c]: carte su cui c può essere appoggiata; SOTTO[d]: carte che si possono appoggiare su d
+SU = [[d for d in range(NUM_CARTE) if PUO_IMPILARE[c] >> d & 1] for c in range(NUM_CARTE)]
+SOTTO = [[c for c in range(NUM_CARTE) if PUO_IMPILARE[c] >> d & 1] for d in range(NUM_CARTE)]
+OPPOSTI = [[t for t in range(4) if COLORE[t * 13] != COLORE[s * 13]] for s in range(4)]
+RE = [s * 13 + 12 for s in range(4)]
+
+# Chiavi di Zobrist. Le colonne sono descritte dalle coppie "carta c sopra la carta p",
+# così l'hash non dipende dall'ordine delle colonne.
+_zobrist = random.Random(0x5011)
+Z_SOPRA = [[_zobrist.getrandbits(64) for _ in range(NUM_CARTE + 1)] for _ in range(NUM_CARTE)]
+Z_COPERTA = [_zobrist.getrandbits(64) for _ in range(NUM_CARTE)]
+Z_FINALE = [[_zobrist.getrandbits(64) for _ in range(14)] for _ in range(4)]
+Z_TALLONE = [_zobrist.getrandbits(64) for _ in range(NUM_CARTE)]
+
+
+class _BudgetEsaurito(Exception):
+    pass
+
+
+class Analisi:
+    """Risultato di una ricerca del risolutore"""
+    __slots__ = ('verdetto', 'mossa', 'linea', 'nodi')
+
+    def __init__(self, verdetto, mossa, linea, nodi):
+        self.verdetto = verdetto    # RISOLTA, PERSA o INCERTA
+        self.mossa = mossa          # mossa da giocare adesso (tipo, da, a), o None
+        self.linea = linea          # sequenza vincente trovata (mosse del risolutore)
+        self.nodi = nodi            # posizioni esaminate
+
+
+class Risolutore:
+    """Risolutore del Klondike: ricerca in profondità con tabella delle trasposizioni.
+
+    Lavora a informazione completa (conosce anche le carte coperte). Si pesca una carta
+    alla volta e gli scarti si possono rigirare senza limiti, quindi riserva e scarti sono
+    trattati come un insieme di carte sempre raggiungibili (il "tallone"): l'ordine conta
+    solo per il numero di pescate. Le mosse interne sono (tipo, da, a, carta).
+
+    Potature: le mosse sicure verso le pile finali vengono giocate subito senza
+    ramificare, un Re già in fondo a una colonna non viene spostato in un'altra colonna
+    vuota e, se ci sono più colonne vuote, se ne prova solo una. Le posizioni esplorate
+    senza successo vengono ricordate (al massimo tabella_max) e non più visitate.
+    """
+
+    def __init__(self, nodi_max=20000, tempo_max=0.05, tabella_max=200000):
+        self.nodi_max = nodi_max
+        self.tempo_max = tempo_max
+        self.tabella_max = tabella_max
+        self.tabella = set()    # hash delle posizioni senza vittoria
+        self.interrompi = None  # threading.Event che, se impostato, ferma la ricerca
+
+    def risolvi(self, motore):
+        """Analizza la posizione del motore e restituisce un'Analisi"""
+        self._carica(motore)
+        self.nodi = 0
+        self._scadenza = time.perf_counter() + self.tempo_max if self.tempo_max else None
+        self._linea = []
+        self._valori = {}
+        self._ramo = None
+        try:
+            vinta = self._cerca(0)
+        except _BudgetEsaurito:
+            verdetto = INCERTA
+        else:
+            verdetto = RISOLTA if vinta else PERSA
+        if verdetto == RISOLTA:
+            prima = self._linea[0] if self._linea else None
+        elif self._sicure_radice:
+            prima = self._sicure_radice[0]
+        elif self._valori:
+            prima = max(self._valori, key=self._valori.get)
+        else:
+            prima = None
+        mossa = None if prima is None else self._mossa_reale(motore, prima)
+        return Analisi(verdetto, mossa, self._linea if verdetto == RISOLTA else [], self.nodi)
+
+    @staticmethod
+    def _mossa_reale(motore, mossa):
+        """Traduce una mossa del risolutore in una mossa giocabile adesso"""
+        tipo, da, a, carta = mossa
+        if da != SCARTI:
+            return (tipo, da, a)
+        if motore.scarti and motore.scarti[-1] == carta:
+            return (tipo, SCARTI, a)
+        # La carta è nel tallone ma non in cima agli scarti: bisogna pescare
+        return (PESCA, 0, 0)
+
+    def _carica(self, motore):
+        self.col = [list(c) for c in motore.colonne]
+        self.cop = list(motore.coperte)
+        self.fond = list(motore.fondazioni)
+        self.tallone = 0
+        for c in motore.riserva:
+            self.tallone |= 1 << c
+        for c in motore.scarti:
+            self.tallone |= 1 << c
+        h = 0
+        for i, col in enumerate(self.col):
+            sotto = _BASE
+            for j, c in enumerate(col):
+                h ^= Z_SOPRA[c][sotto]
+                if j < self.cop[i]:
+                    h ^= Z_COPERTA[c]
+                sotto = c
+        for s in range(4):
+            h ^= Z_FINALE[s][self.fond[s]]
+        for c in range(NUM_CARTE):
+            if self.tallone >> c & 1:
+                h ^= Z_TALLONE[c]
+        self.h = h
+
+    def _fai(self, mossa):
+        """Applica una mossa interna; restituisce (carta girata?, carte spostate)"""
+        tipo, da, a, carta = mossa
+        if da == SCARTI:
+            self.tallone ^= 1 << carta
+            self.h ^= Z_TALLONE[carta]
+            if tipo == FINALE:
+                s = SEME[carta]
+                f = self.fond[s]
+                self.h ^= Z_FINALE[s][f] ^ Z_FINALE[s][f + 1]
+                self.fond[s] = f + 1
+            else:
+                dest = self.col[a]
+                self.h ^= Z_SOPRA[carta][dest[-1] if dest else _BASE]
+                dest.append(carta)
+            return False, 1
+        src = self.col[da]
+        c0 = self.cop[da]
+        if tipo == FINALE:
+            src.pop()
+            self.h ^= Z_SOPRA[carta][src[-1] if src else _BASE]
+            s = SEME[carta]
+            f = self.fond[s]
+            self.h ^= Z_FINALE[s][f] ^ Z_FINALE[s][f + 1]
+            self.fond[s] = f + 1
+            n = 1
+        else:
+            dest = self.col[a]
+            self.h ^= (Z_SOPRA[carta][src[c0 - 1] if c0 else _BASE]
+                       ^ Z_SOPRA[carta][dest[-1] if dest else _BASE])
+            n = len(src) - c0
+            dest.extend(src[c0:])
+            del src[c0:]
+        if src and c0 == len(src):
+            self.cop[da] = c0 - 1
+            self.h ^= Z_COPERTA[src[-1]]
+            return True, n
+        return False, n
+
+    def _disfa(self, mossa, info):
+        """Annulla una mossa interna applicata con _fai"""
+        tipo, da, a, carta = mossa
+        girata, n = info
+        if da == SCARTI:
+            self.tallone ^= 1 << carta
+            self.h ^= Z_TALLONE[carta]
+            if tipo == FINALE:
+                s = SEME[carta]
+                f = self.fond[s]
+                self.h ^= Z_FINALE[s][f] ^ Z_FINALE[s][f - 1]
+                self.fond[s] = f - 1
+            else:
+                dest = self.col[a]
+                dest.pop()
+                self.h ^= Z_SOPRA[carta][dest[-1] if dest else _BASE]
+            return
+        src = self.col[da]
+        if girata:
+            self.h ^= Z_COPERTA[src[-1]]
+            self.cop[da] += 1
+        if tipo == FINALE:
+            s = SEME[carta]
+            f = self.fond[s]
+            self.h ^= Z_FINALE[s][f] ^ Z_FINALE[s][f - 1]
+            self.fond[s] = f - 1
+            self.h ^= Z_SOPRA[carta][src[-1] if src else _BASE]
+            src.append(carta)
+        else:
+            dest = self.col[a]
+            gruppo = dest[-n:]
+            del dest[-n:]
+            self.h ^= (Z_SOPRA[carta][dest[-1] if dest else _BASE]
+                       ^ Z_SOPRA[carta][src[-1] if src else _BASE])
+            src.extend(gruppo)
+
+    def _sicura(self, carta):
+        """True se mettere la carta in pila finale non può mai impedire la vittoria"""
+        r = RANGO[carta]
+        if r <= 2:
             return True
+        a, b = OPPOSTI[SEME[carta]]
+        return self.fond[a] >= r - 1 and self.fond[b] >= r - 1
+
+    def _gioca_sicure(self):
+        """Gioca tutte le mosse sicure verso le pile finali e le restituisce con le info di annullamento"""
+        giocate = []
+        cambiato = True
+        while cambiato:
+            cambiato = False
+            for i in range(7):
+                src = self.col[i]
+                if len(src) > self.cop[i]:
+                    c = src[-1]
+                    if RANGO[c] == self.fond[SEME[c]] + 1 and self._sicura(c):
+                        m = (FINALE, i, 0, c)
+                        giocate.append((m, self._fai(m)))
+                        cambiato = True
+            for s in range(4):
+                f = self.fond[s]
+                c = s * 13 + f
+                if f < 13 and self.tallone >> c & 1 and self._sicura(c):
+                    m = (FINALE, SCARTI, 0, c)
+                    giocate.append((m, self._fai(m)))
+                    cambiato = True
+        return giocate
+
+    def _genera(self):
+        """Mosse candidate, nell'ordine in cui conviene provarle"""
+        col = self.col
+        cop = self.cop
+        fond = self.fond
+        tallone = self.tallone
+        vuota = next((j for j in range(7) if not col[j]), -1)
+        girano = []     # scoprono una carta coperta
+        finali = []
+        dal_tallone = []
+        altre = []
+        for i in range(7):
+            src = col[i]
+            n = len(src)
+            c0 = cop[i]
+            if n <= c0:
+                continue
+            top = src[-1]
+            if RANGO[top] == fond[SEME[top]] + 1:
+                (girano if c0 == n - 1 and c0 else finali).append((c0, (FINALE, i, 0, top)))
+            base = src[c0]
+            if RANGO[base] == 13:
+                # Un Re già in fondo alla colonna non guadagna nulla a cambiare colonna
+                if c0 and vuota >= 0:
+                    girano.append((c0, (COLONNA, i, vuota, base)))
+                continue
+            impila = PUO_IMPILARE[base]
+            for j in range(7):
+                dest = col[j]
+                if j != i and dest and impila >> dest[-1] & 1:
+                    if c0:
+                        girano.append((c0, (COLONNA, i, j, base)))
+                    else:
+                        altre.append((COLONNA, i, j, base))
+        if tallone:
+            for s in range(4):
+                c = s * 13 + fond[s]
+                if fond[s] < 13 and tallone >> c & 1:
+                    finali.append((0, (FINALE, SCARTI, 0, c)))
+            for j in range(7):
+                dest = col[j]
+                if dest:
+                    for c in SOTTO[dest[-1]]:
+                        if tallone >> c & 1:
+                            dal_tallone.append((COLONNA, SCARTI, j, c))
+            if vuota >= 0:
+                for c in RE:
+                    if tallone >> c & 1:
+                        altre.append((COLONNA, SCARTI, vuota, c))
+        girano.sort(key=lambda x: -x[0])
+        return [m for _, m in girano] + [m for _, m in finali] + dal_tallone + altre
+
+    def _cerca(self, profondita):
+        self.nodi += 1
+        if self.nodi > self.nodi_max:
+            raise _BudgetEsaurito
+        if self.nodi & 255 == 0 and (
+                (self._scadenza is not None and time.perf_counter() > self._scadenza)
+                or (self.interrompi is not None and self.interrompi.is_set())):
+            raise _BudgetEsaurito
+        sicure = self._gioca_sicure()
+        if profondita == 0:
+            self._sicure_radice = [m for m, _ in sicure]
+        linea = self._linea
+        for m, _ in sicure:
+            linea.append(m)
+        fond = self.fond
+        if fond[0] + fond[1] + fond[2] + fond[3] == NUM_CARTE:
+            return True
+        if self._ramo is not None:
+            valore = 3 * (fond[0] + fond[1] + fond[2] + fond[3]) - 2 * sum(self.cop)
+            if valore > self._valori.get(self._ramo, -1000):
+                self._valori[self._ramo] = valore
+        h = self.h
+        if h not in self.tabella:
+            for m in self._genera():
+                info = self._fai(m)
+                linea.append(m)
+                if profondita == 0:
+                    self._ramo = m
+                if self._cerca(profondita + 1):
+                    return True
+                linea.pop()
+                self._disfa(m, info)
+            if len(self.tabella) >= self.tabella_max:
+                self.tabella.clear()
+            self.tabella.add(h)
+        for m, info in reversed(sicure):
+            linea.pop()
+            self._disfa(m, info)
+        return False
+
+
+# Risolutore usato per i consigli durante la partita: risponde in pochi millisecondi
+RISOLUTORE_CONSIGLI = Risolutore(nodi_max=20000, tempo_max=0.05)
+
+
+def chiave_posizione(motore):
+    """Chiave canonica della posizione (64 bit) e ordine canonico delle colonne.
+
+    Le colonne vengono ordinate per contenuto, così due posizioni che differiscono solo
+    per l'ordine delle colonne hanno la stessa chiave; ordine[k] è la colonna reale che
+    occupa il posto k. Riserva e scarti contano come insieme più la carta in cima agli
+    scarti, esattamente quello che guarda il risolutore.
+    """
+    colonne = motore.colonne
+    coperte = motore.coperte
+    ordine = sorted(range(7), key=lambda i: (coperte[i], colonne[i]))
+    dati = bytearray(motore.fondazioni)
+    for i in ordine:
+        dati.append(coperte[i])
+        dati.append(len(colonne[i]))
+        dati += bytes(colonne[i])
+    tallone = 0
+    for c in motore.riserva:
+        tallone |= 1 << c
+    for c in motore.scarti:
+        tallone |= 1 << c
+    dati += tallone.to_bytes(7, 'little')
+    dati.append(motore.scarti[-1] if motore.scarti else 255)
+    return int.from_bytes(hashlib.blake2b(dati, digest_size=8).digest(), 'little'), ordine
+
+
+def _rinumera_mossa(mossa, posto):
+    """Sostituisce le colonne di una mossa (tipo, da, a, ...) con posto[colonna]"""
+    tipo, da, a = mossa[:3]
+    if tipo == PESCA:
+        return mossa
+    if da >= 0:
+        da = posto[da]
+    if tipo == COLONNA:
+        a = posto[a]
+    return (tipo, da, a) + tuple(mossa[3:])
+
+
+_VERDETTI = [RISOLTA, PERSA, INCERTA]
+_VOCE_CONSIGLI = struct.Struct("<QBbbb")    # chiave, verdetto, mossa (tipo 0: nessuna mossa)
+
+
+class CacheConsigli:
+    """Analisi del risolutore già calcolate, per chiave canonica della posizione.
+
+    Tiene al massimo `capacita` posizioni, eliminando quella usata meno di recente.
+    Le mosse sono memorizzate con le colonne in ordine canonico e rimappate sulle colonne
+    reali a ogni lettura. Con una cartella, i verdetti definitivi (vinta/persa) di ogni
+    partita numerata vengono aggiunti al file <cartella>/<numero>.cache e ricaricati
+    quando si torna a giocare la stessa partita.
+    """
+
+    def __init__(self, capacita=4096, cartella=None):
+        self.capacita = capacita
+        self.cartella = cartella
+        self.voci = OrderedDict()   # chiave: (verdetto, mossa, linea, nodi), colonne canoniche
+        self.trovate = 0
+        self.mancate = 0
+        self._seme = None
+        self._file = None
+
+    def svuota(self):
+        self.voci.clear()
+        self._seme = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _partita(self, seme):
+        """Prepara il file della partita numerata, caricandone i verdetti già noti"""
+        if self.cartella is None or seme == self._seme:
+            return
+        self.svuota()
+        self._seme = seme
+        os.makedirs(self.cartella, exist_ok=True)
+        nome_file = os.path.join(self.cartella, f"{seme}.cache")
+        try:
+            with open(nome_file, 'rb') as f:
+                dati = f.read()
+        except FileNotFoundError:
+            dati = b""
+        dati = dati[:len(dati) - len(dati) % _VOCE_CONSIGLI.size]
+        for chiave, verdetto, tipo, da, a in _VOCE_CONSIGLI.iter_unpack(dati):
+            self._memorizza(chiave, (_VERDETTI[verdetto], (tipo, da, a) if tipo else None, [], 0))
+        self._file = open(nome_file, 'ab')
+
+    def _memorizza(self, chiave, voce):
+        self.voci[chiave] = voce
+        self.voci.move_to_end(chiave)
+        if len(self.voci) > self.capacita:
+            self.voci.popitem(last=False)
+
+    def cerca(self, motore):
+        """Analisi già nota della posizione (con le colonne reali), oppure None"""
+        self._partita(motore.seme)
+        chiave, ordine = chiave_posizione(motore)
+        voce = self.voci.get(chiave)
+        if voce is None:
+            self.mancate += 1
+            return None
+        self.trovate += 1
+        self.voci.move_to_end(chiave)
+        verdetto, mossa, linea, nodi = voce
+        return Analisi(verdetto, None if mossa is None else _rinumera_mossa(mossa, ordine),
+                       [_rinumera_mossa(m, ordine) for m in linea], nodi)
+
+    def registra(self, motore, analisi):
+        self._partita(motore.seme)
+        chiave, ordine = chiave_posizione(motore)
+        voce = self.voci.get(chiave)
+        if voce is not None and voce[0] == analisi.verdetto and voce[0] != INCERTA:
+            # Verdetto definitivo già noto (e già scritto nel file): niente da aggiungere
+            self.voci.move_to_end(chiave)
+            return
+        posto = [0] * 7
+        for k, i in enumerate(ordine):
+            posto[i] = k
+        mossa = None if analisi.mossa is None else _rinumera_mossa(analisi.mossa, posto)
+        self._memorizza(chiave, (analisi.verdetto, mossa,
+                                 [_rinumera_mossa(m, posto) for m in analisi.linea], analisi.nodi))
+        if self._file is not None and analisi.verdetto != INCERTA:
+            self._file.write(_VOCE_CONSIGLI.pack(chiave, _VERDETTI.index(analisi.verdetto),
+                                                 *(mossa or (0, 0, 0))))
+            self._file.flush()
+
+    def analizza(self, motore, risolutore):
+        """Analisi della posizione: dalla cache se c'è, altrimenti dal risolutore"""
+        analisi = self.cerca(motore)
+        if analisi is None:
+            analisi = risolutore.risolvi(motore)
+            self.registra(motore, analisi)
+        return analisi
+
+
+# Cache dei consigli durante la partita; SOLITARIO_CACHE_CONSIGLI=cartella la rende persistente
+CACHE_CONSIGLI = CacheConsigli(cartella=os.environ.get("SOLITARIO_CACHE_CONSIGLI") or None)
+
+
+class RilevatoreStallo:
+    """Dice dopo ogni mossa se la partita è già decisa: RISOLTA, PERSA o INCERTA.
+
+    Si pesca una carta alla volta e gli scarti si possono rigirare senza limiti, quindi
+    ogni carta di riserva e scarti è sempre raggiungibile: il tallone conta come insieme.
+    Se non ci sono carte coperte la vittoria è assicurata (si può sempre giocare la carta
+    più bassa che manca nelle pile finali). Altrimenti si esplorano le posizioni
+    raggiungibili senza progressi (spostamenti di gruppi da colonne senza carte coperte):
+    se in nessuna è possibile un progresso (scoprire una carta, portare una carta nelle
+    pile finali o prenderla dal tallone) la partita è persa. Se un progresso esiste decide
+    un risolutore con un budget piccolo e fisso. I verdetti definitivi vengono ricordati.
+    """
+
+    def __init__(self, nodi_max=3000, stati_max=2000, capacita=4096):
+        self.risolutore = Risolutore(nodi_max=nodi_max, tempo_max=None)
+        self.stati_max = stati_max
+        self.capacita = capacita
+        self.noti = OrderedDict()   # chiave canonica: verdetto definitivo
+
+    def valuta(self, motore):
+        if not any(motore.coperte):
+            return RISOLTA
+        chiave, _ = chiave_posizione(motore)
+        verdetto = self.noti.get(chiave)
+        if verdetto is not None:
+            self.noti.move_to_end(chiave)
+            return verdetto
+        if not self._progresso_possibile(motore):
+            verdetto = PERSA
+        else:
+            verdetto = self.risolutore.risolvi(motore).verdetto
+        if verdetto != INCERTA:
+            self.noti[chiave] = verdetto
+            if len(self.noti) > self.capacita:
+                self.noti.popitem(last=False)
+        return verdetto
+
+    def _progresso_possibile(self, motore):
+        """True se da qualche posizione raggiungibile senza progressi se ne può fare uno
+        (anche quando la ricerca supera stati_max: nel dubbio la partita non è persa)"""
+        fond = motore.fondazioni
+        coperte = motore.coperte
+        tallone = 0
+        for c in motore.riserva:
+            tallone |= 1 << c
+        for c in motore.scarti:
+            tallone |= 1 << c
+        for s in range(4):
+            if fond[s] < 13 and tallone >> (s * 13 + fond[s]) & 1:
+                return True
+        # Carte del tallone che potrebbero andare su una colonna, e Re del tallone
+        accettano = 0
+        for c in range(NUM_CARTE):
+            if tallone >> c & 1:
+                accettano |= PUO_IMPILARE[c]
+        re_nel_tallone = any(tallone >> c & 1 for c in RE)
+
+        # Senza progressi si spostano solo gruppi interi da colonne senza carte coperte
+        # (spostare il gruppo di una colonna con carte coperte ne scopre una)
+        inizio = tuple(sorted((coperte[i], tuple(motore.colonne[i])) for i in range(7)))
+        visti = {inizio}
+        da_visitare = [inizio]
+        while da_visitare:
+            if len(visti) > self.stati_max:
+                return True
+            colonne = da_visitare.pop()
+            vuota = any(not col for _, col in colonne)
+            if vuota and re_nel_tallone:
+                return True
+            cime = [col[-1] for _, col in colonne if col]
+            for c in cime:
+                if RANGO[c] == fond[SEME[c]] + 1 or accettano >> c & 1:
+                    return True
+            for i, (c0, col) in enumerate(colonne):
+                if not col:
+                    continue
+                base = col[c0]
+                if RANGO[base] == 13:
+                    # Un Re scoperto può andare su una colonna vuota: è un progresso
+                    # solo se sotto ha carte coperte
+                    if c0 and vuota:
+                        return True
+                    continue
+                impila = PUO_IMPILARE[base]
+                for j, (d0, dest) in enumerate(colonne):
+                    if j != i and dest and impila >> dest[-1] & 1:
+                        if c0:
+                            return True
+                        nuove = list(colonne)
+                        nuove[j] = (d0, dest + col)
+                        nuove[i] = (0, ())
+                        nuove = tuple(sorted(nuove))
+                        if nuove not in visti:
+                            visti.add(nuove)
+                            da_visitare.append(nuove)
+        return False
+
+
+class AnalisiContinua:
+    """Analizza in un thread la posizione mostrata mentre il giocatore pensa.
+
+    avvia() va chiamata a ogni fotogramma: se la posizione è cambiata la ricerca in
+    corso viene interrotta e ne parte una nuova su una copia del motore, altrimenti
+    quella in corso prosegue. Il thread ripete la ricerca con budget crescenti (PASSI),
+    conservando la tabella delle posizioni perse, finché trova un verdetto definitivo.
+    risultato() restituisce subito la migliore analisi completata per la posizione.
+    Il thread legge solo la sua copia: cache e motore restano del thread principale.
+    """
+
+    PASSI = (20000, 100000, 500000, 2500000)
+
+    def __init__(self, cache=None):
+        self.cache = cache if cache is not None else CACHE_CONSIGLI
+        self._lock = threading.Lock()
+        self._posizione = None      # chiave esatta della posizione analizzata
+        self._migliore = None
+        self._da_registrare = False  # _migliore è nuova e non è ancora nella cache
+        self._interrompi = threading.Event()
+        self._primo_passo = threading.Event()
+
+    @staticmethod
+    def _chiave(motore):
+        # L'ordine canonico distingue le posizioni che differiscono solo per l'ordine delle colonne
+        chiave, ordine = chiave_posizione(motore)
+        return chiave, tuple(ordine)
+
+    def avvia(self, motore):
+        posizione = self._chiave(motore)
+        if posizione == self._posizione:
+            return
+        self.ferma()
+        self._posizione = posizione
+        self._interrompi = threading.Event()
+        self._primo_passo = threading.Event()
+        nota = self.cache.cerca(motore)
+        if nota is not None and nota.verdetto != INCERTA:
+            self._migliore = nota
+            self._primo_passo.set()
+            return
+        threading.Thread(target=self._lavora, daemon=True,
+                         args=(motore.copia(), posizione, self._interrompi, self._primo_passo)).start()
+
+    def _lavora(self, motore, posizione, interrompi, primo_passo):
+        risolutore = Risolutore(tempo_max=None)
+        risolutore.interrompi = interrompi
+        try:
+            for nodi in self.PASSI:
+                risolutore.nodi_max = nodi
+                analisi = risolutore.risolvi(motore)
+                if interrompi.is_set():
+                    return
+                with self._lock:
+                    if self._posizione == posizione:
+                        self._migliore = analisi
+                        self._da_registrare = True
+                primo_passo.set()
+                if analisi.verdetto != INCERTA:
+                    return
+        finally:
+            primo_passo.set()
+
+    def ferma(self):
+        """Interrompe la ricerca in corso (il thread termina entro poche centinaia di nodi)"""
+        self._interrompi.set()
+        with self._lock:
+            self._posizione = None
+            self._migliore = None
+            self._da_registrare = False
+
+    def risultato(self, motore, attesa=0.0):
+        """Migliore analisi completata per la posizione del motore, o None.
+        Con attesa > 0 aspetta al massimo tanti secondi la fine del primo passo."""
+        if self._chiave(motore) != self._posizione:
+            return None
+        if attesa:
+            self._primo_passo.wait(attesa)
+        with self._lock:
+            analisi = self._migliore
+            da_registrare, self._da_registrare = self._da_registrare, False
+        if da_registrare:
+            self.cache.registra(motore, analisi)
+        return analisi
+
+MESSAGGI_VERDETTO = {
+    RISOLTA: "✅ La partita si può ancora vincere.",
+    PERSA: "⚠️  Nessuna sequenza di mosse porta più alla vittoria.",
+    INCERTA: "❔ Non è stato possibile stabilire se la partita si può ancora vincere.",
+}
+
+
+class StimaVittoria:
+    """Stima Monte Carlo della probabilità di vincere dalla posizione attuale"""
+    __slots__ = ('vinte', 'incerte', 'campioni', 'per_mossa')
+
+    def __init__(self, vinte, incerte, campioni, per_mossa):
+        self.vinte = vinte              # campioni in cui esiste una sequenza vincente
+        self.incerte = incerte          # campioni non decisi entro il budget (contati come persi)
+        self.campioni = campioni
+        self.per_mossa = per_mossa      # mossa -> (vinte, campioni) giocando prima quella mossa
+
+    @property
+    def probabilita(self):
+        return self.vinte / self.campioni if self.campioni else 0.0
+
+    def intervallo(self, z=1.96):
+        """Intervallo di confidenza (di Wilson, al 95% per default) della probabilità"""
+        return intervallo_wilson(self.vinte, self.campioni, z)
+
+
+def intervallo_wilson(successi, prove, z=1.96):
+    """Intervallo di confidenza di Wilson per una proporzione"""
+    if not prove:
+        return 0.0, 1.0
+    p = successi / prove
+    den = 1 + z * z / prove
+    centro = (p + z * z / (2 * prove)) / den
+    margine = z * ((p * (1 - p) + z * z / (4 * prove)) / prove) ** 0.5 / den
+    return max(0.0, centro - margine), min(1.0, centro + margine)
+
+
+def _posizione_da_campionare(motore):
+    """Separa la posizione in parte nota e carte nascoste.
+
+    Sono nascoste le carte coperte nelle colonne e, se il mazzo non è ancora stato
+    rigirato, quelle della riserva (il giocatore non le ha mai viste). Restituisce la
+    posizione, le carte nascoste e i posti dove vanno (indice di colonna, o 7 per la riserva).
+    """
+    nascoste = []
+    posti = []
+    for i, col in enumerate(motore.colonne):
+        nascoste += col[:motore.coperte[i]]
+        posti += [i] * motore.coperte[i]
+    if motore.ricicli == 0:
+        nascoste += motore.riserva
+        posti += [7] * len(motore.riserva)
+    posizione = ([col[motore.coperte[i]:] for i, col in enumerate(motore.colonne)],
+                 list(motore.fondazioni), [] if motore.ricicli == 0 else list(motore.riserva),
+                 list(motore.scarti), motore.seme, motore.riciclo, motore.ricicli)
+    return posizione, nascoste, posti
+
+
+def _motore_campione(posizione, posti, carte):
+    """Ricostruisce un motore giocabile mettendo le carte estratte nei posti nascosti"""
+    scoperte, fondazioni, riserva, scarti, seme, riciclo, ricicli = posizione
+    motore = Motore.__new__(Motore)
+    motore._stato_vuoto()
+    motore.modalita = "normale"
+    motore.seme = seme
+    motore.riciclo = riciclo
+    motore.ricicli = ricicli
+    motore.fondazioni = list(fondazioni)
+    motore.riserva = list(riserva)
+    motore.scarti = list(scarti)
+    for posto, carta in zip(posti, carte):
+        if posto == 7:
+            motore.riserva.append(carta)
+        else:
+            motore.colonne[posto].append(carta)
+    for i in range(7):
+        motore.coperte[i] = len(motore.colonne[i])
+        motore.colonne[i] += scoperte[i]
+    return motore
+
+
+def _valuta_campioni(posizione, nascoste, posti, candidate, seme, scadenza, campioni_max, nodi_max):
+    """Lavoro di un processo: estrae campioni fino alla scadenza e li risolve"""
+    rnd = random.Random(seme)
+    risolutore = Risolutore(nodi_max=nodi_max, tempo_max=0)
+    vinte = incerte = campioni = 0
+    per_mossa = [[0, 0] for _ in candidate]
+    while campioni < campioni_max and time.time() < scadenza:
+        carte = list(nascoste)
+        rnd.shuffle(carte)
+        motore = _motore_campione(posizione, posti, carte)
+        vinta = incerta = False
+        for k, mossa in enumerate(candidate):
+            if not riuscita(motore.applica(mossa)):
+                continue
+            verdetto = risolutore.risolvi(motore).verdetto
+            motore.annulla()
+            per_mossa[k][1] += 1
+            if verdetto == RISOLTA:
+                per_mossa[k][0] += 1
+                vinta = True
+            elif verdetto == INCERTA:
+                incerta = True
+        if not candidate:
+            vinta = motore.controlla_vittoria()
+        campioni += 1
+        vinte += vinta
+        incerte += incerta and not vinta
+    return vinte, incerte, campioni, per_mossa
+
+
+_esecutore = None
+
+
+def _esecutore_analisi():
+    """Pool di processi per le analisi, creato alla prima richiesta e poi riusato"""
+    global _esecutore
+    if _esecutore is None:
+        from concurrent.futures import ProcessPoolExecutor
+        _esecutore = ProcessPoolExecutor()
+    return _esecutore
+
+
+def stima_vittoria(motore, tempo_max=1.0, campioni_max=2000, nodi_max=3000, processi=None, seme=0):
+    """Stima la probabilità di vincere dalla posizione del motore.
+
+    Le carte che il giocatore non ha visto vengono estratte a caso, in modo coerente con
+    quello che è scoperto; ogni campione viene risolto per ciascuna mossa legale. I campioni
+    sono divisi tra i processi, che lavorano fino a tempo_max secondi: la stima migliora
+    con il numero di core. Il risolutore conosce le carte del campione, quindi la stima è
+    ottimista rispetto a chi gioca senza vederle.
+    """
+    posizione, nascoste, posti = _posizione_da_campionare(motore)
+    candidate = sorted(motore.mosse_legali())
+    processi = processi or os.cpu_count() or 1
+    scadenza = time.time() + tempo_max
+    per_processo = -(-campioni_max // processi)
+    esecutore = _esecutore_analisi()
+    lavori = [esecutore.submit(_valuta_campioni, posizione, nascoste, posti, candidate,
+                               seme * 1000 + k, scadenza, per_processo, nodi_max)
+              for k in range(processi)]
+    vinte = incerte = campioni = 0
+    per_mossa = [[0, 0] for _ in candidate]
+    for lavoro in lavori:
+        v, inc, n, pm = lavoro.result()
+        vinte += v
+        incerte += inc
+        campioni += n
+        for k, (mv, mn) in enumerate(pm):
+            per_mossa[k][0] += mv
+            per_mossa[k][1] += mn
+    return StimaVittoria(vinte, incerte, campioni,
+                         {mossa: tuple(per_mossa[k]) for k, mossa in enumerate(candidate)})
+
+
+
+# Elenco delle partite risolvibili (costruisci_risolvibili.py): intestazione con il numero di
+# partite per fascia di difficoltà, poi una voce di dimensione fissa per partita, fascia per fascia
+MAGIC_RISOLVIBILI = b"SOLR"
+VERSIONE_RISOLVIBILI = 1
+_INTESTAZIONE_RISOLVIBILI = struct.Struct("<4sBxxx3I")
+_VOCE_RISOLVIBILE = struct.Struct("<IHHI")      # seme, mosse della soluzione, mosse con le pescate, nodi
+DIFFICOLTA = ["facile", "media", "difficile"]
+QUALSIASI = "qualsiasi"
+
+
+def file_risolvibili():
+    """Percorso dell'elenco delle partite risolvibili ($SOLITARIO_RISOLVIBILI o accanto al gioco)"""
+    return (os.environ.get("SOLITARIO_RISOLVIBILI")
+            or os.path.join(os.path.dirname(os.path.abspath(__file__)), "risolvibili.dat"))
+
+
+class ElencoRisolvibili:
+    """Partite risolvibili precalcolate, lette dal file mappato in memoria.
+
+    Le voci hanno tutte la stessa dimensione e sono raggruppate per fascia di difficoltà,
+    quindi scegliere una partita costa un accesso al file, qualunque sia la sua dimensione.
+    """
+
+    def __init__(self, nome_file=None):
+        with open(nome_file or file_risolvibili(), 'rb') as f:
+            self._mappa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, versione, *quante = _INTESTAZIONE_RISOLVIBILI.unpack_from(self._mappa)
+        totale = sum(quante)
+        if (magic != MAGIC_RISOLVIBILI or versione != VERSIONE_RISOLVIBILI
+                or len(self._mappa) != _INTESTAZIONE_RISOLVIBILI.size + totale * _VOCE_RISOLVIBILE.size):
+            self._mappa.close()
+            raise ValueError("Elenco delle partite risolvibili non valido.")
+        self.fasce = {}     # difficoltà: (prima voce, numero di voci)
+        inizio = 0
+        for difficolta, n in zip(DIFFICOLTA, quante):
+            self.fasce[difficolta] = (inizio, n)
+            inizio += n
+        self.fasce[QUALSIASI] = (0, totale)
+
+    def __len__(self):
+        return self.fasce[QUALSIASI][1]
+
+    def voce(self, indice):
+        """(seme, mosse della soluzione, mosse con le pescate, nodi del risolutore)"""
+        return _VOCE_RISOLVIBILE.unpack_from(
+            self._mappa, _INTESTAZIONE_RISOLVIBILI.size + indice * _VOCE_RISOLVIBILE.size)
+
+    def scegli(self, difficolta=QUALSIASI, rng=random):
+        """Numero di una partita risolvibile a caso della fascia indicata"""
+        inizio, n = self.fasce[difficolta]
+        if not n:
+            raise ValueError(f"Nessuna partita risolvibile di difficoltà {difficolta}.")
+        return self.voce(inizio + rng.randrange(n))[0]
+
+    def chiudi(self):
+        self._mappa.close()
+
+
+_elenco_risolvibili = None
+
+
+def elenco_risolvibili():
+    """Elenco delle partite risolvibili, aperto una volta sola; None se il file non c'è"""
+    global _elenco_risolvibili
+    if _elenco_risolvibili is None:
+        try:
+            _elenco_risolvibili = ElencoRisolvibili()
+        except (OSError, ValueError):
+            return None
+    return _elenco_risolvibili
+
+
+class Solitario(Motore):
+    """Partita interattiva: aggiunge al motore tempo, grafica e salvataggi"""
+
+    def __init__(self, modalita="normale", tema="classico", tempo_limite=None, seme=None,
+                 riciclo=RICICLO_MESCOLATO, risolvibile=None):
+        # risolvibile: una fascia di DIFFICOLTA (o QUALSIASI) per giocare una partita che si può vincere
+        if risolvibile is not None and seme is None:
+            elenco = elenco_risolvibili()
+            if elenco is None:
+                raise ValueError("Elenco delle partite risolvibili non disponibile: "
+                                 "eseguire prima costruisci_risolvibili.py")
+            seme = elenco.scegli(risolvibile)
+        super().__init__(modalita, seme=seme, riciclo=riciclo)
+        self.tempo_inizio = time.time()
+        self.tema = tema
+        if modalita == "tempo":
+            self.tempo_limite = tempo_limite if tempo_limite is not None else 600
+        else:
+            self.tempo_limite = None
+        self.file_salvataggio = None    # ultimo salvataggio binario, che riceve il diario delle mosse
+        self._diario_file = None
+
+    @classmethod
+    def da_istantanea(cls, dati, tema="classico", tempo_limite=None):
+        """Partita giocabile con lo stato di un'istantanea; il tempo riparte da zero"""
+        gioco = super().da_istantanea(dati)
+        gioco.tempo_inizio = time.time()
+        gioco.tema = tema
+        if gioco.modalita == "tempo":
+            gioco.tempo_limite = tempo_limite if tempo_limite is not None else 600
         else:
-            print(f"Carta non posizionabile nella pila finale. Serviva: {'A' if not pila else VALORI[pila[-1].valore_numerico()]}.")
-            return False
+            gioco.tempo_limite = None
+        gioco.file_salvataggio = None
+        gioco._diario_file = None
+        return gioco
 
-    def controlla_vittoria(self):
-        """Verifica se il gioco è stato vinto"""
-        return all(len(p) == 13 for p in self.pile_finali.values())
+    @property
+    def pile_finali(self):
+        """Pile finali come viste Carta, per seme (per grafica e salvataggi)"""
+        return {seme: [Carta.da_codice(s * 13 + r, True, self.tema) for r in range(self.fondazioni[s])]
+                for s, seme in enumerate(SEMI)}
+
+    RIGA_OROLOGIO = 1   # riga di righe_schermo() con il tempo (l'intestazione)
+
+    def tempo_rimanente(self):
+        """Secondi che restano nella modalità a tempo (None nelle altre modalità)"""
+        if self.modalita != "tempo":
+            return None
+        return max(0.0, self.tempo_limite - (time.time() - self.tempo_inizio))
+
+    def tempo_scaduto(self):
+        return self.modalita == "tempo" and self.tempo_rimanente() == 0
+
+    def prossimo_scatto(self):
+        """Secondi che mancano al prossimo cambiamento dell'orologio mostrato"""
+        return 1.0 - (time.time() - self.tempo_inizio) % 1.0
+
+    def riga_intestazione(self):
+        """Riga dell'intestazione: modalità, punteggio, tempo (rimanente nella modalità a tempo) e mosse"""
+        tempo_trascorso = int(time.time() - self.tempo_inizio)
+        if self.modalita == "tempo":
+            tempo_trascorso = max(0, self.tempo_limite - tempo_trascorso)
+        minuti = tempo_trascorso // 60
+        secondi = tempo_trascorso % 60
+        tempo_str = f"Tempo: {minuti:02d}:{secondi:02d}"
+        return (f"║ SOLITARIO ({self.modalita.upper()})    Punteggio: {self.punteggio:<5} "
+                f"{tempo_str} Mosse: {self.mosse:<3} ║")
+
+    def righe_schermo(self):
+        """Compone il tavolo da gioco come lista di righe di testo"""
+        glifi = glifi_tema(self.tema)
+        righe = [
+            "╔═══════════════════════════════════════════════════════════════╗",
+            self.riga_intestazione(),
+            "╚═══════════════════════════════════════════════════════════════╝",
+            "",
+        ]
+        pile = "   ".join(f"{seme}: {glifi[s * 13 + self.fondazioni[s] - 1] if self.fondazioni[s] else '__'}"
+                          for s, seme in enumerate(SEMI))
+        righe.append(f"📌 PILE FINALI:  {pile}")
+        scarto = glifi[self.scarti[-1]] if self.scarti else '__'
+        righe.append(f"📌 RISERVA:  Scarti: {scarto}   Carte nel mazzo: {len(self.riserva)}    "
+                     f"Partita {self.id_partita}")
+        righe.append("")
+        righe.append("📌 COLONNE:")
+        for i, col in enumerate(self.colonne):
+            coperte = self.coperte[i]
+            carte = " ".join([CARTA_COPERTA] * coperte + [glifi[c] for c in col[coperte:]])
+            righe.append(f"{Fore.YELLOW}Colonna {i+1}:{Style.RESET_ALL} {carte}")
+        return righe
+
+    def mostra(self):
+        """Stampa il tavolo da gioco (con una sola scrittura)"""
+        sys.stdout.write("\n".join(self.righe_schermo()) + "\n")
+
+    def _vista_colonna(self, idx):
+        """Carte di una colonna come viste Carta"""
+        coperte = self.coperte[idx]
+        return [Carta.da_codice(c, j >= coperte, self.tema) for j, c in enumerate(self.colonne[idx])]
         
     def salva_partita(self, nome_file=None):
-        """Salva lo stato attuale della partita"""
-        if nome_file is None:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            nome_file = f"solitario_salvataggio_{timestamp}.json"
+        """Salva lo stato attuale della partita.
+
+        Per default usa il formato binario compatto (.sol); se il nome finisce in .json
+        scrive il vecchio formato JSON. Il file viene scritto in un file temporaneo e poi
+        rinominato, così un salvataggio interrotto non rovina quello precedente. Dopo un
+        salvataggio binario le mosse successive vengono aggiunte al suo diario.
+        Un nome senza cartella finisce nella cartella dei salvataggi, che è indicizzata.
+        """
+        with STRUMENTI.misura("salvataggio"):
+            if nome_file is None:
+                nome_file = self.file_salvataggio
+            if nome_file is None:
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+                nome_file = f"solitario_{self.seme}_{timestamp}{ESTENSIONE_SALVATAGGIO}"
+            if not os.path.dirname(nome_file):
+                nome_file = os.path.join(cartella_salvataggi(), nome_file)
+            indicizzato = os.path.dirname(os.path.abspath(nome_file)) == os.path.abspath(
+                cartella_salvataggi(crea=False))
         
-        dati = {
-            'riserva': [carta.to_dict() for carta in self.riserva],
-            'scarti': [carta.to_dict() for carta in self.scarti],
-            'colonne': [[carta.to_dict() for carta in colonna] for colonna in self.colonne],
+            try:
+                if nome_file.endswith(".json"):
+                    contenuto = json.dumps(self._dati_json(), ensure_ascii=False, indent=2).encode('utf-8')
+                else:
+                    contenuto = self.in_bytes()
+                scrivi_atomico(nome_file, contenuto)
+                if not nome_file.endswith(".json"):
+                    self.attiva_diario(nome_file, contenuto)
+                if indicizzato:
+                    archivio_salvataggi().registra(os.path.basename(nome_file))
+                print(f"Partita salvata in: {nome_file}")
+                return True
+            except Exception as e:
+                print(f"Errore durante il salvataggio: {e}")
+                return False
+
+    def _dati_json(self):
+        return {
+            'riserva': [Carta.da_codice(c, False).to_dict() for c in self.riserva],
+            'scarti': [Carta.da_codice(c).to_dict() for c in self.scarti],
+            'colonne': [[carta.to_dict() for carta in self._vista_colonna(i)] for i in range(7)],
             'pile_finali': {seme: [carta.to_dict() for carta in pila] for seme, pila in self.pile_finali.items()},
             'punteggio': self.punteggio,
             'mosse': self.mosse,
             'tempo_gioco': int(time.time() - self.tempo_inizio),
             'modalita': self.modalita,
             'tema': self.tema,
-            'tempo_limite': self.tempo_limite   # <--- AGGIUNTA QUI
+            'tempo_limite': self.tempo_limite,   # <--- AGGIUNTA QUI
+            'seme': self.seme,
+            'riciclo': self.riciclo,
+            'ricicli': self.ricicli
         }
-        
-        try:
-            with open(nome_file, 'w', encoding='utf-8') as f:
-                json.dump(dati, f, ensure_ascii=False, indent=2)
-            print(f"Partita salvata in: {nome_file}")
-            return True
-        except Exception as e:
-            print(f"Errore durante il salvataggio: {e}")
-            return False
+
+    def in_bytes(self):
+        """Stato della partita nel formato binario: intestazione e un byte per carta"""
+        intestazione = _INTESTAZIONE_SALVATAGGIO.pack(
+            MAGIC_SALVATAGGIO, VERSIONE_SALVATAGGIO,
+            _codice_opzione(MODALITA, self.modalita), _codice_opzione(TEMI, self.tema),
+            _codice_opzione(RICICLI, self.riciclo), self.seme, self.tempo_limite or 0,
+            self.punteggio, self.mosse, int(time.time() - self.tempo_inizio), self.ricicli,
+            *self.fondazioni, *(len(col) for col in self.colonne), *self.coperte,
+            len(self.riserva), len(self.scarti))
+        carte = bytearray()
+        for col in self.colonne:
+            carte += bytes(col)
+        carte += bytes(self.riserva)
+        carte += bytes(self.scarti)
+        return intestazione + bytes(carte)
+
+    @classmethod
+    def da_bytes(cls, dati):
+        """Ricostruisce una partita dal formato binario di in_bytes() (senza diario)"""
+        (magic, versione, modalita, tema, riciclo, seme, tempo_limite, punteggio, mosse,
+         tempo_gioco, ricicli, *resto) = _INTESTAZIONE_SALVATAGGIO.unpack_from(dati)
+        if magic != MAGIC_SALVATAGGIO or versione != VERSIONE_SALVATAGGIO:
+            raise ValueError("Formato di salvataggio non riconosciuto.")
+        gioco = cls.__new__(cls)
+        gioco._stato_vuoto()
+        gioco.modalita = MODALITA[modalita]
+        gioco.tema = TEMI[tema]
+        gioco.riciclo = RICICLI[riciclo]
+        gioco.seme = seme
+        gioco.tempo_limite = tempo_limite or None
+        gioco.punteggio = punteggio
+        gioco.mosse = mosse
+        gioco.tempo_inizio = time.time() - tempo_gioco
+        gioco.ricicli = ricicli
+        gioco.fondazioni = resto[:4]
+        lunghezze = resto[4:11]
+        gioco.coperte = resto[11:18]
+        n_riserva, n_scarti = resto[18:20]
+        pos = _INTESTAZIONE_SALVATAGGIO.size
+        for i, n in enumerate(lunghezze):
+            gioco.colonne[i] = list(dati[pos:pos + n])
+            pos += n
+        gioco.riserva = list(dati[pos:pos + n_riserva])
+        pos += n_riserva
+        gioco.scarti = list(dati[pos:pos + n_scarti])
+        gioco.file_salvataggio = None
+        gioco._diario_file = None
+        return gioco
+
+    @classmethod
+    def _da_dati_json(cls, dati):
+        gioco = cls.__new__(cls)
+        # Inizializza attributi di default (come fa __init__)
+        gioco._stato_vuoto()
+        # I salvataggi più vecchi non hanno il numero di partita: se ne assegna uno nuovo
+        gioco.seme = dati.get('seme')
+        if gioco.seme is None:
+            gioco.seme = nuovo_seme()
+        gioco.riciclo = dati.get('riciclo', RICICLO_MESCOLATO)
+        gioco.ricicli = dati.get('ricicli', 0)
+        gioco.tempo_inizio = time.time()
+        gioco.modalita = dati.get('modalita', 'normale')
+        gioco.tema = dati.get('tema', 'classico')
+        gioco.tempo_limite = dati.get('tempo_limite', 600 if gioco.modalita == "tempo" else None)
+        gioco.file_salvataggio = None
+        gioco._diario_file = None
+
+        # Sovrascrivi con i dati del salvataggio
+        gioco.riserva = [Carta.from_dict(c).codice for c in dati['riserva']]
+        gioco.scarti = [Carta.from_dict(c).codice for c in dati['scarti']]
+        for i, colonna in enumerate(dati['colonne']):
+            carte = [Carta.from_dict(c) for c in colonna]
+            gioco.colonne[i] = [carta.codice for carta in carte]
+            # Le carte coperte sono quelle in fondo, prima della prima scoperta
+            gioco.coperte[i] = next((j for j, carta in enumerate(carte) if carta.scoperta), len(carte))
+        for seme, pila in dati['pile_finali'].items():
+            gioco.fondazioni[SEMI.index(seme)] = len(pila)
+        gioco.punteggio = dati['punteggio']
+        gioco.mosse = dati['mosse']
+        gioco.tempo_inizio = time.time() - dati['tempo_gioco']
+        return gioco
     
     @classmethod
     def carica_partita(cls, nome_file):
-        """Carica una partita salvata"""
-        try:
-            with open(nome_file, 'r', encoding='utf-8') as f:
-                dati = json.load(f)
-            
-            gioco = cls.__new__(cls)
-            # Inizializza attributi di default (come fa __init__)
-            gioco.mazzo = []
-            gioco.colonne = [[] for _ in range(7)]
-            gioco.pile_finali = {seme: [] for seme in SEMI}
-            gioco.riserva = []
-            gioco.scarti = []
-            gioco.punteggio = 0
-            gioco.tempo_inizio = time.time()
-            gioco.mosse = 0
-            gioco.modalita = dati.get('modalita', 'normale')
-            gioco.tema = dati.get('tema', 'classico')
-            gioco.tempo_limite = dati.get('tempo_limite', 600 if gioco.modalita == "tempo" else None)
-
-            # Sovrascrivi con i dati del salvataggio
-            gioco.riserva = [Carta.from_dict(c) for c in dati['riserva']]
-            gioco.scarti = [Carta.from_dict(c) for c in dati['scarti']]
-            gioco.colonne = [[Carta.from_dict(c) for c in colonna] for colonna in dati['colonne']]
-            gioco.pile_finali = {seme: [Carta.from_dict(c) for c in pila] for seme, pila in dati['pile_finali'].items()}
-            gioco.punteggio = dati['punteggio']
-            gioco.mosse = dati['mosse']
-            gioco.tempo_inizio = time.time() - dati['tempo_gioco']
-
-            print(f"Partita caricata da: {nome_file}")
-            return gioco
-        except Exception as e:
-            print(f"Errore durante il caricamento: {e}")
-            return None
+        """Carica una partita salvata (formato binario con il suo diario, o JSON)"""
+        with STRUMENTI.misura("caricamento"):
+            try:
+                with open(nome_file, 'rb') as f:
+                    contenuto = f.read()
+                if contenuto.startswith(MAGIC_SALVATAGGIO):
+                    gioco = cls.da_bytes(contenuto)
+                    # Rigioca le mosse fatte dopo l'ultimo salvataggio e continua il diario
+                    for tipo, da, a in leggi_diario(nome_file + ESTENSIONE_DIARIO, contenuto):
+                        gioco._rigioca(tipo, da, a)
+                    gioco.attiva_diario(nome_file, contenuto, nuovo=False)
+                else:
+                    gioco = cls._da_dati_json(json.loads(contenuto.decode('utf-8')))
+
+                print(f"Partita caricata da: {nome_file}")
+                return gioco
+            except Exception as e:
+                print(f"Errore durante il caricamento: {e}")
+                return None
+
+    def attiva_diario(self, nome_file, istantanea, nuovo=True):
+        """Aggiunge d'ora in poi ogni mossa al diario del salvataggio nome_file.
+
+        Il diario comincia con l'impronta dell'istantanea a cui si riferisce: se non
+        corrisponde al salvataggio (per esempio dopo un crash durante un salvataggio)
+        viene ignorato e ricominciato da capo, altrimenti le mosse aggiunte andrebbero
+        perse al caricamento successivo. Con nuovo=True viene ricominciato comunque.
+        """
+        self.chiudi_diario()
+        nome_diario = nome_file + ESTENSIONE_DIARIO
+        intestazione = MAGIC_DIARIO + struct.pack("<I", zlib.crc32(istantanea))
+        if not nuovo:
+            try:
+                with open(nome_diario, 'rb') as f:
+                    nuovo = f.read(len(intestazione)) != intestazione
+            except FileNotFoundError:
+                nuovo = True
+        if nuovo:
+            scrivi_atomico(nome_diario, intestazione)
+        self._diario_file = open(nome_diario, 'ab')
+        self.file_salvataggio = nome_file
+
+    def chiudi_diario(self):
+        if getattr(self, '_diario_file', None) is not None:
+            self._diario_file.close()
+            self._diario_file = None
+
+    def _annota(self, tipo, da=0, a=0):
+        """Aggiunge una voce al diario (3 byte), se attivo"""
+        if self._diario_file is not None:
+            self._diario_file.write(_VOCE_DIARIO.pack(tipo, da, a))
+            self._diario_file.flush()
+
+    def _rigioca(self, tipo, da, a):
+        if tipo == DIARIO_ANNULLA:
+            self.annulla()
+        elif tipo == DIARIO_RIPETI:
+            self.ripeti()
+        else:
+            self.applica((tipo, da, a))
+
+    def applica(self, mossa):
+        esito = super().applica(mossa)
+        if riuscita(esito):
+            self._annota(*mossa)
+        return esito
+
+    def annulla(self):
+        esito = super().annulla()
+        if esito == OK:
+            self._annota(DIARIO_ANNULLA)
+        return esito
+
+    def ripeti(self):
+        esito = super().ripeti()
+        if esito == OK:
+            self._annota(DIARIO_RIPETI)
+        return esito
 
     def mostra_aiuto(self):
         """Mostra le regole e i comandi del gioco"""
@@ -375,6 +1918,9 @@ class Solitario:
         print("3 scarti - Sposta carta dagli scarti alla pila finale")
         print("3 colonna [num] - Sposta carta dalla colonna alla pila finale")
         print("4 [colonna] - Sposta dagli scarti alla colonna indicata")
+        print("a - Annulla l'ultima mossa")
+        print("r - Ripeti la mossa annullata")
+        print("p - Stima la probabilità di vincere da questa posizione")
         print("5 - Salva partita")
         print("6 - Carica partita")
         print("7 - Aiuto (mostra questo menu)")
@@ -391,58 +1937,641 @@ class Solitario:
         if self.modalita == "tempo" and int(time.time() - self.tempo_inizio) <= self.tempo_limite:
             print("\n🎯 Obiettivo raggiunto: Hai completato il gioco entro il tempo limite!")
 
+    def descrivi_mossa(self, mossa):
+        """Descrive a parole una mossa, con il comando tra parentesi quadre"""
+        if mossa is None:
+            return "Nessuna mossa consigliata: valuta di pescare o rimescolare gli scarti."
+        tipo, da, a = mossa
+        comando = comando_mossa(mossa)
+        if tipo == PESCA:
+            return f"Pesca una carta dal mazzo. [{comando}]"
+        if tipo == FINALE:
+            if da == SCARTI:
+                carta = Carta.da_codice(self.scarti[-1], True, self.tema)
+                return f"Sposta la carta {carta} dagli scarti alla pila finale. [{comando}]"
+            carta = Carta.da_codice(self.cima(da), True, self.tema)
+            return f"Sposta la carta {carta} dalla colonna {da+1} alla pila finale. [{comando}]"
+        if da == SCARTI:
+            carta = Carta.da_codice(self.scarti[-1], True, self.tema)
+            if not self.colonne[a]:
+                return f"Sposta il Re {carta} dagli scarti alla colonna vuota {a+1}. [{comando}]"
+            return f"Sposta la carta {carta} dagli scarti alla colonna {a+1}. [{comando}]"
+        gruppo = ', '.join(str(Carta.da_codice(c, True, self.tema)) for c in self.colonne[da][-self.lunghezza_gruppo(da):])
+        vuota = "vuota " if not self.colonne[a] else ""
+        return f"Sposta il gruppo {gruppo} dalla colonna {da+1} alla colonna {vuota}{a+1}. [{comando}]"
+
     def consiglia_mossa(self):
         """Suggerisce la prossima mossa migliore in base alla situazione attuale."""
-        # 1. Prova a spostare una carta scoperta nelle pile finali
-        for idx, col in enumerate(self.colonne):
-            if col and col[-1].scoperta:
-                carta = col[-1]
-                pila = self.pile_finali[carta.seme]
-                if (not pila and carta.valore == 'A') or (pila and carta.valore_numerico() == pila[-1].valore_numerico() + 1):
-                    return (f"Sposta la carta {carta} dalla colonna {idx+1} alla pila finale. "
-                            f"[3 colonna {idx+1}]")
-        # 2. Prova a spostare dagli scarti alla pila finale
-        if self.scarti:
-            carta = self.scarti[-1]
-            pila = self.pile_finali[carta.seme]
-            if (not pila and carta.valore == 'A') or (pila and carta.valore_numerico() == pila[-1].valore_numerico() + 1):
-                return f"Sposta la carta {carta} dagli scarti alla pila finale. [3 scarti]"
-        # 3. Prova a spostare dagli scarti a una colonna
-        if self.scarti:
-            carta = self.scarti[-1]
-            for idx, col in enumerate(self.colonne):
-                if not col and carta.valore == 'K':
-                    return f"Sposta il Re {carta} dagli scarti alla colonna vuota {idx+1}. [4 {idx+1}]"
-                elif col and COLORI[col[-1].seme] != COLORI[carta.seme] and carta.valore_numerico() == col[-1].valore_numerico() - 1:
-                    return f"Sposta la carta {carta} dagli scarti alla colonna {idx+1}. [4 {idx+1}]"
-        # 4. Prova a spostare tra colonne
-        for da_idx, col in enumerate(self.colonne):
-            for i in range(len(col)):
-                if col[i].scoperta:
-                    gruppo = col[i:]
-                    for a_idx, dest in enumerate(self.colonne):
-                        if da_idx == a_idx:
-                            continue
-                        # EVITA di suggerire lo spostamento su una colonna vuota se il gruppo è l'intera colonna
-                        if not dest and gruppo[0].valore == 'K' and i > 0:
-                            return (f"Sposta il gruppo {', '.join(str(c) for c in gruppo)} dalla colonna {da_idx+1} "
-                                    f"alla colonna vuota {a_idx+1}. [2 {da_idx+1} {a_idx+1}]")
-                        elif dest and COLORI[dest[-1].seme] != COLORI[gruppo[0].seme] and gruppo[0].valore_numerico() == dest[-1].valore_numerico() - 1:
-                            return (f"Sposta il gruppo {', '.join(str(c) for c in gruppo)} dalla colonna {da_idx+1} "
-                                    f"alla colonna {a_idx+1}. [2 {da_idx+1} {a_idx+1}]")
-                    break
-        # 5. Se nessuna mossa, consiglia di pescare
-        if self.riserva:
-            return "Pesca una carta dal mazzo. [1]"
-        return "Nessuna mossa consigliata: valuta di pescare o rimescolare gli scarti."
+        return self.descrivi_mossa(self.analizza().mossa)
+
+    def messaggio_esito(self, esito, mossa=None):
+        """Testo da mostrare al giocatore per l'esito di una mossa ('' se non c'è nulla da dire)"""
+        messaggio = MESSAGGI_ESITO.get(esito, "")
+        if esito == ERR_NON_IN_FINALE and mossa is not None:
+            da = mossa[1]
+            carta = self.scarti[-1] if da == SCARTI else self.colonne[da][-1]
+            messaggio += f" Serviva: {VALORI[self.fondazioni[SEME[carta]]]}."
+        return messaggio
+
+# Formato binario dei salvataggi: intestazione a lunghezza fissa seguita da un byte
+# per ogni carta (colonne, riserva, scarti, nell'ordine)
+MAGIC_SALVATAGGIO = b"SOL1"
+VERSIONE_SALVATAGGIO = 1
+ESTENSIONE_SALVATAGGIO = ".sol"
+_INTESTAZIONE_SALVATAGGIO = struct.Struct("<4sBBBBIHiIIH4B7B7BBB")
+MODALITA = ["normale", "tempo", "difficile"]
+TEMI = ["classico", "blu_verde", "chiaro"]
+RICICLI = [RICICLO_MESCOLATO, RICICLO_STANDARD]
+
+# Diario delle mosse: intestazione (magic + crc32 dell'istantanea) e voci di 3 byte (tipo, da, a)
+MAGIC_DIARIO = b"SOLD"
+ESTENSIONE_DIARIO = ".diario"
+_VOCE_DIARIO = struct.Struct("<Bbb")
+DIARIO_ANNULLA = 10
+DIARIO_RIPETI = 11
+
+
+def _codice_opzione(valori, valore):
+    return valori.index(valore) if valore in valori else 0
+
+
+def scrivi_atomico(nome_file, contenuto, durevole=True):
+    """Scrive un file passando da un file temporaneo rinominato alla fine.
+    Con durevole=False non aspetta che i dati arrivino sul disco (niente fsync)."""
+    temporaneo = f"{nome_file}.{os.getpid()}.tmp"
+    with open(temporaneo, 'wb') as f:
+        f.write(contenuto)
+        if durevole:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(temporaneo, nome_file)
+
+
+def leggi_diario(nome_diario, istantanea):
+    """Voci (tipo, da, a) del diario, se si riferisce all'istantanea data"""
+    try:
+        with open(nome_diario, 'rb') as f:
+            dati = f.read()
+    except FileNotFoundError:
+        return []
+    intestazione = MAGIC_DIARIO + struct.pack("<I", zlib.crc32(istantanea))
+    if not dati.startswith(intestazione):
+        return []
+    corpo = dati[len(intestazione):]
+    # Un'eventuale voce scritta a metà (crash durante la scrittura) viene scartata
+    corpo = corpo[:len(corpo) - len(corpo) % _VOCE_DIARIO.size]
+    return list(_VOCE_DIARIO.iter_unpack(corpo))
+
+
+class _Misura:
+    """Cronometro di una singola operazione (usato con with)"""
+    __slots__ = ("strumenti", "nome", "inizio")
+
+    def __init__(self, strumenti, nome):
+        self.strumenti = strumenti
+        self.nome = nome
+
+    def __enter__(self):
+        self.inizio = time.perf_counter()
+        return self
+
+    def __exit__(self, *eccezione):
+        self.strumenti.registra(self.nome, time.perf_counter() - self.inizio)
+        return False
+
+
+class _NessunaMisura:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *eccezione):
+        return False
+
+
+_NESSUNA_MISURA = _NessunaMisura()
+_SECCHI = 26    # secchio k: durate tra 2^(k-1) e 2^k microsecondi (l'ultimo raccoglie il resto)
+
+
+class Strumentazione:
+    """Conteggi e istogrammi delle latenze delle operazioni del gioco.
+
+    Spenta per default: misura() restituisce un contesto vuoto e non registra nulla.
+    Si accende con la variabile d'ambiente SOLITARIO_STATISTICHE (1, oppure il nome di
+    un file) o con l'opzione --statistiche [file]. Con un file le statistiche vengono
+    esportate in JSON mentre si gioca (al massimo ogni `intervallo` secondi); all'uscita
+    viene stampato un riepilogo.
+    """
+
+    def __init__(self):
+        self.attiva = False
+        self.file = None
+        self.intervallo = 5.0
+        self.dati = {}      # nome: [conteggio, totale, massimo, istogramma]
+        self._ultima_esportazione = 0.0
+
+    def attiva_misure(self, nome_file=None):
+        if not self.attiva:
+            atexit.register(self.termina)
+        self.attiva = True
+        self.file = nome_file
+
+    def misura(self, nome):
+        return _Misura(self, nome) if self.attiva else _NESSUNA_MISURA
+
+    def registra(self, nome, durata):
+        voce = self.dati.get(nome)
+        if voce is None:
+            voce = self.dati[nome] = [0, 0.0, 0.0, [0] * _SECCHI]
+        voce[0] += 1
+        voce[1] += durata
+        if durata > voce[2]:
+            voce[2] = durata
+        voce[3][min(_SECCHI - 1, int(durata * 1e6).bit_length())] += 1
+        if self.file and time.monotonic() - self._ultima_esportazione >= self.intervallo:
+            self.esporta()
+
+    @staticmethod
+    def _percentile(istogramma, conteggio, p):
+        """Limite superiore (in secondi) del secchio che contiene il percentile p"""
+        soglia = p * conteggio
+        cumulato = 0
+        for k, n in enumerate(istogramma):
+            cumulato += n
+            if cumulato >= soglia:
+                return (1 << k) / 1e6
+        return (1 << (_SECCHI - 1)) / 1e6
+
+    def statistiche(self):
+        risultato = {}
+        for nome, (conteggio, totale, massimo, istogramma) in sorted(self.dati.items()):
+            risultato[nome] = {
+                "conteggio": conteggio,
+                "media_ms": totale / conteggio * 1000,
+                "p50_ms": min(self._percentile(istogramma, conteggio, 0.5), massimo) * 1000,
+                "p95_ms": min(self._percentile(istogramma, conteggio, 0.95), massimo) * 1000,
+                "massimo_ms": massimo * 1000,
+                "istogramma_us": {f"<{1 << k}": n for k, n in enumerate(istogramma) if n},
+            }
+        return risultato
+
+    def esporta(self, nome_file=None):
+        self._ultima_esportazione = time.monotonic()
+        scrivi_atomico(nome_file or self.file,
+                       json.dumps(self.statistiche(), indent=2).encode('utf-8'))
+
+    def riepilogo(self):
+        righe = [f"{'operazione':<22}{'n':>7}{'media ms':>11}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}"]
+        for nome, s in self.statistiche().items():
+            righe.append(f"{nome:<22}{s['conteggio']:>7}{s['media_ms']:>11.2f}{s['p50_ms']:>10.2f}"
+                         f"{s['p95_ms']:>10.2f}{s['massimo_ms']:>10.2f}")
+        return "\n".join(righe)
+
+    def termina(self):
+        if not self.dati:
+            return
+        if self.file:
+            self.esporta()
+        print("\n📊 Statistiche delle prestazioni (p50/p95 approssimati per eccesso dall'istogramma):",
+              file=sys.stderr)
+        print(self.riepilogo(), file=sys.stderr)
+
+
+STRUMENTI = Strumentazione()
+if os.environ.get("SOLITARIO_STATISTICHE"):
+    _valore = os.environ["SOLITARIO_STATISTICHE"]
+    STRUMENTI.attiva_misure(None if _valore in ("1", "si", "true") else _valore)
+
+
+COLORI_ANSI = re.compile(r"\x1b\[[0-9;]*m")    # colori di colorama, da togliere dove non servono
+
+
+class Schermo:
+    """Disegna i fotogrammi del gioco aggiornando solo le righe cambiate.
+
+    Ogni fotogramma è una lista di righe: quelle uguali al fotogramma precedente non
+    vengono riscritte, le altre si raggiungono con le sequenze ANSI di posizionamento del
+    cursore, e tutto viene scritto con una sola write. Se il fotogramma non entra nel
+    terminale, o dopo invalida(), si ridisegna tutto (sempre senza lanciare processi).
+    Senza `altezza` si usa quella del terminale, letta a ogni fotogramma.
+    """
+
+    def __init__(self, uscita=None, altezza=None):
+        self.uscita = uscita if uscita is not None else sys.stdout
+        self.altezza = altezza
+        self._precedenti = None
+
+    def invalida(self):
+        """Da chiamare quando qualcun altro ha scritto sul terminale"""
+        self._precedenti = None
+
+    def disegna(self, righe):
+        altezza = self.altezza or shutil.get_terminal_size().lines
+        precedenti = self._precedenti
+        if precedenti is None or len(righe) >= altezza:
+            parti = ["\x1b[H\x1b[2J", "\n".join(righe), "\n"]
+            # Se il fotogramma fa scorrere il terminale, le righe non sono più dove le avevamo messe
+            self._precedenti = list(righe) if len(righe) < altezza else None
+        else:
+            parti = []
+            for n, riga in enumerate(righe):
+                if n >= len(precedenti) or precedenti[n] != riga:
+                    parti.append(f"\x1b[{n + 1};1H{riga}\x1b[K")
+            # Cursore sotto il fotogramma, cancellando quello che c'era (vecchi comandi e messaggi)
+            parti.append(f"\x1b[{len(righe) + 1};1H\x1b[J")
+            self._precedenti = list(righe)
+        self.uscita.write("".join(parti))
+        self.uscita.flush()
+
+    def aggiorna_riga(self, n, riga):
+        """Riscrive solo i caratteri cambiati della riga n del fotogramma, lasciando il cursore
+        dov'è (per esempio mentre il giocatore scrive un comando). Le colonne si contano in
+        caratteri, quindi prima della parte cambiata non devono esserci emoji o sequenze ANSI."""
+        precedenti = self._precedenti
+        if precedenti is None or n >= len(precedenti) or precedenti[n] == riga:
+            return
+        vecchia = precedenti[n]
+        inizio = 0
+        while inizio < min(len(vecchia), len(riga)) and vecchia[inizio] == riga[inizio]:
+            inizio += 1
+        if len(vecchia) == len(riga):
+            fine = len(riga)
+            while fine > inizio and vecchia[fine - 1] == riga[fine - 1]:
+                fine -= 1
+            pezzo = riga[inizio:fine]
+        else:
+            pezzo = riga[inizio:] + "\x1b[K"
+        # Salva il cursore, scrive il pezzo al suo posto e rimette il cursore dov'era
+        self.uscita.write(f"\x1b7\x1b[{n + 1};{inizio + 1}H{pezzo}\x1b8")
+        self.uscita.flush()
+        precedenti[n] = riga
+
+
+class LettoreComandi:
+    """Legge i comandi del giocatore senza fermare l'orologio.
+
+    Su un terminale POSIX il terminale passa in modalità cbreak e un selettore aspetta insieme
+    i tasti e il prossimo scatto dell'orologio: a ogni secondo si riscrive solo il tempo
+    nell'intestazione, e nella modalità a tempo la lettura finisce appena il tempo scade (senza
+    aspettare INVIO). Il testo si modifica con il tasto indietro; le sequenze di escape dei
+    tasti speciali (frecce, Home, Fine...) vengono scartate. Altrove (Windows, input
+    rediretto) si usa input(), come prima.
+    """
+
+    def __init__(self, schermo, entrata=None):
+        self.schermo = schermo
+        self.entrata = entrata if entrata is not None else sys.stdin
+        self._in_attesa = ""    # tasti arrivati dopo un INVIO, per il comando successivo
+        try:
+            self._fd = self.entrata.fileno()
+            self._attivo = termios is not None and os.isatty(self._fd)
+        except (AttributeError, OSError, ValueError):
+            self._attivo = False
+
+    def leggi(self, messaggio, gioco):
+        """Riga scritta dal giocatore, oppure None se nel frattempo il tempo è scaduto"""
+        if not self._attivo:
+            riga = input(messaggio)
+            return None if gioco.tempo_scaduto() else riga
+        uscita = self.schermo.uscita
+        uscita.write(messaggio)
+        uscita.flush()
+        decodifica = codecs.getincrementaldecoder("utf-8")("replace")
+        testo = []
+        vecchie = termios.tcgetattr(self._fd)
+        selettore = selectors.DefaultSelector()
+        selettore.register(self._fd, selectors.EVENT_READ)
+        try:
+            tty.setcbreak(self._fd)
+            while True:
+                while self._in_attesa:
+                    tasto, self._in_attesa = self._in_attesa[0], self._in_attesa[1:]
+                    if tasto in "\r\n":
+                        uscita.write("\n")
+                        uscita.flush()
+                        return "".join(testo)
+                    if tasto in "\x7f\b":
+                        if testo:
+                            testo.pop()
+                            uscita.write("\b \b")
+                    elif tasto == "\x04" and not testo:
+                        raise EOFError
+                    elif tasto == "\x1b":
+                        self._scarta_sequenza(selettore, decodifica)
+                    elif tasto.isprintable():
+                        testo.append(tasto)
+                        uscita.write(tasto)
+                uscita.flush()
+                if gioco.tempo_scaduto():
+                    uscita.write("\n")
+                    return None
+                # Nessuna attesa attiva: si dorme fino al prossimo tasto o al prossimo secondo
+                if selettore.select(gioco.prossimo_scatto()):
+                    self._in_attesa += decodifica.decode(os.read(self._fd, 1024))
+                else:
+                    self.schermo.aggiorna_riga(gioco.RIGA_OROLOGIO, gioco.riga_intestazione())
+        finally:
+            termios.tcsetattr(self._fd, termios.TCSADRAIN, vecchie)
+            selettore.close()
+
+    def _scarta_sequenza(self, selettore, decodifica):
+        """Scarta la sequenza CSI (ESC [) o SS3 (ESC O) che segue un ESC già letto, fino
+        al byte finale (da @ a ~) compreso, leggendo senza attendere i byte già arrivati"""
+        introduttore = True
+        while True:
+            if not self._in_attesa:
+                if not selettore.select(0):
+                    return
+                dati = os.read(self._fd, 1024)
+                if not dati:
+                    return
+                self._in_attesa += decodifica.decode(dati)
+                continue
+            tasto = self._in_attesa[0]
+            if introduttore and tasto not in "[O":
+                return      # ESC da solo: il tasto successivo è testo normale
+            self._in_attesa = self._in_attesa[1:]
+            if not introduttore and "@" <= tasto <= "~":
+                return
+            introduttore = False
+
+
+COMANDI_MISURATI = "0123456789arp"    # comandi con un proprio istogramma nella strumentazione
+
+RIGHE_COMANDI = [
+    "",
+    "Comandi:",
+    " [0] 🤖 Consiglio automatico SOLITARIO AI 🤖 ",
+    " [1] Pesca carta",
+    " [2] Sposta da colonna a colonna (es: 2 1 5)",
+    " [3] Sposta carta a pila finale (es: 3 scarti / 3 colonna 4)",
+    " [4] Sposta dagli scarti a colonna (es: 4 3)",
+    " [a] Annulla mossa  [r] Ripeti mossa  [p] Probabilità di vittoria",
+    " [5] Salva partita  [6] Carica partita  [7] Aiuto  [8] Esci  [9] Menu principale",
+]
+
+
+def cartella_salvataggi(crea=True):
+    """Cartella dei salvataggi: ~/.solitario/salvataggi, oppure $SOLITARIO_DIR/salvataggi.
+    Con crea=False restituisce solo il percorso, senza creare la cartella."""
+    base = os.environ.get("SOLITARIO_DIR") or os.path.join(os.path.expanduser("~"), ".solitario")
+    cartella = os.path.join(base, "salvataggi")
+    if crea:
+        os.makedirs(cartella, exist_ok=True)
+    return cartella
+
+
+def leggi_intestazione(nome_file):
+    """Dati descrittivi di un salvataggio, ricostruendo la partita solo se ha un diario"""
+    with open(nome_file, 'rb') as f:
+        inizio = f.read(_INTESTAZIONE_SALVATAGGIO.size)
+        if inizio.startswith(MAGIC_SALVATAGGIO):
+            (_, _, modalita, _, _, seme, _, punteggio, mosse,
+             tempo_gioco, *_) = _INTESTAZIONE_SALVATAGGIO.unpack(inizio)
+            modalita = MODALITA[modalita]
+            contenuto = inizio + f.read()
+            voci = leggi_diario(nome_file + ESTENSIONE_DIARIO, contenuto)
+            if voci:
+                # Punteggio e mosse sono cambiati dopo l'ultimo salvataggio: si rigioca il diario
+                gioco = Solitario.da_bytes(contenuto)
+                for tipo, da, a in voci:
+                    gioco._rigioca(tipo, da, a)
+                punteggio, mosse = gioco.punteggio, gioco.mosse
+        else:
+            f.seek(0)
+            dati = json.load(f)
+            modalita = dati.get('modalita', 'normale')
+            seme = dati.get('seme')
+            punteggio = dati['punteggio']
+            mosse = dati['mosse']
+            tempo_gioco = dati['tempo_gioco']
+    return {'modalita': modalita, 'seme': seme, 'punteggio': punteggio,
+            'mosse': mosse, 'tempo_gioco': tempo_gioco}
+
+
+ORDINAMENTI = {
+    "data": "MAX(data, data_diario) DESC",
+    "punteggio": "punteggio DESC",
+    "mosse": "mosse ASC",
+    "tempo": "tempo_gioco ASC",
+}
+
+
+class ArchivioSalvataggi:
+    """Indice SQLite dei salvataggi di una cartella.
+
+    L'indice tiene modalità, punteggio, mosse, tempo, numero di partita e data di
+    ogni salvataggio, così l'elenco si può ordinare, filtrare e sfogliare senza
+    aprire i file. Viene aggiornato a ogni salvataggio ed eliminazione; sincronizza()
+    lo riallinea ai file presenti nella cartella (copiati o cancellati a mano) e ai
+    loro diari, che cambiano punteggio e mosse dopo l'ultimo salvataggio completo.
+    """
+
+    def __init__(self, cartella=None):
+        self.cartella = cartella or cartella_salvataggi()
+        self.db = sqlite3.connect(os.path.join(self.cartella, "indice.db"))
+        self.db.execute("""CREATE TABLE IF NOT EXISTS salvataggi (
+            nome TEXT PRIMARY KEY, modalita TEXT, punteggio INTEGER, mosse INTEGER,
+            tempo_gioco INTEGER, seme INTEGER, data REAL, dimensione INTEGER,
+            data_diario REAL NOT NULL DEFAULT 0, dimensione_diario INTEGER NOT NULL DEFAULT 0)""")
+        self.db.execute("CREATE TABLE IF NOT EXISTS importati (percorso TEXT PRIMARY KEY)")
+        self.db.commit()
+
+    def percorso(self, nome):
+        return os.path.join(self.cartella, nome)
+
+    def _file(self):
+        """{nome: (data, dimensione, data del diario, dimensione del diario)} dei salvataggi
+        presenti nella cartella; senza diario gli ultimi due valori sono 0"""
+        with os.scandir(self.cartella) as voci:
+            stat = {v.name: v.stat() for v in voci if v.is_file()}
+        presenti = {}
+        for nome, s in stat.items():
+            if nome.endswith((ESTENSIONE_SALVATAGGIO, ".json")):
+                d = stat.get(nome + ESTENSIONE_DIARIO)
+                presenti[nome] = (s.st_mtime, s.st_size,
+                                  d.st_mtime if d else 0, d.st_size if d else 0)
+        return presenti
+
+    def _scrivi_voce(self, nome, stato):
+        try:
+            dati = leggi_intestazione(self.percorso(nome))
+        except Exception:
+            # File illeggibile: non compare nell'elenco finché non cambia
+            self.db.execute("DELETE FROM salvataggi WHERE nome = ?", (nome,))
+            return
+        self.db.execute("INSERT OR REPLACE INTO salvataggi VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (nome, dati['modalita'], dati['punteggio'], dati['mosse'],
+                         dati['tempo_gioco'], dati['seme'], *stato))
+
+    def _stato(self, nome):
+        stat = os.stat(self.percorso(nome))
+        try:
+            diario = os.stat(self.percorso(nome + ESTENSIONE_DIARIO))
+        except FileNotFoundError:
+            return stat.st_mtime, stat.st_size, 0, 0
+        return stat.st_mtime, stat.st_size, diario.st_mtime, diario.st_size
+
+    def registra(self, nome):
+        """Aggiorna la voce di un salvataggio appena scritto"""
+        self._scrivi_voce(nome, self._stato(nome))
+        self.db.commit()
+
+    def importa(self, cartella=os.curdir):
+        """Copia nell'archivio i vecchi salvataggi JSON di una cartella (per default
+        quella di lavoro, dove li scrivevano le versioni precedenti). Ogni file viene
+        importato una volta sola: se poi lo si elimina dall'archivio non ricompare."""
+        cartella = os.path.abspath(cartella)
+        if cartella == os.path.abspath(self.cartella) or not os.path.isdir(cartella):
+            return
+        importati = {riga[0] for riga in self.db.execute("SELECT percorso FROM importati")}
+        for nome in sorted(os.listdir(cartella)):
+            origine = os.path.join(cartella, nome)
+            if not nome.endswith(".json") or origine in importati or not os.path.isfile(origine):
+                continue
+            try:
+                leggi_intestazione(origine)
+            except Exception:
+                continue    # non è un salvataggio
+            if not os.path.exists(self.percorso(nome)):
+                shutil.copy2(origine, self.percorso(nome))
+                self.registra(nome)
+            self.db.execute("INSERT INTO importati VALUES (?)", (origine,))
+        self.db.commit()
+
+    def elimina(self, nome):
+        """Cancella un salvataggio, il suo diario e la sua voce nell'indice"""
+        for file in (nome, nome + ESTENSIONE_DIARIO):
+            try:
+                os.remove(self.percorso(file))
+            except FileNotFoundError:
+                pass
+        self.db.execute("DELETE FROM salvataggi WHERE nome = ?", (nome,))
+        self.db.commit()
+
+    def sincronizza(self):
+        """Riallinea l'indice ai file: rilegge solo quelli nuovi o modificati"""
+        presenti = self._file()
+        indicizzati = {nome: tuple(stato) for nome, *stato in self.db.execute(
+            "SELECT nome, data, dimensione, data_diario, dimensione_diario FROM salvataggi")}
+        for nome in indicizzati.keys() - presenti.keys():
+            self.db.execute("DELETE FROM salvataggi WHERE nome = ?", (nome,))
+        for nome, stato in presenti.items():
+            if indicizzati.get(nome) != stato:
+                self._scrivi_voce(nome, stato)
+        self.db.commit()
+
+    def elenco(self, pagina=0, per_pagina=10, ordine="data", modalita=None):
+        """Una pagina di voci (nome, modalita, punteggio, mosse, tempo_gioco, seme, data)
+        e il numero totale di voci che rispettano il filtro"""
+        filtro, parametri = ("WHERE modalita = ?", (modalita,)) if modalita else ("", ())
+        totale = self.db.execute(f"SELECT COUNT(*) FROM salvataggi {filtro}", parametri).fetchone()[0]
+        righe = self.db.execute(
+            f"SELECT nome, modalita, punteggio, mosse, tempo_gioco, seme, MAX(data, data_diario) "
+            f"FROM salvataggi "
+            f"{filtro} ORDER BY {ORDINAMENTI[ordine]}, nome LIMIT ? OFFSET ?",
+            parametri + (per_pagina, pagina * per_pagina)).fetchall()
+        return righe, totale
+
+    def chiudi(self):
+        self.db.close()
+
+
+_archivio = None
+
+
+def archivio_salvataggi():
+    """Archivio della cartella dei salvataggi, aperto una volta sola"""
+    global _archivio
+    if _archivio is None:
+        _archivio = ArchivioSalvataggi()
+        _archivio.importa()
+    return _archivio
+
 
 def trova_salvataggi():
-    """Trova tutti i file di salvataggio nella directory corrente"""
-    salvataggi = []
-    for file in os.listdir():
-        if file.endswith(".json"):
-            salvataggi.append(file)
-    return salvataggi
+    """Percorsi di tutti i salvataggi della cartella dei salvataggi, dal più recente"""
+    archivio = archivio_salvataggi()
+    archivio.sincronizza()
+    righe, totale = archivio.elenco(per_pagina=-1)
+    return [archivio.percorso(riga[0]) for riga in righe]
+
+
+def scegli_salvataggio(per_pagina=10, misura=None):
+    """Menu dei salvataggi: sfoglia, ordina, filtra, elimina e carica.
+    Restituisce la partita caricata, oppure None se il giocatore torna indietro.
+    Con `misura` il lavoro del menu (indice, eliminazioni e caricamento, senza le attese
+    del giocatore) viene registrato nella strumentazione come una sola operazione."""
+    inizio = time.perf_counter()
+    archivio = archivio_salvataggi()
+    archivio.sincronizza()
+    lavoro = time.perf_counter() - inizio
+    pagina, ordine, modalita = 0, "data", None
+    try:
+        while True:
+            righe, totale = archivio.elenco(pagina, per_pagina, ordine, modalita)
+            if not totale and modalita is None:
+                print("\nNessun salvataggio trovato. Premi INVIO per tornare indietro...")
+                input()
+                return None
+            pagine = max(1, (totale + per_pagina - 1) // per_pagina)
+            print(f"\nSalvataggi ({totale}) - pagina {pagina + 1}/{pagine} - ordine: {ordine}"
+                  + (f" - modalità: {modalita}" if modalita else ""))
+            for i, (nome, mod, punti, mosse, tempo, seme, data) in enumerate(righe, 1):
+                quando = datetime.fromtimestamp(data).strftime("%d/%m/%Y %H:%M")
+                partita = f"#{seme}" if seme is not None else "-"
+                print(f"{i:2}. {nome:<40} {mod:<9} {punti:>5} pt {mosse:>4} mosse "
+                      f"{tempo // 60}:{tempo % 60:02d}  {partita:<12} {quando}")
+            print("N/P. Pagina successiva/precedente  O. Ordina  F. Filtra per modalità  D. Elimina  0. Torna indietro")
+
+            scelta = input("\nSeleziona un salvataggio da caricare (numero) o un comando: ").strip().lower()
+            if scelta == "0":
+                return None
+            elif scelta == "n":
+                pagina = min(pagina + 1, pagine - 1)
+            elif scelta == "p":
+                pagina = max(pagina - 1, 0)
+            elif scelta == "o":
+                ordini = list(ORDINAMENTI)
+                ordine = ordini[(ordini.index(ordine) + 1) % len(ordini)]
+                pagina = 0
+            elif scelta == "f":
+                filtri = [None] + MODALITA
+                modalita = filtri[(filtri.index(modalita) + 1) % len(filtri)]
+                pagina = 0
+            elif scelta == "d":
+                try:
+                    idx = int(input("Digita il numero della partita da eliminare: ")) - 1
+                    if 0 <= idx < len(righe):
+                        inizio = time.perf_counter()
+                        archivio.elimina(righe[idx][0])
+                        lavoro += time.perf_counter() - inizio
+                        print(f"Salvataggio '{righe[idx][0]}' eliminato.")
+                        pagina = min(pagina, max(0, (totale - 2) // per_pagina))
+                    else:
+                        print("Indice non valido.")
+                except ValueError:
+                    print("Inserisci un numero valido.")
+            else:
+                try:
+                    idx = int(scelta) - 1
+                except ValueError:
+                    print("Inserisci un numero valido o un comando.")
+                    continue
+                if 0 <= idx < len(righe):
+                    inizio = time.perf_counter()
+                    gioco = Solitario.carica_partita(archivio.percorso(righe[idx][0]))
+                    lavoro += time.perf_counter() - inizio
+                    if gioco:
+                        return gioco
+                    print("Errore nel caricamento del salvataggio.")
+                else:
+                    print("Indice non valido.")
+    finally:
+        if misura is not None and STRUMENTI.attiva:
+            STRUMENTI.registra(misura, lavoro)
+
 
 def mostra_tutorial():
     print("\n" + "="*60)
@@ -482,16 +2611,92 @@ def segna_tutorial_visto():
     with open(".tutorial_solitario_visto", "w") as f:
         f.write("visto")
 
-def main():
-    # Ridimensiona il terminale a 102x27 (funziona su molti terminali, non tutti)
-    if os.name == "nt":
-        os.system('mode con: cols=102 lines=27')
-    else:
-        # Il comando seguente funziona su molti terminali Linux/macOS (non su tutti, ma su Terminal e iTerm sì)
-        os.system('printf "\\033[8;28;102t"')
-    tema = "classico"
-    gioco = None  # <--- AGGIUNTA QUI
-    # Menu iniziale
+def _risultato_script(gioco, comandi, errori, mostra, verdetto):
+    risultato = {
+        "partita": gioco.id_partita,
+        "seme": gioco.seme,
+        "modalita": gioco.modalita,
+        "vinta": gioco.controlla_vittoria(),
+        "punteggio": gioco.punteggio,
+        "mosse": gioco.mosse,
+        "fondazioni": gioco.fondazioni,
+        "comandi": comandi,
+        "errori": errori,
+    }
+    if verdetto:
+        risultato["verdetto"] = RilevatoreStallo().valuta(gioco)
+    if mostra:
+        risultato["tavolo"] = [COLORI_ANSI.sub("", riga) for riga in gioco.righe_schermo()]
+    return risultato
+
+
+def esegui_script(righe, seme=None, modalita="normale", riciclo=RICICLO_MESCOLATO,
+                  mostra=False, verdetto=False):
+    """Gioca senza terminale i comandi di uno script; produce un risultato per partita.
+
+    Ogni riga è un comando del gioco (1, 2 1 5, 3 scarti, 4 3, a, r); 0 gioca la mossa
+    consigliata dal risolutore. "nuova [modalita] [#numero]" chiude la partita in corso e
+    ne comincia un'altra; le righe vuote e quelle che iniziano con "//" vengono ignorate.
+    La prima partita usa `seme` (o un numero a caso). I comandi non validi vengono contati
+    tra gli errori (riga e messaggio) e la partita continua.
+    """
+    gioco = Solitario(modalita=modalita, seme=seme, riciclo=riciclo)
+    comandi = 0
+    errori = []
+    for numero, riga in enumerate(righe, 1):
+        riga = riga.strip()
+        if not riga or riga.startswith("//"):
+            continue
+        parole = riga.lower().split()
+        if parole[0] == "nuova":
+            nuova_modalita = modalita
+            seme_richiesto = None
+            try:
+                for parola in parole[1:]:
+                    if parola in MODALITA:
+                        nuova_modalita = parola
+                    else:
+                        seme_richiesto = interpreta_id_partita(parola)
+            except ValueError as e:
+                errori.append({"riga": numero, "messaggio": str(e)})
+                continue
+            yield _risultato_script(gioco, comandi, errori, mostra, verdetto)
+            gioco = Solitario(modalita=nuova_modalita, seme=seme_richiesto, riciclo=riciclo)
+            comandi = 0
+            errori = []
+            continue
+        comandi += 1
+        if parole[0] == "0":
+            mossa = gioco.analizza().mossa
+            if mossa is None:
+                errori.append({"riga": numero, "messaggio": "Nessuna mossa possibile."})
+                continue
+            esito = gioco.applica(mossa)
+        elif parole[0] in ("a", "r"):
+            esito = gioco.annulla() if parole[0] == "a" else gioco.ripeti()
+        else:
+            try:
+                mossa = interpreta_comando(riga)
+            except ValueError as e:
+                errori.append({"riga": numero, "messaggio": str(e)})
+                continue
+            esito = gioco.applica(mossa)
+        if not riuscita(esito):
+            errori.append({"riga": numero, "messaggio": MESSAGGI_ESITO.get(esito, str(esito))})
+    yield _risultato_script(gioco, comandi, errori, mostra, verdetto)
+
+
+# Stati del programma interattivo
+MENU = "menu"
+PARTITA = "partita"
+ESCI = "esci"
+
+
+def menu_principale(impostazioni):
+    """Menu iniziale: restituisce la partita scelta, oppure None per uscire.
+    Tema e regola del mazzo scelti restano in `impostazioni` per le partite successive."""
+    tema = impostazioni["tema"]
+    riciclo = impostazioni["riciclo"]
     while True:
         os.system("cls" if os.name == "nt" else "clear")
         print("╔═══════════════════════════════════════════════════════════════════════════╗")
@@ -508,13 +2713,14 @@ def main():
         print("4. Carica partita")
         print("5. Cambia tema")
         print("6. Rivedi il tutorial")  # <--- AGGIUNTA QUI
-        print("7. Esci")  # <-- Ora è l'ultima voce
+        print("7. Nuova partita da numero")
+        print("8. Nuova partita risolvibile")
+        print("9. Esci")  # <-- Ora è l'ultima voce
 
         scelta = input("\nScegli un'opzione: ").strip()
         
         if scelta == "1":
-            gioco = Solitario(tema=tema)
-            break
+            return Solitario(tema=tema, riciclo=riciclo)
         elif scelta == "2":
             print("\nScegli il tempo massimo:")
             print("1. 5 minuti")
@@ -527,64 +2733,13 @@ def main():
                 tempo_limite = 900
             else:
                 tempo_limite = 600
-            gioco = Solitario(modalita="tempo", tema=tema, tempo_limite=tempo_limite)
-            break
+            return Solitario(modalita="tempo", tema=tema, tempo_limite=tempo_limite, riciclo=riciclo)
         elif scelta == "3":
-            gioco = Solitario(modalita="difficile", tema=tema)
-            break
+            return Solitario(modalita="difficile", tema=tema, riciclo=riciclo)
         elif scelta == "4":
-            salvataggi = trova_salvataggi()
-            if not salvataggi:
-                print("\nNessun salvataggio trovato. Premi INVIO per tornare al menu...")
-                input()
-                continue
-
-            while True:
-                print("\nSalvataggi disponibili:")
-                for i, s in enumerate(salvataggi, 1):
-                    print(f"{i}. {s}")
-                print("0. Torna indietro")
-                print("D. Elimina un salvataggio")
-
-                scelta_salva = input("\nSeleziona un salvataggio da caricare (numero), oppure 'D' per eliminare: ").strip().lower()
-                if scelta_salva == "0":
-                    break
-                elif scelta_salva == "d":
-                    try:
-                        idx_del = int(input("Digita il numero della partita da eliminare: ")) - 1
-                        if 0 <= idx_del < len(salvataggi):
-                            nome_file = salvataggi[idx_del]
-                            os.remove(nome_file)
-                            print(f"Salvataggio '{nome_file}' eliminato.")
-                            salvataggi = trova_salvataggi()
-                            if not salvataggi:
-                                print("Nessun altro salvataggio rimasto. Premi INVIO per tornare al menu...")
-                                input()
-                                gioco = None  # <--- AGGIUNTA QUI
-                                break
-                        else:
-                            print("Indice non valido.")
-                    except (ValueError, OSError):
-                        print("Errore nell'eliminazione.")
-                else:
-                    try:
-                        idx = int(scelta_salva) - 1
-                        if 0 <= idx < len(salvataggi):
-                            gioco = Solitario.carica_partita(salvataggi[idx])
-                            if gioco:
-                                break
-                            else:
-                                print("Errore nel caricamento del salvataggio. Premi INVIO per tornare al menu...")
-                                input()
-                                break
-                        else:
-                            print("Indice non valido. Premi INVIO per continuare...")
-                            input()
-                    except ValueError:
-                        print("Inserisci un numero valido o 'D'. Premi INVIO per continuare...")
-                        input()
+            gioco = scegli_salvataggio()
             if gioco:
-                break
+                return gioco
         elif scelta == "5":
             print("\nTemi disponibili:")
             print("1. Classico (rosso/nero)")
@@ -597,17 +2752,48 @@ def main():
                 tema = "chiaro"
             else:
                 tema = "classico"
+            impostazioni["tema"] = tema
+            print("\nQuando il mazzo finisce, gli scarti vengono:")
+            print("1. Mescolati (versione facilitata)")
+            print("2. Rigirati nello stesso ordine (regola standard)")
+            r = input("Scegli (1-2): ").strip()
+            riciclo = RICICLO_STANDARD if r == "2" else RICICLO_MESCOLATO
+            impostazioni["riciclo"] = riciclo
         elif scelta == "6":
             mostra_tutorial()
             input("Premi INVIO per tornare al menu...")
         elif scelta == "7":
-            print("Grazie per aver giocato! Arrivederci.")
-            return
+            try:
+                seme = interpreta_id_partita(input("Numero della partita (es: #12345): "))
+            except ValueError:
+                print("Numero di partita non valido. Premi INVIO per tornare al menu...")
+                input()
+                continue
+            return Solitario(tema=tema, seme=seme, riciclo=riciclo)
+        elif scelta == "8":
+            elenco = elenco_risolvibili()
+            if elenco is None or not len(elenco):
+                print("\nElenco delle partite risolvibili non disponibile: va creato con")
+                print("python costruisci_risolvibili.py. Premi INVIO per tornare al menu...")
+                input()
+                continue
+            print("\nScegli la difficoltà:")
+            for k, difficolta in enumerate(DIFFICOLTA, 1):
+                print(f"{k}. {difficolta.capitalize()} ({elenco.fasce[difficolta][1]} partite)")
+            d = input(f"Seleziona (1-{len(DIFFICOLTA)}, INVIO per una qualsiasi): ").strip()
+            difficolta = DIFFICOLTA[int(d) - 1] if d in ("1", "2", "3") else QUALSIASI
+            if not elenco.fasce[difficolta][1]:
+                difficolta = QUALSIASI
+            return Solitario(tema=tema, riciclo=riciclo, risolvibile=difficolta)
+        elif scelta == "9":
+            return None
         else:
             print("Opzione non valida. Premi INVIO per riprovare...")
             input()
 
-    # Dopo aver creato l'oggetto gioco e PRIMA del ciclo principale:
+
+def gioca_partita(gioco):
+    """Ciclo di gioco: restituisce MENU per tornare al menu principale, ESCI a fine partita"""
     if not tutorial_gia_visto():
         mostra_tutorial()
         segna_tutorial_visto()
@@ -615,18 +2801,22 @@ def main():
     input("\nPremi INVIO per iniziare a giocare...")
     
     # Loop principale di gioco
+    schermo = Schermo()
+    lettore = LettoreComandi(schermo)       # l'orologio continua a scorrere mentre si scrive
+    analisi_continua = AnalisiContinua()    # cerca il consiglio mentre il giocatore pensa
+    rilevatore = RilevatoreStallo()         # partita persa (o vinta) dopo ogni mossa
+    avvisi = []     # messaggi dell'ultimo comando, mostrati sotto i comandi
+    prossimo = ESCI     # stato successivo quando il ciclo finisce
     while True:
         # Controllo del tempo per la modalità a tempo
-        if gioco.modalita == "tempo":
-            tempo_trascorso = int(time.time() - gioco.tempo_inizio)
-            tempo_rimanente = max(0, gioco.tempo_limite - tempo_trascorso)
-            if tempo_rimanente == 0:
-                print("\n⏰ TEMPO SCADUTO! Hai perso la partita.")
-                input("\nPremi INVIO per terminare...")
-                break
-
-        gioco.mostra()
+        if gioco.tempo_scaduto():
+            schermo.disegna(gioco.righe_schermo())
+            print("\n⏰ TEMPO SCADUTO! Hai perso la partita.")
+            input("\nPremi INVIO per terminare...")
+            break
+
         if gioco.controlla_vittoria():
+            schermo.disegna(gioco.righe_schermo())
             tempo_totale = int(time.time() - gioco.tempo_inizio)
             minuti = tempo_totale // 60
             secondi = tempo_totale % 60
@@ -637,105 +2827,160 @@ def main():
             gioco.verifica_obiettivi()  # Verifica gli obiettivi
             input("\nPremi INVIO per terminare...")
             break
-            
-        print("\nComandi:")
-        print(" [0] 🤖 Consiglio automatico SOLITARIO AI 🤖 ")
-        print(" [1] Pesca carta")
-        print(" [2] Sposta da colonna a colonna (es: 2 1 5)")
-        print(" [3] Sposta carta a pila finale (es: 3 scarti / 3 colonna 4)")
-        print(" [4] Sposta dagli scarti a colonna (es: 4 3)")
-        print(" [5] Salva partita  [6] Carica partita  [7] Aiuto  [8] Esci  [9] Menu principale")
 
         # --- MESSAGGIO DI SCONFITTA SOTTO I COMANDI ---
-        consiglio = gioco.consiglia_mossa()
-        if consiglio.startswith("Nessuna mossa") and not gioco.riserva:
-            print("\n❌ Non ci sono più mosse possibili e il mazzo è finito.")
-            print("💀 HAI PERSO! 💀")
+        # Il rilevatore decide subito i casi semplici; altrimenti si aspetta al massimo 50 ms
+        # il primo passo dell'analisi in sottofondo (appena partita per la nuova posizione),
+        # che può dimostrare la sconfitta già in questo fotogramma o anche più avanti
+        analisi_continua.avvia(gioco)
+        with STRUMENTI.misura("controllo_sconfitta"):
+            verdetto = rilevatore.valuta(gioco)
+            analisi = analisi_continua.risultato(gioco, attesa=0.05 if verdetto != PERSA else 0.0)
+        if verdetto == PERSA or (analisi is not None and analisi.verdetto == PERSA):
+            avvisi += ["❌ Nessuna sequenza di mosse porta più alla vittoria.", "💀 HAI PERSO! 💀"]
         # ------------------------------------------------
 
-        scelta = input("Comando: ").strip().lower()
-        
-        if scelta == "0":
-            consiglio = gioco.consiglia_mossa()
-            print("\n🤖 Consiglio: " + consiglio)
-            if consiglio.startswith("Nessuna mossa") and not gioco.riserva:
-                print("\n❌ Non ci sono più mosse possibili e il mazzo è finito.")
-                print("💀 HAI PERSO! 💀")
-                input("\nPremi INVIO per terminare la partita...")
-                break
-            elif consiglio.startswith("Nessuna mossa"):
-                print("⚠️  Non ci sono più mosse possibili. La partita potrebbe essere bloccata, prova a ripescare ma dei dubbi per te.")
-        elif scelta == "1":
-            gioco.pesca()
-        elif scelta.startswith("2"):
-            try:
-                parti = scelta.split()
-                if len(parti) == 3:
-                    gioco.sposta_colonna(int(parti[1])-1, int(parti[2])-1)
-                else:
-                    print("Formato non valido. Usa: 2 [da] [a]")
-            except (ValueError, IndexError):
-                print("Parametri non validi. Usa numeri per le colonne.")
-        elif scelta.startswith("3"):
-            try:
-                parti = scelta.split()
-                if len(parti) == 2 and parti[1] == "scarti":
-                    gioco.sposta_a_finale("scarti")
-                elif len(parti) == 3 and parti[1] == "colonna":
-                    gioco.sposta_a_finale("colonna", int(parti[2]) - 1)
+        with STRUMENTI.misura("disegno"):
+            schermo.disegna(gioco.righe_schermo() + RIGHE_COMANDI + avvisi)
+        avvisi = []
+        scelta = lettore.leggi("Comando: ", gioco)
+        if scelta is None:      # tempo scaduto mentre il giocatore scriveva
+            continue
+        scelta = scelta.strip().lower()
+
+        comando = scelta[:1] if scelta[:1] in COMANDI_MISURATI else "?"
+        if scelta in ("5", "6", "7", "8", "9"):
+            # Comandi che dialogano con il giocatore: scrivono liberamente sul terminale,
+            # quindi il fotogramma successivo va ridisegnato per intero. Si misura solo il
+            # lavoro fatto dopo le domande, non il tempo che il giocatore impiega a rispondere
+            # (per 6 lo registra il menu dei salvataggi: indice, eliminazioni e caricamento)
+            schermo.invalida()
+            if scelta == "5":
+                nome_file = input("Inserisci un nome per il salvataggio (senza estensione, lascia vuoto per nome automatico): ").strip()
+                if nome_file and not nome_file.endswith((".json", ESTENSIONE_SALVATAGGIO)):
+                    nome_file += ESTENSIONE_SALVATAGGIO
+                with STRUMENTI.misura("comando " + comando):
+                    gioco.salva_partita(nome_file or None)
+            elif scelta == "6":
+                nuovo_gioco = scegli_salvataggio(misura="comando " + comando)
+                if nuovo_gioco:
+                    gioco.chiudi_diario()
+                    gioco = nuovo_gioco
+            elif scelta == "7":
+                with STRUMENTI.misura("comando " + comando):
+                    gioco.mostra_aiuto()
+            elif scelta == "8":
+                risposta = input("Sei sicuro di voler uscire? (s/n): ").lower()
+                with STRUMENTI.misura("comando " + comando):
+                    if risposta == 's':
+                        print("Partita terminata.")
+                        break
+                continue
+            elif scelta == "9":
+                print("Torno al menu principale...")
+                input("Premi INVIO per continuare...")
+                with STRUMENTI.misura("comando " + comando):
+                    prossimo = MENU
+                    break
+            input("\nPremi INVIO per continuare...")
+            continue
+
+        with STRUMENTI.misura("comando " + comando):
+            if scelta == "0":
+                with STRUMENTI.misura("consiglio"):
+                    # La ricerca in sottofondo ha di solito già la risposta
+                    analisi = analisi_continua.risultato(gioco) or gioco.analizza()
+                avvisi.append("🤖 Consiglio: " + gioco.descrivi_mossa(analisi.mossa))
+                avvisi.append(MESSAGGI_VERDETTO[analisi.verdetto])
+            elif scelta[:1] in ("1", "2", "3", "4"):
+                try:
+                    mossa = interpreta_comando(scelta)
+                except ValueError as e:
+                    avvisi.append(str(e))
                 else:
-                    print("Formato non valido. Esempio: 3 scarti o 3 colonna 4")
-            except (ValueError, IndexError):
-                print("Comando non valido.")
-        elif scelta.startswith("4"):
-            try:
-                _, colonna = scelta.split()
-                gioco.sposta_colonna(0, int(colonna)-1, da_scarti=True)
-            except (ValueError, IndexError):
-                print("Formato non valido. Usa: 4 [colonna]")
-        elif scelta == "5":
-            nome_file = input("Inserisci un nome per il salvataggio (senza estensione, lascia vuoto per nome automatico): ").strip()
-            if nome_file:
-                if not nome_file.endswith(".json"):
-                    nome_file += ".json"
-                gioco.salva_partita(nome_file)
-            else:
-                gioco.salva_partita()
-        elif scelta == "6":
-            salvataggi = trova_salvataggi()
-            if not salvataggi:
-                print("Nessun salvataggio trovato.")
+                    esito = gioco.applica(mossa)
+                    messaggio = gioco.messaggio_esito(esito, mossa)
+                    if messaggio:
+                        avvisi.append(messaggio)
+            elif scelta == "p":
+                print("\n🔎 Analisi in corso...")
+                with STRUMENTI.misura("probabilita"):
+                    stima = stima_vittoria(gioco)
+                basso, alto = stima.intervallo()
+                avvisi.append(f"Probabilità di vittoria: {stima.probabilita:.0%} "
+                              f"(intervallo 95%: {basso:.0%}-{alto:.0%}, {stima.campioni} campioni)")
+                # Ordinate per la percentuale di vittorie (estremo inferiore di Wilson), non per
+                # il numero: una mossa provata poche volte non passa davanti per caso
+                migliori = sorted(stima.per_mossa.items(), key=lambda x: -intervallo_wilson(*x[1])[0])
+                avvisi.append("  " + "  ".join(f"[{comando_mossa(mossa)}] {vinte / prove:.0%}"
+                                               for mossa, (vinte, prove) in migliori if prove))
+            elif scelta in ("a", "r"):
+                esito = gioco.annulla() if scelta == "a" else gioco.ripeti()
+                avvisi.append(gioco.messaggio_esito(esito) or ("Mossa annullata." if scelta == "a" else "Mossa ripetuta."))
             else:
-                print("\nSalvataggi disponibili:")
-                for i, s in enumerate(salvataggi, 1):
-                    print(f"{i}. {s}")
-                try:
-                    idx = int(input("\nSeleziona un salvataggio (0 per annullare): ")) - 1
-                    if idx == -1:
-                        continue
-                    if 0 <= idx < len(salvataggi):
-                        nuovo_gioco = Solitario.carica_partita(salvataggi[idx])
-                        if nuovo_gioco:
-                            gioco = nuovo_gioco
-                    else:
-                        print("Indice non valido.")
-                except ValueError:
-                    print("Inserisci un numero valido.")
-        elif scelta == "7":
-            gioco.mostra_aiuto()
-        elif scelta == "8":
-            if input("Sei sicuro di voler uscire? (s/n): ").lower() == 's':
-                print("Partita terminata.")
-                break
-        elif scelta == "9":
-            print("Torno al menu principale...")
-            input("Premi INVIO per continuare...")
-            main()  # <--- RICHIAMA IL MENU PRINCIPALE
-            return
+                avvisi.append("Comando sconosciuto. Premi 7 per visualizzare l'aiuto.")
+        if scelta == "0" and analisi.mossa is None:
+            print("\n".join(avvisi))
+            print("\n❌ Non ci sono più mosse possibili e il mazzo è finito.")
+            print("💀 HAI PERSO! 💀")
+            input("\nPremi INVIO per terminare la partita...")
+            break
+    analisi_continua.ferma()
+    gioco.chiudi_diario()
+    return prossimo
+
+
+def main():
+    # Ridimensiona il terminale a 102x27 (funziona su molti terminali, non tutti)
+    if os.name == "nt":
+        os.system('mode con: cols=102 lines=27')
+    else:
+        # Il comando seguente funziona su molti terminali Linux/macOS (non su tutti, ma su Terminal e iTerm sì)
+        os.system('printf "\\033[8;28;102t"')
+    # Menu e partita si alternano in un ciclo (senza richiamare main): una partita
+    # finita non resta in memoria, e si può tornare al menu quante volte si vuole
+    impostazioni = {"tema": "classico", "riciclo": RICICLO_MESCOLATO}
+    stato = MENU
+    gioco = None
+    while stato != ESCI:
+        if stato == MENU:
+            gioco = menu_principale(impostazioni)
+            stato = ESCI if gioco is None else PARTITA
         else:
-            print("Comando sconosciuto. Premi 7 per visualizzare l'aiuto.")
-    
-        input("\nPremi INVIO per continuare...")
+            stato = gioca_partita(gioco)
+            gioco = None
+    print("Grazie per aver giocato! Arrivederci.")
+
+
+def argomenti_riga_di_comando(argomenti=None):
+    parser = argparse.ArgumentParser(description="Solitario (Klondike)")
+    parser.add_argument("--statistiche", nargs="?", const=True, metavar="FILE",
+                        help="misura le prestazioni (ed esporta le statistiche nel file)")
+    parser.add_argument("--script", metavar="FILE",
+                        help="gioca senza terminale i comandi del file ('-' per lo standard input)")
+    parser.add_argument("--seme", "--seed", type=interpreta_id_partita, metavar="N",
+                        help="numero della (prima) partita dello script")
+    parser.add_argument("--modalita", choices=MODALITA, default="normale")
+    parser.add_argument("--riciclo", choices=RICICLI, default=RICICLO_MESCOLATO)
+    parser.add_argument("--mostra", action="store_true", help="aggiunge il tavolo finale ai risultati")
+    parser.add_argument("--verdetto", action="store_true",
+                        help="aggiunge ai risultati il verdetto del rilevatore di stallo")
+    return parser.parse_args(argomenti)
+
 
 if __name__ == "__main__":
-    main()
+    args = argomenti_riga_di_comando()
+    if args.statistiche:
+        STRUMENTI.attiva_misure(None if args.statistiche is True else args.statistiche)
+    if args.script:
+        # Modalità script: un risultato JSON per riga, senza pause né disegni
+        if args.script == "-":
+            righe = sys.stdin
+        else:
+            righe = open(args.script, encoding="utf-8")
+        with righe:
+            for risultato in esegui_script(righe, args.seme, args.modalita, args.riciclo,
+                                           args.mostra, args.verdetto):
+                print(json.dumps(risultato, ensure_ascii=False))
+    else:
+        main()
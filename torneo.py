@@ -0,0 +1,203 @@
+"""Torneo tra strategie di gioco: molte partite numerate, giocate in parallelo.
+
+Ogni strategia (politica) gioca le partite di un intervallo di numeri; i processi ricevono
+blocchi di partite e i risultati (vittoria, mosse, punteggio, tempo) vengono aggiunti a un file
+JSONL, una riga per partita, man mano che i blocchi finiscono. Alla fine si stampano le
+percentuali di vittoria e la velocità. Se il file esiste già le partite presenti non vengono
+rigiocate, quindi un torneo interrotto riprende da dove era arrivato.
+
+Politiche disponibili: avida (il consigliatore semplice, mossa_consigliata), risolutore (il
+risolutore dei consigli con un budget di nodi per mossa) e casuale. Si può indicare anche una
+funzione qualsiasi come "modulo:funzione": riceve il motore e restituisce una mossa o None.
+
+Esempi:
+    python torneo.py --semi 0:100000 --politiche avida --uscita avida.jsonl
+    python torneo.py --semi 0:2000 --politiche avida risolutore casuale --processi 8
+"""
+import argparse
+import importlib
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from solitario import Motore, Risolutore, RICICLI, RICICLO_MESCOLATO, intervallo_wilson, riuscita
+
+MOSSE_MAX = 1000        # oltre, la partita si considera persa (alcune politiche girano in tondo)
+BLOCCO = 64             # partite per ogni lavoro mandato ai processi
+
+
+def politica_avida():
+    return Motore.mossa_consigliata
+
+
+def politica_risolutore(nodi_max=20000):
+    # Lo stesso budget dei consigli del gioco, ma senza limite di tempo: risultati ripetibili
+    risolutore = Risolutore(nodi_max=nodi_max, tempo_max=0)
+
+    def scegli(motore):
+        return risolutore.risolvi(motore).mossa
+    return scegli
+
+
+def politica_casuale():
+    def scegli(motore):
+        # Dipende solo dalla partita e dalla mossa: lo stesso risultato in qualsiasi processo
+        mosse = sorted(motore.mosse_legali())
+        return random.Random(motore.seme * MOSSE_MAX + motore.mosse).choice(mosse) if mosse else None
+    return scegli
+
+
+POLITICHE = {
+    "avida": politica_avida,
+    "risolutore": politica_risolutore,
+    "casuale": politica_casuale,
+}
+
+_politiche = {}     # politiche già create in questo processo
+
+
+def crea_politica(nome):
+    """Funzione motore -> mossa per una politica per nome, o "modulo:funzione" """
+    if nome not in _politiche:
+        if nome in POLITICHE:
+            _politiche[nome] = POLITICHE[nome]()
+        else:
+            modulo, _, funzione = nome.partition(":")
+            if not funzione:
+                raise ValueError(f"Politica sconosciuta: {nome}")
+            _politiche[nome] = getattr(importlib.import_module(modulo), funzione)
+    return _politiche[nome]
+
+
+def gioca(politica, seme, riciclo=RICICLO_MESCOLATO, mosse_max=MOSSE_MAX):
+    """Gioca una partita con una politica e ne restituisce il risultato"""
+    scegli = crea_politica(politica)
+    inizio = time.perf_counter()
+    motore = Motore(seme=seme, riciclo=riciclo)
+    while motore.mosse < mosse_max and not motore.controlla_vittoria():
+        mossa = scegli(motore)
+        if mossa is None or not riuscita(motore.applica(mossa)):
+            break
+    return {"politica": politica, "seme": seme, "vinta": motore.controlla_vittoria(),
+            "mosse": motore.mosse, "punteggio": motore.punteggio,
+            "tempo": round(time.perf_counter() - inizio, 6)}
+
+
+def _gioca_blocco(politica, semi, riciclo, mosse_max):
+    return [gioca(politica, seme, riciclo, mosse_max) for seme in semi]
+
+
+def leggi_risultati(nome_file):
+    """Risultati già nel file; un'ultima riga scritta a metà viene tolta dal file"""
+    risultati = []
+    try:
+        with open(nome_file, "rb+") as f:
+            dati = f.read()
+            completo = dati.rfind(b"\n") + 1
+            if completo < len(dati):
+                f.truncate(completo)
+    except FileNotFoundError:
+        return risultati
+    for riga in dati[:completo].splitlines():
+        if riga.strip():
+            risultati.append(json.loads(riga))
+    return risultati
+
+
+def riepilogo(risultati):
+    """Partite, vittorie (con intervallo di confidenza), mosse e punteggio medi per politica"""
+    per_politica = {}
+    for r in risultati:
+        per_politica.setdefault(r["politica"], []).append(r)
+    righe = {}
+    for politica, partite in per_politica.items():
+        vinte = sum(r["vinta"] for r in partite)
+        basso, alto = intervallo_wilson(vinte, len(partite))
+        righe[politica] = {
+            "partite": len(partite), "vinte": vinte, "percentuale": vinte / len(partite),
+            "intervallo": (basso, alto),
+            "mosse_medie": sum(r["mosse"] for r in partite) / len(partite),
+            "punteggio_medio": sum(r["punteggio"] for r in partite) / len(partite),
+            "tempo_medio": sum(r["tempo"] for r in partite) / len(partite),
+        }
+    return righe
+
+
+def torneo(politiche, semi, uscita, processi=None, blocco=BLOCCO, riciclo=RICICLO_MESCOLATO,
+           mosse_max=MOSSE_MAX, avanzamento=None):
+    """Gioca le partite mancanti nel file di uscita e restituisce (tutti i risultati, partite giocate
+    ora, secondi impiegati). avanzamento(fatte, totali) viene chiamata dopo ogni blocco."""
+    risultati = leggi_risultati(uscita)
+    fatte = {(r["politica"], r["seme"]) for r in risultati}
+    lavori = []
+    for politica in politiche:
+        crea_politica(politica)     # un nome sbagliato si scopre subito, non nei processi
+        mancanti = [seme for seme in semi if (politica, seme) not in fatte]
+        lavori += [(politica, mancanti[i:i + blocco]) for i in range(0, len(mancanti), blocco)]
+    totali = sum(len(semi_blocco) for _, semi_blocco in lavori)
+    giocate = 0
+    inizio = time.perf_counter()
+    if lavori:
+        with open(uscita, "a", encoding="utf-8") as f, ProcessPoolExecutor(processi) as esecutore:
+            futuri = [esecutore.submit(_gioca_blocco, politica, semi_blocco, riciclo, mosse_max)
+                      for politica, semi_blocco in lavori]
+            for futuro in as_completed(futuri):
+                blocco_risultati = futuro.result()
+                f.write("".join(json.dumps(r) + "\n" for r in blocco_risultati))
+                f.flush()
+                risultati += blocco_risultati
+                giocate += len(blocco_risultati)
+                if avanzamento:
+                    avanzamento(giocate, totali)
+    return risultati, giocate, time.perf_counter() - inizio
+
+
+def intervallo_semi(testo):
+    """"a:b" -> range(a, b); "n" -> range(n)"""
+    inizio, _, fine = testo.partition(":")
+    return range(int(inizio), int(fine)) if fine else range(int(inizio))
+
+
+def main(argomenti=None):
+    parser = argparse.ArgumentParser(description="Torneo tra strategie del solitario")
+    parser.add_argument("--semi", type=intervallo_semi, default=range(1000),
+                        help="numeri delle partite, come inizio:fine (fine esclusa)")
+    parser.add_argument("--politiche", nargs="+", default=["avida"],
+                        help=f"{', '.join(POLITICHE)} oppure modulo:funzione")
+    parser.add_argument("--uscita", default="torneo.jsonl", help="file JSONL dei risultati (si riprende da qui)")
+    parser.add_argument("--processi", type=int, default=None)
+    parser.add_argument("--blocco", type=int, default=BLOCCO, help="partite per ogni lavoro dei processi")
+    parser.add_argument("--riciclo", choices=RICICLI, default=RICICLO_MESCOLATO)
+    parser.add_argument("--mosse-max", type=int, default=MOSSE_MAX)
+    args = parser.parse_args(argomenti)
+
+    def avanzamento(fatte, totali):
+        print(f"\r{fatte}/{totali} partite", end="", file=sys.stderr, flush=True)
+
+    try:
+        risultati, giocate, durata = torneo(args.politiche, args.semi, args.uscita, args.processi, args.blocco,
+                                            args.riciclo, args.mosse_max, avanzamento)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    print(file=sys.stderr)
+    semi = set(args.semi)
+    righe = riepilogo(r for r in risultati if r["politica"] in args.politiche and r["seme"] in semi)
+    for politica, r in righe.items():
+        basso, alto = r["intervallo"]
+        print(f"{politica:<12} {r['vinte']:>7}/{r['partite']:<7} vinte  {r['percentuale']:7.2%} "
+              f"({basso:.2%}-{alto:.2%})  mosse {r['mosse_medie']:6.1f}  punteggio {r['punteggio_medio']:7.1f}  "
+              f"{r['tempo_medio'] * 1000:8.2f} ms/partita")
+    if giocate:
+        print(f"\n{giocate} partite giocate in {durata:.1f} s ({giocate / durata:,.0f} partite/s, "
+              f"{os.cpu_count()} core)")
+    else:
+        print(f"\nNessuna partita da giocare: risultati già in {args.uscita}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,326 @@
+"""Motore a lotti: molte partite di solitario avanzate insieme con NumPy.
+
+Lo stato di N partite sta in poche matrici di forma fissa (carte delle colonne, confine tra
+coperte e scoperte, pile finali, riserva e scarti con i loro contatori). Le mosse legali di
+tutte le partite si calcolano insieme come maschera (N, NUM_AZIONI), e un vettore di azioni,
+una per partita, si applica con poche operazioni sulle matrici. Le regole e il punteggio sono
+quelli di Motore (sposta_colonna, sposta_a_finale, pesca), e anche la distribuzione e i
+rimescolamenti degli scarti: MotoreVettoriale([42]) gioca la stessa partita di Motore(seme=42).
+
+Le azioni sono numerate come in solitario.AZIONI.
+
+Esempi:
+    python vettoriale.py --verifica             # confronto con il motore normale su semi a caso
+    python vettoriale.py --partite 4096 --passi 500
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from solitario import (Motore, NUM_CARTE, RANGO, SEME, PUO_IMPILARE, AZIONI, NUM_AZIONI, INDICE_AZIONE,
+                       AZIONE_COLONNA, AZIONE_FINALE, AZIONE_SCARTI_FINALE, AZIONE_DAGLI_SCARTI,
+                       RICICLO_MESCOLATO, OK, MAZZO_RIGIRATO, ERR_MOSSA)
+
+VUOTA = NUM_CARTE       # casella libera: per le tabelle è una carta che non va da nessuna parte
+ALTEZZA_MAX = 19        # 6 carte coperte più una scala completa dal re all'asso
+RISERVA_MAX = 24        # carte che restano dopo aver distribuito le colonne
+
+# Le tabelle del motore, con una riga in più per VUOTA
+_RANGO = np.array(RANGO + [0], dtype=np.int8)
+_SEME = np.array(SEME + [0], dtype=np.int8)
+_RE = _RANGO == 13
+_IMPILA = np.zeros((NUM_CARTE + 1, NUM_CARTE + 1), dtype=bool)     # [carta, carta sotto]
+for _c in range(NUM_CARTE):
+    for _d in range(NUM_CARTE):
+        _IMPILA[_c, _d] = PUO_IMPILARE[_c] >> _d & 1
+_DIVERSE = ~np.eye(7, dtype=bool)
+
+
+class MotoreVettoriale:
+    """N partite di Klondike avanzate insieme, una mossa per partita a ogni passo.
+
+    Stato (una riga per partita):
+    colonne (N, 7, ALTEZZA_MAX) codici delle carte, VUOTA oltre la fine della colonna;
+    lunghezze e coperte (N, 7); fondazioni (N, 4) carte in ogni pila finale, per seme;
+    riserva e scarti (N, 24) con n_riserva e n_scarti (la cima è l'ultima carta);
+    punteggio, mosse, ricicli (N,).
+    """
+
+    def __init__(self, semi, riciclo=RICICLO_MESCOLATO):
+        semi = np.asarray(semi, dtype=np.int64)
+        n = len(semi)
+        self.n = n
+        self.riciclo = riciclo
+        self.seme = np.zeros(n, dtype=np.int64)
+        self.colonne = np.full((n, 7, ALTEZZA_MAX), VUOTA, dtype=np.uint8)
+        self.lunghezze = np.zeros((n, 7), dtype=np.int16)
+        self.coperte = np.zeros((n, 7), dtype=np.int16)
+        self.fondazioni = np.zeros((n, 4), dtype=np.int16)
+        self.riserva = np.full((n, RISERVA_MAX), VUOTA, dtype=np.uint8)
+        self.scarti = np.full((n, RISERVA_MAX), VUOTA, dtype=np.uint8)
+        self.n_riserva = np.zeros(n, dtype=np.int16)
+        self.n_scarti = np.zeros(n, dtype=np.int16)
+        self.punteggio = np.zeros(n, dtype=np.int32)
+        self.mosse = np.zeros(n, dtype=np.int32)
+        self.ricicli = np.zeros(n, dtype=np.int32)
+        self._partite = np.arange(n)
+        self._colonna = np.arange(7)
+        self.distribuisci(self._partite, semi)
+
+    def distribuisci(self, indici, semi):
+        """Ricomincia le partite `indici` con i numeri di partita `semi`"""
+        indici = np.asarray(indici, dtype=np.intp)
+        self.colonne[indici] = VUOTA
+        self.riserva[indici] = VUOTA
+        self.scarti[indici] = VUOTA
+        for k, seme in zip(indici.tolist(), np.asarray(semi).tolist()):
+            # La stessa distribuzione di Motore._prepara_gioco
+            mazzo = list(range(NUM_CARTE))
+            random.Random(seme).shuffle(mazzo)
+            self.seme[k] = seme
+            for i in range(7):
+                self.colonne[k, i, :i + 1] = mazzo[:-i - 2:-1]
+                del mazzo[-i - 1:]
+            self.riserva[k] = mazzo
+        self.lunghezze[indici] = self._colonna + 1
+        self.coperte[indici] = self._colonna
+        self.fondazioni[indici] = 0
+        self.n_riserva[indici] = RISERVA_MAX
+        self.n_scarti[indici] = 0
+        self.punteggio[indici] = 0
+        self.mosse[indici] = 0
+        self.ricicli[indici] = 0
+
+    def _cime(self):
+        """Cima di ogni colonna, base del gruppo scoperto e cima degli scarti (VUOTA se non ci sono)"""
+        partite = self._partite[:, None]
+        lunghezze = self.lunghezze
+        cima = self.colonne[partite, self._colonna, np.maximum(lunghezze - 1, 0)]
+        cima = np.where(lunghezze > 0, cima, VUOTA)
+        scoperte = self.coperte < lunghezze
+        base = self.colonne[partite, self._colonna, np.minimum(self.coperte, ALTEZZA_MAX - 1)]
+        base = np.where(scoperte, base, VUOTA)
+        scarto = self.scarti[self._partite, np.maximum(self.n_scarti - 1, 0)]
+        scarto = np.where(self.n_scarti > 0, scarto, VUOTA)
+        return cima, np.where(scoperte, cima, VUOTA), base, scarto
+
+    def _va_in_finale(self, carte):
+        return _RANGO[carte] == np.take_along_axis(self.fondazioni, _SEME[carte].astype(np.intp), 1) + 1
+
+    def maschera_legali(self):
+        """Matrice (N, NUM_AZIONI) di bool: le azioni legali di ogni partita"""
+        cima, cima_scoperta, base, scarto = self._cime()
+        vuote = self.lunghezze == 0
+        maschera = np.empty((self.n, NUM_AZIONI), dtype=bool)
+        maschera[:, 0] = (self.n_riserva > 0) | (self.n_scarti > 0)
+        # [partita, da, a]: il gruppo scoperto di `da` va su `a` (solo un re su una colonna vuota)
+        tra_colonne = np.where(vuote[:, None, :], _RE[base][:, :, None], _IMPILA[base[:, :, None], cima[:, None, :]])
+        maschera[:, AZIONE_COLONNA:AZIONE_FINALE] = (tra_colonne & _DIVERSE).reshape(self.n, 49)
+        maschera[:, AZIONE_FINALE:AZIONE_SCARTI_FINALE] = self._va_in_finale(cima_scoperta)
+        maschera[:, AZIONE_SCARTI_FINALE] = self._va_in_finale(scarto[:, None])[:, 0]
+        maschera[:, AZIONE_DAGLI_SCARTI:] = np.where(vuote, _RE[scarto][:, None], _IMPILA[scarto[:, None], cima])
+        return maschera
+
+    def applica(self, azioni, maschera=None):
+        """Esegue un'azione per partita e restituisce gli esiti (OK, MAZZO_RIGIRATO o ERR_MOSSA).
+
+        Un'azione illegale o negativa lascia la partita com'è. Se la maschera delle mosse legali
+        è già stata calcolata per questa posizione si può passare per non ricalcolarla.
+        """
+        azioni = np.asarray(azioni)
+        valide = (azioni >= 0) & (azioni < NUM_AZIONI)
+        azioni = np.where(valide, azioni, 0)
+        if maschera is None:
+            maschera = self.maschera_legali()
+        legali = valide & maschera[self._partite, azioni]
+        esiti = np.where(legali, OK, ERR_MOSSA).astype(np.int8)
+
+        g = np.flatnonzero(legali & (azioni == 0))
+        if len(g):
+            vuota = self.n_riserva[g] == 0
+            self._pesca(g[~vuota])
+            esiti[g[vuota]] = MAZZO_RIGIRATO
+            self._ricicla(g[vuota])
+        g = np.flatnonzero(legali & (azioni >= AZIONE_COLONNA) & (azioni < AZIONE_FINALE))
+        if len(g):
+            da, a = np.divmod(azioni[g] - AZIONE_COLONNA, 7)
+            self._sposta_gruppo(g, da, a)
+        g = np.flatnonzero(legali & (azioni >= AZIONE_FINALE) & (azioni < AZIONE_SCARTI_FINALE))
+        if len(g):
+            self._da_colonna_a_finale(g, azioni[g] - AZIONE_FINALE)
+        g = np.flatnonzero(legali & (azioni >= AZIONE_SCARTI_FINALE))
+        if len(g):
+            self._dagli_scarti(g, azioni[g])
+        self.mosse[legali] += 1
+        return esiti
+
+    def _pesca(self, g):
+        cima = self.n_riserva[g] - 1
+        self.scarti[g, self.n_scarti[g]] = self.riserva[g, cima]
+        self.riserva[g, cima] = VUOTA
+        self.n_riserva[g] -= 1
+        self.n_scarti[g] += 1
+
+    def _ricicla(self, g):
+        """Rigira gli scarti nella riserva come Motore.pesca (mescolandoli se richiesto)"""
+        if not len(g):
+            return
+        quante = self.n_scarti[g].astype(np.intp)
+        if self.riciclo == RICICLO_MESCOLATO:
+            # Il mescolamento dipende dal random di Python: si fa partita per partita
+            for k, n in zip(g.tolist(), quante.tolist()):
+                ordine = list(range(n))
+                random.Random(int(self.seme[k]) * 1000 + int(self.ricicli[k])).shuffle(ordine)
+                ordine.reverse()
+                self.riserva[k, :n] = self.scarti[k, ordine]
+        else:
+            posti = np.arange(RISERVA_MAX)
+            dalla_cima = quante[:, None] - 1 - posti
+            rigirati = self.scarti[g[:, None], np.maximum(dalla_cima, 0)]
+            self.riserva[g] = np.where(dalla_cima >= 0, rigirati, VUOTA)
+        self.scarti[g] = VUOTA
+        self.n_riserva[g] = quante
+        self.n_scarti[g] = 0
+        self.ricicli[g] += 1
+
+    def _sposta_gruppo(self, g, da, a):
+        """Sposta tutto il gruppo scoperto della colonna `da` sulla colonna `a`"""
+        inizio = self.coperte[g, da].astype(np.intp)
+        quante = self.lunghezze[g, da] - inizio
+        arrivo = self.lunghezze[g, a].astype(np.intp)
+        # Una riga per carta spostata: (partita, posizione nel gruppo)
+        riga, posto = np.nonzero(np.arange(ALTEZZA_MAX) < quante[:, None])
+        partite = g[riga]
+        self.colonne[partite, a[riga], arrivo[riga] + posto] = self.colonne[partite, da[riga], inizio[riga] + posto]
+        self.colonne[partite, da[riga], inizio[riga] + posto] = VUOTA
+        self.lunghezze[g, a] += quante
+        self.lunghezze[g, da] = inizio
+        # Se sotto al gruppo resta una carta coperta, viene scoperta
+        self.coperte[g, da] = np.maximum(inizio - 1, 0)
+        self.punteggio[g] += 3
+
+    def _da_colonna_a_finale(self, g, da):
+        cima = self.lunghezze[g, da] - 1
+        carte = self.colonne[g, da, cima]
+        self.fondazioni[g, _SEME[carte]] += 1
+        self.colonne[g, da, cima] = VUOTA
+        self.lunghezze[g, da] = cima
+        girata = (self.coperte[g, da] == cima) & (cima > 0)
+        self.coperte[g, da] -= girata
+        self.punteggio[g] += 10
+
+    def _dagli_scarti(self, g, azioni):
+        cima = self.n_scarti[g] - 1
+        carte = self.scarti[g, cima]
+        self.scarti[g, cima] = VUOTA
+        self.n_scarti[g] = cima
+        in_finale = azioni == AZIONE_SCARTI_FINALE
+        f = g[in_finale]
+        self.fondazioni[f, _SEME[carte[in_finale]]] += 1
+        self.punteggio[f] += 10
+        c = g[~in_finale]
+        a = azioni[~in_finale] - AZIONE_DAGLI_SCARTI
+        self.colonne[c, a, self.lunghezze[c, a]] = carte[~in_finale]
+        self.lunghezze[c, a] += 1
+        self.punteggio[c] += 5
+
+    def vittorie(self):
+        """Vettore di bool: le partite con tutte le carte nelle pile finali"""
+        return self.fondazioni.sum(axis=1) == NUM_CARTE
+
+    def motore(self, k):
+        """La partita k come Motore (senza cronologia), per giocarla o controllarla"""
+        motore = Motore.__new__(Motore)
+        motore.modalita = "normale"
+        motore.seme = int(self.seme[k])
+        motore.riciclo = self.riciclo
+        motore._stato_vuoto()
+        motore.colonne = [self.colonne[k, i, :self.lunghezze[k, i]].tolist() for i in range(7)]
+        motore.coperte = self.coperte[k].tolist()
+        motore.fondazioni = self.fondazioni[k].tolist()
+        motore.riserva = self.riserva[k, :self.n_riserva[k]].tolist()
+        motore.scarti = self.scarti[k, :self.n_scarti[k]].tolist()
+        motore.punteggio = int(self.punteggio[k])
+        motore.mosse = int(self.mosse[k])
+        motore.ricicli = int(self.ricicli[k])
+        return motore
+
+
+def azioni_casuali(maschera, rng):
+    """Un'azione legale a caso per ogni partita (-1 dove non ce ne sono)"""
+    punteggi = rng.random(maschera.shape) * maschera
+    azioni = punteggi.argmax(axis=1)
+    azioni[~maschera.any(axis=1)] = -1
+    return azioni
+
+
+def _differenze(motore, scalare):
+    campi = ("colonne", "coperte", "fondazioni", "riserva", "scarti", "punteggio", "mosse", "ricicli")
+    return [campo for campo in campi if getattr(motore, campo) != getattr(scalare, campo)]
+
+
+def verifica(partite=64, passi=400, seme=0, riciclo=RICICLO_MESCOLATO):
+    """Gioca le stesse mosse casuali con MotoreVettoriale e con Motore e confronta posizioni,
+    mosse legali ed esiti dopo ogni passo. Restituisce l'elenco delle differenze (vuoto se
+    i due motori sono d'accordo)."""
+    rng = np.random.default_rng(seme)
+    semi = rng.integers(0, 2 ** 32, partite)
+    vettoriale = MotoreVettoriale(semi, riciclo=riciclo)
+    scalari = [Motore(seme=int(s), riciclo=riciclo) for s in semi]
+    differenze = []
+    for passo in range(passi):
+        maschera = vettoriale.maschera_legali()
+        azioni = azioni_casuali(maschera, rng)
+        esiti = vettoriale.applica(azioni, maschera)
+        for k, scalare in enumerate(scalari):
+            legali = {INDICE_AZIONE[m] for m in scalare.mosse_legali()}
+            if legali != set(np.flatnonzero(maschera[k]).tolist()):
+                differenze.append(f"partita #{scalare.seme}, passo {passo}: mosse legali diverse")
+            if azioni[k] >= 0:
+                esito = scalare.applica(AZIONI[azioni[k]])
+                if esito != esiti[k]:
+                    differenze.append(f"partita #{scalare.seme}, passo {passo}: esito {esiti[k]} invece di {esito}")
+            campi = _differenze(vettoriale.motore(k), scalare)
+            if campi:
+                differenze.append(f"partita #{scalare.seme}, passo {passo}: diversi {', '.join(campi)}")
+        if differenze:
+            break
+    return differenze
+
+
+def velocita(partite, passi, seme=0):
+    """Passi al secondo (somma su tutte le partite) con azioni legali casuali"""
+    rng = np.random.default_rng(seme)
+    vettoriale = MotoreVettoriale(rng.integers(0, 2 ** 32, partite))
+    inizio = time.perf_counter()
+    for _ in range(passi):
+        maschera = vettoriale.maschera_legali()
+        vettoriale.applica(azioni_casuali(maschera, rng), maschera)
+    return partite * passi / (time.perf_counter() - inizio)
+
+
+def main(argomenti=None):
+    parser = argparse.ArgumentParser(description="Motore a lotti del solitario")
+    parser.add_argument("--verifica", action="store_true", help="confronta i risultati con il motore normale")
+    parser.add_argument("--partite", type=int, default=1024)
+    parser.add_argument("--passi", type=int, default=300)
+    parser.add_argument("--seme", type=int, default=0)
+    args = parser.parse_args(argomenti)
+
+    if args.verifica:
+        for riciclo in (RICICLO_MESCOLATO, "standard"):
+            differenze = verifica(min(args.partite, 256), args.passi, args.seme, riciclo)
+            for differenza in differenze[:10]:
+                print(differenza)
+            if differenze:
+                return 1
+            print(f"Riciclo {riciclo}: nessuna differenza con il motore normale.")
+        return 0
+    print(f"{velocita(args.partite, args.passi, args.seme):,.0f} passi/s su {args.partite} partite")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())